@@ -1,28 +1,189 @@
 import os
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import inspect
 import json
 import logging
 import re
-from datetime import datetime
-from flask import Flask, jsonify, render_template, request, send_file
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Request, Response, current_app, g, jsonify, render_template, request, send_file, stream_with_context
+from flask_limiter import Limiter
+from flask_limiter.errors import RateLimitExceeded
 from flask_restx import Api, Resource, fields
+from flask_restx.representations import output_json
+from prometheus_client import Counter, Gauge, Histogram
 from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
 from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+from itertools import islice
+from limits import parse_many
+from urllib.parse import quote, urlsplit
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import certifi
+import urllib3
 from minio import Minio
-from minio.error import S3Error
+from minio.commonconfig import CopySource
+from minio.datatypes import Part, PostPolicy
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error, ServerError
+from storage import MinioBackend, create_backend
+from keyindex import IndexMissing, KeyIndex
+from dedup import DedupBackend
+from jobs import STATES as JOB_STATES, JobQueue, JobStore
+from usage import UsageStats
+from ratelimit import ConcurrencyLimit, SQLiteStorage
+from compression import (ENCODINGS, UNCOMPRESSED_SIZE_HEADER, CompressingReader, CompressionPolicies,
+                         CompressionPolicy, decompressed)
+from tracing import (RequestIdFilter, SlowRequestProfiler, current_trace, end_trace, record_span,
+                     request_id_from, span, start_trace)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; every line carries the request ID so Loki can pull up a whole request
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s request_id=%(request_id)s %(message)s')
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(RequestIdFilter())
 logger = logging.getLogger(__name__)
 
+# Tracing: requests slower than TRACE_LOG_SLOW_MS log their span breakdown (0 = never).
+# PROFILE_SLOW_REQUESTS_MS > 0 also profiles them (PROFILER_MODE=sample|cprofile) for
+# /api/v1/admin/profiles, which needs the X-Admin-Token header to match ADMIN_TOKEN
+TRACE_LOG_SLOW_MS = float(os.getenv('TRACE_LOG_SLOW_MS', 1000))
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', 0))
+PROFILER_MODE = os.getenv('PROFILER_MODE', 'sample')
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', 5))
+PROFILER_KEEP = int(os.getenv('PROFILER_KEEP', 50))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Streaming uploads
+STREAM_UPLOAD_MAX_BYTES = int(os.getenv('STREAM_UPLOAD_MAX_BYTES', 0)) or None  # 0 = unlimited
+STREAM_UPLOAD_PART_SIZE = int(os.getenv('STREAM_UPLOAD_PART_SIZE', 16 * 1024 * 1024))
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+MULTIPART_MAX_PART_BYTES = int(os.getenv('MULTIPART_MAX_PART_BYTES', 128 * 1024 * 1024))
+MAX_PART_NUMBER = 10000
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+
+# Presigned transfers (see MINIO_PUBLIC_ENDPOINT)
+PRESIGN_DEFAULT_EXPIRY = int(os.getenv('PRESIGN_DEFAULT_EXPIRY', 3600))
+PRESIGN_MAX_EXPIRY = int(os.getenv('PRESIGN_MAX_EXPIRY', 7 * 24 * 3600))
+PRESIGN_MAX_UPLOAD_BYTES = int(os.getenv('PRESIGN_MAX_UPLOAD_BYTES', 5 * 1024 * 1024 * 1024))
+
+class S3Request(Request):
+    """Lets resources override MAX_CONTENT_LENGTH with a ``max_body_size`` attribute."""
+
+    @property
+    def max_content_length(self):
+        view = current_app.view_functions.get(self.endpoint) if self.endpoint else None
+        view_class = getattr(view, 'view_class', None)
+        if hasattr(view_class, 'max_body_size'):
+            return view_class.max_body_size
+        return super().max_content_length
+
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = S3Request
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['FLASK_ENV'] = os.getenv('FLASK_ENV', 'development')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
-# Prometheus metrics
-metrics = PrometheusMetrics(app)
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (gunicorn_config.py sets
+# it) every worker writes its samples there and /metrics reports all workers
+PROMETHEUS_MULTIPROC = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+metrics = GunicornInternalPrometheusMetrics(app) if PROMETHEUS_MULTIPROC else PrometheusMetrics(app)
+METRICS_REFRESH_INTERVAL = float(os.getenv('METRICS_REFRESH_INTERVAL', 5))
+
+cache_hits = Counter('s3_object_cache_hits_total', 'Object cache hits', ['kind'], registry=metrics.registry)
+cache_misses = Counter('s3_object_cache_misses_total', 'Object cache misses', ['kind'], registry=metrics.registry)
+cache_evictions = Counter('s3_object_cache_evictions_total', 'Object cache LRU evictions', registry=metrics.registry)
+cache_revalidations = Counter(
+    's3_object_cache_revalidations_total', 'Expired cache entries revalidated by ETag', ['result'],
+    registry=metrics.registry
+)
+cache_bytes = Gauge('s3_object_cache_body_bytes', 'Bytes of object bodies held in the cache',
+                    multiprocess_mode='livesum', registry=metrics.registry)
+
+# Per-operation storage metrics; METRICS_BUCKET_LABELS=false collapses the
+# bucket label to '*' when there are too many buckets for Prometheus
+METRICS_BUCKET_LABELS = os.getenv('METRICS_BUCKET_LABELS', 'true').lower() == 'true'
+backend_latency = Histogram(
+    's3_backend_operation_duration_seconds',
+    'Time spent in S3Client operations; for streamed results only the time spent producing items',
+    ['operation', 'bucket', 'status'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    registry=metrics.registry
+)
+bytes_uploaded = Counter('s3_bytes_uploaded_total', 'Object bytes received from clients', ['bucket'],
+                         registry=metrics.registry)
+bytes_downloaded = Counter('s3_bytes_downloaded_total', 'Object bytes sent to clients', ['bucket'],
+                           registry=metrics.registry)
+requests_in_flight = Gauge('s3_http_requests_in_flight', 'Requests currently being handled',
+                           multiprocess_mode='livesum', registry=metrics.registry)
+listing_entries = Histogram(
+    's3_listing_entries', 'Entries (keys and common prefixes) produced per listing', ['delimited'],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000, 1000000), registry=metrics.registry
+)
+
+def bucket_label(bucket_name):
+    return bucket_name if METRICS_BUCKET_LABELS and bucket_name else '*'
+
+class GaugeRefresher:
+    """Gauges whose value is computed by a function.
+
+    A single process computes them at scrape time. In multiprocess mode a
+    scrape only reads what workers have written, so each worker samples its
+    functions every ``interval`` seconds from a background thread instead.
+    """
+
+    def __init__(self, interval=METRICS_REFRESH_INTERVAL, multiprocess=PROMETHEUS_MULTIPROC):
+        self.interval = interval
+        self.multiprocess = multiprocess
+        self.gauges = []
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def gauge(self, name, documentation, fn, multiprocess_mode='livesum'):
+        gauge = Gauge(name, documentation, multiprocess_mode=multiprocess_mode, registry=metrics.registry)
+        if self.multiprocess:
+            self.gauges.append((name, gauge, fn))
+        else:
+            gauge.set_function(fn)
+        return gauge
+
+    def start(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if not self.gauges or self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='gauge-refresher', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        for name, gauge, fn in self.gauges:
+            try:
+                gauge.set(fn())
+            except Exception as e:
+                logger.error(f"Error refreshing gauge {name}: {e}")
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+computed_gauges = GaugeRefresher()
 
 # Flask-RESTX API documentation
 api = Api(
@@ -34,150 +195,1726 @@ api = Api(
     prefix='/api/v1'
 )
 
+@api.representation('application/json')
+def traced_output_json(data, code, headers=None):
+    with span('serialize'):
+        return output_json(data, code, headers)
+
 # Namespaces
 ns_buckets = api.namespace('buckets', description='Bucket operations')
 ns_health = api.namespace('health', description='Health checks')
 ns_upload = api.namespace('upload', description='File upload operations')
 ns_stats = api.namespace('stats', description='Usage statistics')
+ns_multipart = api.namespace('multipart', description='Parallel multipart uploads')
+ns_presign = api.namespace('presign', description='Presigned URLs for transfers straight to MinIO')
+ns_copy = api.namespace('copy', description='Server-side copies and prefix renames')
+ns_jobs = api.namespace('jobs', description='Background jobs for long-running bulk operations')
+ns_admin = api.namespace('admin', description='Diagnostics for operators (requires X-Admin-Token)')
 
 # API Models
 bucket_model = api.model('Bucket', {
     'bucket_name': fields.String(required=True, description='Bucket name', example='my-test-bucket')
 })
 
+multipart_model = api.model('MultipartUpload', {
+    'bucket': fields.String(required=True, description='Bucket name', example='my-test-bucket'),
+    'key': fields.String(required=True, description='Object key', example='artifacts/build.tar.gz'),
+    'content_type': fields.String(description='Content type of the final object')
+})
+
+presign_model = api.model('Presign', {
+    'bucket': fields.String(required=True, description='Bucket name', example='my-test-bucket'),
+    'key': fields.String(required=True, description='Object key', example='videos/big.mp4'),
+    'method': fields.String(description="'GET' to download or 'PUT' to upload", enum=['GET', 'PUT'], default='GET'),
+    'expires': fields.Integer(description='Lifetime in seconds', default=PRESIGN_DEFAULT_EXPIRY)
+})
+
+presign_post_model = api.model('PresignPost', {
+    'bucket': fields.String(required=True, description='Bucket name', example='my-test-bucket'),
+    'key': fields.String(description='Exact object key the form may write'),
+    'prefix': fields.String(description='Allow any key under this prefix instead', example='uploads/'),
+    'max_size': fields.Integer(description='Largest accepted file in bytes', default=PRESIGN_MAX_UPLOAD_BYTES),
+    'content_type': fields.String(description='Required Content-Type of the upload'),
+    'expires': fields.Integer(description='Lifetime in seconds', default=PRESIGN_DEFAULT_EXPIRY)
+})
+
+presign_complete_model = api.model('PresignComplete', {
+    'bucket': fields.String(required=True, description='Bucket name', example='my-test-bucket'),
+    'key': fields.String(required=True, description='Object key that was uploaded', example='videos/big.mp4')
+})
+
+compression_model = api.model('CompressionPolicy', {
+    'encoding': fields.String(description='Stored encoding', enum=list(ENCODINGS), default='gzip'),
+    'level': fields.Integer(description='Compression level (gzip 1-9, zstd 1-22)', default=6),
+    'min_size': fields.Integer(description='Smallest upload in bytes worth compressing', default=1024),
+    'content_types': fields.List(fields.String, description="MIME types to compress, e.g. 'text/*'")
+})
+
+bulk_delete_model = api.model('BulkDelete', {
+    'keys': fields.List(fields.String, description='Object keys to delete'),
+    'prefix': fields.String(description='Delete every object under this prefix instead', example='tmp/')
+})
+
+copy_model = api.model('Copy', {
+    'bucket': fields.String(required=True, description='Source bucket', example='my-test-bucket'),
+    'key': fields.String(required=True, description='Source key', example='reports/2024.csv'),
+    'dest_bucket': fields.String(description='Destination bucket (default: the source bucket)'),
+    'dest_key': fields.String(required=True, description='Destination key', example='archive/2024.csv')
+})
+
+copy_prefix_model = api.model('CopyPrefix', {
+    'bucket': fields.String(required=True, description='Source bucket', example='my-test-bucket'),
+    'prefix': fields.String(description='Copy every key under this prefix', example='reports/'),
+    'dest_bucket': fields.String(description='Destination bucket (default: the source bucket)'),
+    'dest_prefix': fields.String(description='Replaces prefix in the destination keys', example='archive/'),
+    'async': fields.Boolean(description='Run as a background job and answer 202 with the job', default=False)
+})
+
+job_model = api.model('JobRequest', {
+    'kind': fields.String(required=True, description='Operation to run', example='delete_prefix',
+                          enum=['delete_prefix', 'rescan_stats', 'copy_prefix', 'rename_prefix']),
+    'params': fields.Raw(description="Operation parameters, e.g. {\"bucket\": \"logs\", \"prefix\": \"2023/\"}")
+})
+
 bucket_response = api.model('BucketResponse', {
     'buckets': fields.List(fields.String, description='List of bucket names')
 })
 
+# Storage backend: 'minio' (external server) or an embedded engine ('filesystem', 'memory')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'minio').lower()
+STORAGE_PATH = os.getenv('STORAGE_PATH', '/data')
+STORAGE_FSYNC = os.getenv('STORAGE_FSYNC', 'false').lower() == 'true'
+# Fault injection for the memory engine (load and resilience testing)
+STORAGE_INJECT_LATENCY_MS = float(os.getenv('STORAGE_INJECT_LATENCY_MS', 0))
+STORAGE_INJECT_ERROR_RATE = float(os.getenv('STORAGE_INJECT_ERROR_RATE', 0))
+
+def storage_options(backend):
+    if backend == 'filesystem':
+        return {'fsync': STORAGE_FSYNC}
+    if backend == 'memory':
+        return {'latency': STORAGE_INJECT_LATENCY_MS / 1000, 'error_rate': STORAGE_INJECT_ERROR_RATE}
+    return {}
+
 # MinIO Configuration
 MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
 MINIO_ACCESS_KEY = os.getenv('MINIO_ROOT_USER', 'minioadmin')
 MINIO_SECRET_KEY = os.getenv('MINIO_ROOT_PASSWORD', 'minioadmin')
 SECURE = os.getenv('MINIO_SECURE', 'false').lower() == 'true'
 
+# Presigned URLs let clients move object bytes straight to MinIO. They are only
+# issued when MINIO_PUBLIC_ENDPOINT says where clients can reach it (e.g.
+# http://localhost:9000); the region is fixed so signing never needs a request
+MINIO_PUBLIC_ENDPOINT = os.getenv('MINIO_PUBLIC_ENDPOINT', '').rstrip('/')
+MINIO_REGION = os.getenv('MINIO_REGION', 'us-east-1')
+
+# MinIO HTTP connection pool
+MINIO_POOL_MAXSIZE = int(os.getenv('MINIO_POOL_MAXSIZE', 32))
+MINIO_POOL_BLOCK = os.getenv('MINIO_POOL_BLOCK', 'false').lower() == 'true'
+MINIO_TCP_KEEPALIVE = os.getenv('MINIO_TCP_KEEPALIVE', 'true').lower() == 'true'
+MINIO_CONNECT_TIMEOUT = float(os.getenv('MINIO_CONNECT_TIMEOUT', 5))
+MINIO_READ_TIMEOUT = float(os.getenv('MINIO_READ_TIMEOUT', 300))
+MINIO_MAX_RETRIES = int(os.getenv('MINIO_MAX_RETRIES', 3))
+MINIO_RETRY_BACKOFF = float(os.getenv('MINIO_RETRY_BACKOFF', 0.2))
+
+def build_http_client(maxsize=MINIO_POOL_MAXSIZE, block=MINIO_POOL_BLOCK):
+    """urllib3 pool shared by every thread of the worker for MinIO requests.
+
+    With ``block`` set, threads wait for a free connection instead of opening
+    throwaway connections once ``maxsize`` are in use.
+    """
+    socket_options = list(urllib3.connection.HTTPConnection.default_socket_options)
+    if MINIO_TCP_KEEPALIVE:
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    return urllib3.PoolManager(
+        maxsize=maxsize,
+        block=block,
+        timeout=urllib3.util.Timeout(connect=MINIO_CONNECT_TIMEOUT, read=MINIO_READ_TIMEOUT),
+        retries=urllib3.Retry(
+            total=MINIO_MAX_RETRIES,
+            backoff_factor=MINIO_RETRY_BACKOFF,
+            status_forcelist=[500, 502, 503, 504]
+        ),
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+        socket_options=socket_options
+    )
+
+# Health monitoring
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 10))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', 2))
+HEALTH_MAX_BACKOFF = float(os.getenv('HEALTH_MAX_BACKOFF', 60))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+class BackendUnavailable(Exception):
+    """Raised instead of calling MinIO while it is known to be unreachable."""
+
+class PresignUnsupported(Exception):
+    """Raised when clients cannot be sent to the storage backend directly."""
+
+def is_connection_error(e):
+    """True for failures that say something about MinIO's reachability, not the request."""
+    return isinstance(e, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError, ServerError))
+
+def is_unavailable(e):
+    """True when a call never got an answer from MinIO, including calls the breaker refused."""
+    return is_connection_error(e) or isinstance(e, BackendUnavailable)
+
+class CircuitBreaker:
+    """Fails MinIO calls fast after repeated connection errors.
+
+    Opens after ``failure_threshold`` consecutive connection failures, counting
+    the health monitor's failed probes. After ``reset_timeout`` it goes
+    half-open and lets a single trial call through (another one if that call
+    has not failed within ``reset_timeout``); a failure re-opens it, and a
+    trial call that reaches MinIO, a successful health probe or a reconnect
+    closes it.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trial_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'open' and now - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.trial_at = None
+            if self.state != 'half_open':
+                return self.state == 'closed'
+            if self.trial_at is not None and now - self.trial_at < self.reset_timeout:
+                return False
+            self.trial_at = now
+            return True
+
+    def retry_after(self):
+        if self.state != 'open':
+            return 0
+        return max(int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1, 1)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("MinIO circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.trip()
+
+    def trip(self):
+        if self.state != 'open':
+            logger.warning("MinIO circuit breaker opened")
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.trial_at = None
+
+class HealthMonitor:
+    """Probes MinIO in the background so health checks are answered from memory.
+
+    Hits MinIO's unauthenticated liveness endpoint with a short timeout every
+    ``interval`` seconds. While MinIO is down, probes back off exponentially up
+    to ``max_backoff``, but never past the breaker going half-open, and the
+    first successful probe reconnects the client.
+    """
+
+    def __init__(self, s3, interval=HEALTH_CHECK_INTERVAL, timeout=HEALTH_CHECK_TIMEOUT,
+                 max_backoff=HEALTH_MAX_BACKOFF):
+        self.s3 = s3
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.last_check_at = None
+        self.last_ok_at = None
+        self.last_error = None
+        self.latency = None
+        self.consecutive_failures = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            ok = self.probe()
+            if ok:
+                delay = self.interval
+            else:
+                delay = min(2 ** (self.consecutive_failures - 1), self.max_backoff,
+                            self.s3.breaker.retry_after() or self.max_backoff)
+            time.sleep(delay)
+
+    def probe(self):
+        started = time.monotonic()
+        try:
+            self.s3.ping(self.timeout)
+        except Exception as e:
+            self.last_check_at = time.time()
+            self.last_error = str(e)
+            self.consecutive_failures += 1
+            if self.s3.connected or self.consecutive_failures == 1:
+                logger.error(f"Storage health probe failed: {e}")
+            # A single lost probe is not an outage: it counts like any failed call
+            self.s3.breaker.record_failure()
+            if self.s3.breaker.state == 'open':
+                self.s3.connected = False
+            return False
+
+        self.latency = time.monotonic() - started
+        self.last_check_at = self.last_ok_at = time.time()
+        self.last_error = None
+        self.consecutive_failures = 0
+        if not self.s3.connected:
+            self.s3.connect()
+        if self.s3.connected:
+            self.s3.breaker.record_success()
+        return self.s3.connected
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            'minio_connected': self.s3.connected,
+            'circuit': self.s3.breaker.state,
+            'monitor_running': self.running,
+            'last_check_at': _isoformat(self.last_check_at),
+            'last_check_age_seconds': round(now - self.last_check_at, 3) if self.last_check_at else None,
+            'last_ok_at': _isoformat(self.last_ok_at),
+            'probe_latency_seconds': round(self.latency, 6) if self.latency is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error
+        }
+
+# Usage statistics, shared by every worker through a SQLite file under STATE_DIR
+STATS_RESCAN_INTERVAL = int(os.getenv('STATS_RESCAN_INTERVAL', 300))
+
+# Object metadata cache
+OBJECT_CACHE_MAX_ENTRIES = int(os.getenv('OBJECT_CACHE_MAX_ENTRIES', 10000))
+OBJECT_CACHE_MAX_BYTES = int(os.getenv('OBJECT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+OBJECT_CACHE_MAX_BODY_BYTES = int(os.getenv('OBJECT_CACHE_MAX_BODY_BYTES', 256 * 1024))
+OBJECT_CACHE_TTL = float(os.getenv('OBJECT_CACHE_TTL', 30))
+
+class CacheEntry:
+    __slots__ = ('info', 'body', 'expires_at')
+
+    def __init__(self, info, body, expires_at):
+        self.info = info
+        self.body = body
+        self.expires_at = expires_at
+
+class ObjectCache:
+    """In-process LRU of object stat results and small object bodies.
+
+    Entries expire after ``ttl`` seconds; an expired entry is kept so it can be
+    revalidated with a cheap stat and reused if the ETag has not changed.
+    Writes through this process invalidate entries immediately, writes through
+    other workers are picked up once the TTL runs out.
+    """
+
+    def __init__(self, max_entries=OBJECT_CACHE_MAX_ENTRIES, max_bytes=OBJECT_CACHE_MAX_BYTES,
+                 max_body_bytes=OBJECT_CACHE_MAX_BODY_BYTES, ttl=OBJECT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_body_bytes = max_body_bytes
+        self.ttl = ttl
+        self.body_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def lookup(self, bucket_name, object_name):
+        """Return (entry, fresh) or (None, False)."""
+        key = (bucket_name, object_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                cache_misses.labels('stat').inc()
+                return None, False
+            self._entries.move_to_end(key)
+        fresh = entry.expires_at > time.monotonic()
+        if fresh:
+            cache_hits.labels('stat').inc()
+        return entry, fresh
+
+    def store(self, bucket_name, object_name, info, body=None):
+        if not self.enabled:
+            return
+        if body is not None and len(body) > self.max_body_bytes:
+            body = None
+        key = (bucket_name, object_name)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(info, body, time.monotonic() + self.ttl)
+            if body is not None:
+                self.body_bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self.body_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                cache_evictions.inc()
+            cache_bytes.set(self.body_bytes)
+
+    def revalidate(self, bucket_name, object_name, entry, info):
+        """Reuse a stale entry (and its body) if the object's ETag is unchanged."""
+        if entry.info['etag'] == info['etag']:
+            cache_revalidations.labels('unchanged').inc()
+            self.store(bucket_name, object_name, info, entry.body)
+        else:
+            cache_revalidations.labels('changed').inc()
+            self.store(bucket_name, object_name, info)
+
+    def body(self, bucket_name, object_name, etag):
+        """Cached body of the entry if its ETag matches, else None.
+
+        Expiry is not checked: ``etag`` comes from a stat that head_object has
+        just made current, and a body with that ETag is the object's content
+        whether or not the entry's TTL has since run out.
+        """
+        with self._lock:
+            entry = self._entries.get((bucket_name, object_name))
+        if entry is not None and entry.body is not None and entry.info['etag'] == etag:
+            cache_hits.labels('body').inc()
+            return entry.body
+        cache_misses.labels('body').inc()
+        return None
+
+    def invalidate(self, bucket_name, object_name=None):
+        """Drop one key, or every key of a bucket when ``object_name`` is None."""
+        with self._lock:
+            if object_name is not None:
+                self._remove((bucket_name, object_name))
+            else:
+                for key in [k for k in self._entries if k[0] == bucket_name]:
+                    self._remove(key)
+            cache_bytes.set(self.body_bytes)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.body is not None:
+            self.body_bytes -= len(entry.body)
+
+# Object listing
+LIST_MAX_KEYS = 1000
+# Sorted key index answering listings without a backend scan; files under
+# STATE_DIR let every worker see the same index
+STATE_DIR = os.getenv('STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state'))
+KEY_INDEX_ENABLED = os.getenv('KEY_INDEX_ENABLED', 'false').lower() == 'true'
+KEY_INDEX_COMPACT_EVERY = int(os.getenv('KEY_INDEX_COMPACT_EVERY', 10000))
+# Content-addressed dedup: each distinct body is stored once in DEDUP_BUCKET and
+# keys become references, refcounted in a SQLite file under STATE_DIR
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'false').lower() == 'true'
+DEDUP_BUCKET = os.getenv('DEDUP_BUCKET', 's3sim-dedup-blobs')
+
+def encode_continuation_token(key):
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_continuation_token(token):
+    if not token:
+        return None
+    try:
+        return base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError, ValueError):
+        raise BadRequest('Invalid continuation-token')
+
+def _listing_entry(obj):
+    if obj.is_dir:
+        return {'prefix': obj.object_name}
+    return {
+        'name': obj.object_name,
+        'size': obj.size,
+        'last_modified': obj.last_modified.isoformat() if obj.last_modified else None
+    }
+
+class CountingReader:
+    """File-like wrapper that counts the bytes read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+class ClosingFile:
+    """File body that closes its Response when the server closes the file.
+
+    A file is sent with direct_passthrough so that the server can sendfile it,
+    and werkzeug then skips the Response's call_on_close callbacks; closing the
+    file runs them instead. Everything else, fileno included, is the file's.
+    """
+
+    def __init__(self, f):
+        self.file = f
+        self.response = None
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def close(self):
+        # Response.close closes its body, which comes back here once
+        response, self.response = self.response, None
+        self.file.close()
+        if response is not None:
+            response.close()
+
+# Bulk operations
+BULK_DELETE_BATCH_SIZE = 1000  # S3 multi-object delete limit
+BULK_DELETE_WORKERS = int(os.getenv('BULK_DELETE_WORKERS', 4))
+# Server-side copies of a prefix run COPY_WORKERS at a time
+COPY_WORKERS = int(os.getenv('COPY_WORKERS', 8))
+# Background jobs run on JOB_WORKERS threads in every worker process, outside any
+# request timeout; their state lives in a SQLite file under STATE_DIR
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_RATE_LIMIT = float(os.getenv('JOB_RATE_LIMIT', 500))  # object operations/s per process, 0 = unlimited
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 2))
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', 30))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETENTION_DAYS = float(os.getenv('JOB_RETENTION_DAYS', 7))
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+def instrumented(func):
+    """Observe an S3Client method in s3_backend_operation_duration_seconds.
+
+    Result dicts with an error count as failures. For generators only the
+    time spent inside the generator is measured, not the time the consumer
+    spends between items (e.g. writing a chunk to a slow client). A call that
+    was a half-open breaker's trial settles it once it returns.
+    """
+    operation = func.__name__
+    takes_bucket = list(inspect.signature(func).parameters)[1:2] == ['bucket_name']
+
+    def observe(args, kwargs, status, elapsed):
+        bucket = (args[0] if args else kwargs.get('bucket_name')) if takes_bucket else None
+        backend_latency.labels(operation, bucket_label(bucket), status).observe(elapsed)
+        record_span(f'backend.{operation}', elapsed)
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            gen = func(self, *args, **kwargs)
+            elapsed, status, reached = 0.0, 'ok', True
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                    except Exception as e:
+                        status, reached = 'error', not is_unavailable(e)
+                        raise
+                    finally:
+                        elapsed += time.perf_counter() - started
+                    yield item
+            finally:
+                gen.close()
+                observe(args, kwargs, status, elapsed)
+                self._settle_trial(reached)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        status, reached = 'error', False
+        try:
+            result = func(self, *args, **kwargs)
+            if not (isinstance(result, dict) and (result.get('success') is False or
+                                                  ('error' in result and 'success' not in result))):
+                status = 'ok'
+            reached = not (isinstance(result, dict) and result.get('unavailable'))
+            return result
+        except Exception as e:
+            reached = not is_unavailable(e)
+            raise
+        finally:
+            observe(args, kwargs, status, time.perf_counter() - started)
+            self._settle_trial(reached)
+    return wrapper
+
 # S3 Client wrapper using MinIO SDK
 class S3Client:
-    def __init__(self):
+    """Shared by all threads of a worker; the Minio client and its pool are thread-safe."""
+
+    def __init__(self, http_client=None, backend=STORAGE_BACKEND):
         self.client = None
+        self.backend = backend
         self.connected = False
-        self.connect()
+        self.http_client = http_client or build_http_client()
+        self.stats = UsageStats(os.path.join(STATE_DIR, 'usage.sqlite3'), STATS_RESCAN_INTERVAL)
+        self.cache = ObjectCache()
+        self.index = KeyIndex(os.path.join(STATE_DIR, 'index') if KEY_INDEX_ENABLED else None,
+                              KEY_INDEX_COMPACT_EVERY)
+        self.compression = CompressionPolicies(os.path.join(STATE_DIR, 'compression.json'))
+        self.jobs = JobQueue(JobStore(os.path.join(STATE_DIR, 'jobs.sqlite3')), JOB_WORKERS, JOB_RATE_LIMIT,
+                             JOB_HEARTBEAT_INTERVAL, JOB_STALE_AFTER, JOB_MAX_ATTEMPTS,
+                             retention=JOB_RETENTION_DAYS * 24 * 3600)
+        self.jobs.register('delete_prefix', self.run_delete_job, required=('bucket',))
+        self.jobs.register('rescan_stats', self.run_rescan_job)
+        self.jobs.register('copy_prefix', self.run_copy_job, required=('bucket', 'dest_bucket'))
+        self.jobs.register('rename_prefix', self.run_copy_job, required=('bucket', 'dest_prefix'))
+        self.breaker = CircuitBreaker()
+        self.health = HealthMonitor(self)
+        # Set on the thread a half-open breaker let through, until its call returns
+        self._trial = threading.local()
+        self._signer = None
+        self._connect_lock = threading.Lock()
+        # No connection yet: importing the app (in a preloading gunicorn master,
+        # say) must not block on the backend. The health monitor connects once
+        # started, or the first request does through _ensure_connected
 
     def connect(self):
-        try:
-            # Clean up endpoint for MinIO client (remove http:// or https://)
-            endpoint = MINIO_ENDPOINT.replace('http://', '').replace('https://', '')
-            
-            self.client = Minio(
-                endpoint,
-                access_key=MINIO_ACCESS_KEY,
-                secret_key=MINIO_SECRET_KEY,
-                secure=SECURE
-            )
-            # Test connection
-            self.client.list_buckets()
-            self.connected = True
-            logger.info(f"Successfully connected to MinIO at {endpoint}")
-        except Exception as e:
-            logger.error(f"Failed to connect to MinIO: {e}")
-            self.connected = False
+        with self._connect_lock:
+            # Another thread may have reconnected while we waited
+            if self.connected:
+                return
+            try:
+                if self.backend == 'minio':
+                    # Clean up endpoint for MinIO client (remove http:// or https://)
+                    endpoint = MINIO_ENDPOINT.replace('http://', '').replace('https://', '')
+
+                    self.client = MinioBackend(
+                        endpoint,
+                        access_key=MINIO_ACCESS_KEY,
+                        secret_key=MINIO_SECRET_KEY,
+                        secure=SECURE,
+                        http_client=self.http_client
+                    )
+                else:
+                    endpoint = STORAGE_PATH if self.backend == 'filesystem' else 'process memory'
+                    self.client = create_backend(self.backend, STORAGE_PATH, **storage_options(self.backend))
+                if DEDUP_ENABLED:
+                    self.client = DedupBackend(self.client, os.path.join(STATE_DIR, 'dedup.sqlite3'), DEDUP_BUCKET)
+                # Test connection
+                self.client.list_buckets()
+                self.connected = True
+                self.breaker.record_success()
+                logger.info(f"Successfully connected to {self.backend} storage at {endpoint}")
+                # Recount usage now that the backend can be listed: at startup, or after an outage
+                self.stats.request_rescan()
+            except Exception as e:
+                logger.error(f"Failed to connect to {self.backend} storage: {e}")
+                self.connected = False
 
+    def ping(self, timeout):
+        """Liveness check used by the health monitor; raises when the backend is down."""
+        if self.backend != 'minio':
+            if self.client is None:
+                self.connect()
+            if self.client is None:
+                raise ConnectionError(f'{self.backend} storage is not initialised')
+            self.client.ping()
+            return
+        scheme = 'https' if SECURE else 'http'
+        endpoint = MINIO_ENDPOINT.replace('http://', '').replace('https://', '')
+        response = self.http_client.request(
+            'GET', f'{scheme}://{endpoint}/minio/health/live',
+            timeout=urllib3.util.Timeout(total=timeout), retries=False
+        )
+        if response.status != 200:
+            raise ConnectionError(f'MinIO liveness returned HTTP {response.status}')
+
+    def _ensure_connected(self):
+        """Fail fast instead of blocking the request on an unreachable MinIO."""
+        if not self.breaker.allow():
+            raise BackendUnavailable('MinIO unavailable (circuit open)')
+        if self.breaker.state == 'half_open':
+            self._trial.pending = True
+        if self.connected:
+            return
+        # The health monitor owns reconnects; without it, reconnect inline
+        if not self.health.running:
+            self.connect()
+        if not self.connected:
+            raise BackendUnavailable('Not connected to MinIO')
+
+    def _settle_trial(self, reached):
+        """Close a half-open breaker once the trial call this thread made got an answer from MinIO."""
+        if getattr(self._trial, 'pending', False):
+            self._trial.pending = False
+            if reached:
+                self.breaker.record_success()
+
+    def _failure_details(self, e):
+        """Feed the circuit breaker and flag errors callers should answer with 503."""
+        if is_connection_error(e):
+            self.breaker.record_failure()
+            return {'unavailable': True}
+        if isinstance(e, BackendUnavailable):
+            return {'unavailable': True}
+        return {}
+
+    def pool_usage(self):
+        """Connection counts summed over the pool manager's host pools."""
+        usage = {'in_use': 0, 'idle': 0, 'maxsize': 0}
+        pools = self.http_client.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            queue = getattr(pool, 'pool', None)
+            if queue is None:
+                continue
+            available = list(queue.queue)
+            usage['maxsize'] += pool.pool.maxsize
+            usage['idle'] += sum(1 for conn in available if conn is not None)
+            usage['in_use'] += max(pool.pool.maxsize - len(available), 0)
+        return usage
+
+    @instrumented
     def list_buckets(self):
-        if not self.connected: self.connect()
-        if not self.connected: return {'error': 'Not connected to MinIO', 'buckets': []}
-        
         try:
+            self._ensure_connected()
             buckets = self.client.list_buckets()
             return {'buckets': [b.name for b in buckets], 'mode': 'live'}
         except Exception as e:
             logger.error(f"Error listing buckets: {e}")
-            return {'error': str(e), 'buckets': []}
+            return {'error': str(e), 'buckets': [], **self._failure_details(e)}
 
+    @instrumented
     def create_bucket(self, bucket_name):
-        if not self.connected: self.connect()
-        if not self.connected: return {'success': False, 'error': 'Not connected to MinIO'}
-
         try:
+            self._ensure_connected()
             if not self.client.bucket_exists(bucket_name):
                 self.client.make_bucket(bucket_name)
+                self.stats.record_bucket_created(bucket_name)
+                if self.index.enabled:
+                    self.index.create(bucket_name)
                 return {'success': True, 'bucket': bucket_name}
             return {'success': False, 'error': 'Bucket already exists'}
         except Exception as e:
             logger.error(f"Error creating bucket {bucket_name}: {e}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
 
+    @instrumented
     def delete_bucket(self, bucket_name):
-        if not self.connected: self.connect()
-        
         try:
+            self._ensure_connected()
             self.client.remove_bucket(bucket_name)
+            self.stats.record_bucket_deleted(bucket_name)
+            self.cache.invalidate(bucket_name)
+            if self.index.enabled:
+                self.index.drop(bucket_name)
             return {'success': True, 'bucket': bucket_name}
         except Exception as e:
             logger.error(f"Error deleting bucket {bucket_name}: {e}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    def _delete_batch(self, bucket_name, batch):
+        """Delete up to 1000 (key, size) pairs with one multi-object delete request."""
+        errors = {
+            err.name: err
+            for err in self.client.remove_objects(bucket_name, [DeleteObject(key) for key, _ in batch])
+        }
+        results = []
+        for key, size in batch:
+            err = errors.get(key)
+            if err is not None:
+                results.append({'key': key, 'deleted': False, 'error': f'{err.code}: {err.message}'})
+                continue
+            self.cache.invalidate(bucket_name, key)
+            # Listed keys come without a size and may never have existed; the rescan counts them
+            if size is not None:
+                self.stats.record_delete(bucket_name, size)
+            results.append({'key': key, 'deleted': True})
+        self.index.record_deletes(bucket_name, [r['key'] for r in results if r['deleted']])
+        return results
+
+    @instrumented
+    def iter_delete(self, bucket_name, keys=None, prefix=None, workers=1, throttle=None):
+        """Delete a list of keys or everything under a prefix, yielding per-key results.
+
+        Keys are sent in batches of 1000; with ``workers`` > 1 batches run in
+        parallel with at most two batches per worker in flight, so memory stays
+        bounded while the listing is consumed. ``throttle(n)`` is called before
+        each batch of n deletes is sent.
+        """
+        self._ensure_connected()
+
+        if keys is not None:
+            entries = ((key, None) for key in keys)
+        else:
+            objects = self.client.list_objects(bucket_name, prefix=prefix or None, recursive=True)
+            entries = ((obj.object_name, obj.size) for obj in objects)
+        batches = batched(entries, BULK_DELETE_BATCH_SIZE)
+        if throttle is not None:
+            batches = (throttle(len(batch)) or batch for batch in batches)
 
-    def list_objects(self, bucket_name):
-        if not self.connected: self.connect()
-        
         try:
-            objects = self.client.list_objects(bucket_name)
-            obj_list = []
-            for obj in objects:
-                obj_list.append({
-                    'name': obj.object_name,
-                    'size': obj.size,
-                    'last_modified': obj.last_modified.isoformat() if obj.last_modified else None
-                })
-            return {'objects': obj_list, 'bucket': bucket_name}
+            if workers <= 1:
+                for batch in batches:
+                    yield from self._delete_batch(bucket_name, batch)
+                return
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for batch in batches:
+                    pending.add(pool.submit(self._delete_batch, bucket_name, batch))
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield from future.result()
+                for future in as_completed(pending):
+                    yield from future.result()
+        finally:
+            # Sizes of explicitly listed keys are unknown, so byte totals need a rescan
+            if keys is not None:
+                self.stats.request_rescan()
+
+    @instrumented
+    def force_delete_bucket(self, bucket_name, workers=BULK_DELETE_WORKERS):
+        """Empty a bucket with parallel multi-object deletes, then remove it."""
+        try:
+            deleted = failed = 0
+            for result in self.iter_delete(bucket_name, prefix='', workers=workers):
+                if result['deleted']:
+                    deleted += 1
+                else:
+                    failed += 1
+            if failed:
+                return {'success': False, 'error': f'{failed} objects could not be deleted',
+                        'objects_deleted': deleted}
+        except Exception as e:
+            logger.error(f"Error emptying bucket {bucket_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+        result = self.delete_bucket(bucket_name)
+        result['objects_deleted'] = deleted
+        return result
+
+    def run_delete_job(self, ctx):
+        """Job: delete everything under ``prefix`` in ``bucket``, then the bucket if ``remove_bucket``."""
+        bucket_name = ctx.params['bucket']
+        for result in self.iter_delete(bucket_name, prefix=ctx.params.get('prefix') or '',
+                                       workers=BULK_DELETE_WORKERS, throttle=ctx.throttle):
+            ctx.advance(**({'deleted': 1} if result['deleted'] else {'errors': 1}))
+        deleted, failed = ctx.progress.get('deleted', 0), ctx.progress.get('errors', 0)
+        if failed:
+            raise RuntimeError(f'{failed} objects could not be deleted')
+        if ctx.params.get('remove_bucket'):
+            result = self.delete_bucket(bucket_name)
+            if not result['success']:
+                raise RuntimeError(result['error'])
+        return {'objects_deleted': deleted, 'bucket_removed': bool(ctx.params.get('remove_bucket'))}
+
+    def run_rescan_job(self, ctx):
+        """Job: recount every bucket now instead of waiting for the background rescan."""
+        def scan():
+            return self.scan_usage(progress=lambda obj: ctx.advance(objects=1, bytes=obj.size or 0))
+
+        # Waits for a background rescan in another worker rather than racing it
+        buckets = self.stats.rescan(scan, wait=True)
+        return {'buckets': len(buckets), 'objects': ctx.progress.get('objects', 0),
+                'bytes': ctx.progress.get('bytes', 0)}
+
+    def _ensure_index(self, bucket_name):
+        self.index.ensure(bucket_name, lambda: self.client.list_objects(bucket_name, recursive=True))
+
+    @instrumented
+    def iter_objects(self, bucket_name, prefix=None, delimiter='/', start_after=None, end_before=None):
+        """Yield listing entries lazily, one MinIO page (or index page) at a time.
+
+        Keys sort before ``end_before`` when it is given.
+        """
+        produced = 0
+        try:
+            for entry in self._iter_listing(bucket_name, prefix, delimiter, start_after, end_before):
+                produced += 1
+                yield entry
+        finally:
+            listing_entries.labels('true' if delimiter else 'false').observe(produced)
+
+    def _iter_listing(self, bucket_name, prefix, delimiter, start_after, end_before):
+        self._ensure_connected()
+
+        if self.index.enabled:
+            self._ensure_index(bucket_name)
+            try:
+                for entry in self.index.entries(bucket_name, prefix, delimiter, start_after, end_before):
+                    yield entry
+                    start_after = entry.get('name') or entry['prefix']
+                return
+            except IndexMissing:
+                # Dropped by a failed journal write or a bucket deletion in another
+                # worker: finish from the backend, after what was already returned
+                logger.warning(f"Key index for {bucket_name} is gone, listing the backend")
+
+        yield from self._backend_listing(bucket_name, prefix, delimiter, start_after, end_before)
+
+    def _backend_listing(self, bucket_name, prefix, delimiter, start_after, end_before):
+        objects = self.client.list_objects(
+            bucket_name,
+            prefix=prefix or None,
+            recursive=not delimiter,
+            start_after=start_after or None
+        )
+        for obj in objects:
+            # A common prefix equal to the token was already returned on the previous page
+            if start_after and obj.object_name <= start_after:
+                continue
+            if end_before is not None and obj.object_name >= end_before:
+                return
+            yield _listing_entry(obj)
+
+    @instrumented
+    def count_objects(self, bucket_name, prefix=None, start_after=None, end_before=None):
+        """Number of keys under a prefix; two bisections with the index, a full scan without."""
+        try:
+            self._ensure_connected()
+            indexed = self.index.enabled
+            if indexed:
+                self._ensure_index(bucket_name)
+                try:
+                    count = self.index.count(bucket_name, prefix or '', start_after, end_before)
+                except IndexMissing:
+                    indexed = False
+            if not indexed:
+                count = sum(1 for _ in self.iter_objects(bucket_name, prefix, '', start_after, end_before))
+            return {'success': True, 'bucket': bucket_name, 'prefix': prefix or '', 'key_count': count,
+                    'indexed': indexed}
+        except Exception as e:
+            logger.error(f"Error counting objects in {bucket_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def list_objects(self, bucket_name, prefix=None, delimiter='/', max_keys=LIST_MAX_KEYS,
+                     continuation_token=None, start_after=None, end_before=None):
+        try:
+            token = decode_continuation_token(continuation_token)
+            start_after = max(filter(None, (token, start_after)), default=None)
+            entries = list(islice(
+                self.iter_objects(bucket_name, prefix, delimiter, start_after, end_before),
+                max_keys + 1
+            ))
+            is_truncated = len(entries) > max_keys
+            entries = entries[:max_keys]
+
+            obj_list = [e for e in entries if 'prefix' not in e]
+            prefixes = [e['prefix'] for e in entries if 'prefix' in e]
+            next_token = None
+            if is_truncated and entries:
+                last = entries[-1]
+                next_token = encode_continuation_token(last.get('name') or last.get('prefix'))
+
+            return {
+                'objects': obj_list,
+                'common_prefixes': prefixes,
+                'bucket': bucket_name,
+                'prefix': prefix or '',
+                'delimiter': delimiter,
+                'max_keys': max_keys,
+                'key_count': len(entries),
+                'is_truncated': is_truncated,
+                'next_continuation_token': next_token
+            }
         except Exception as e:
             logger.error(f"Error listing objects in {bucket_name}: {e}")
-            return {'error': str(e), 'objects': []}
+            return {'error': str(e), 'objects': [], **self._failure_details(e)}
+
+    def _compressed_body(self, bucket_name, stream, length, content_type):
+        """(body, length, metadata) to store, compressed if the bucket's policy covers this upload."""
+        policy = self.compression.get(bucket_name)
+        if policy is None or not policy.applies(content_type, length):
+            return stream, length, None
+        metadata = {'Content-Encoding': policy.encoding}
+        if length is not None:
+            metadata[UNCOMPRESSED_SIZE_HEADER] = str(length)
+        return CompressingReader(stream, policy.encoding, policy.level), None, metadata
 
-    def upload_file(self, bucket_name, file_obj, object_name, length):
-        if not self.connected: self.connect()
-        
+    @instrumented
+    def upload_file(self, bucket_name, file_obj, object_name, length, content_type='application/octet-stream'):
         try:
+            self._ensure_connected()
             # Ensure bucket exists
             if not self.client.bucket_exists(bucket_name):
                 self.client.make_bucket(bucket_name)
-            
+                self.stats.record_bucket_created(bucket_name)
+
+            body, stored_length, metadata = self._compressed_body(bucket_name, file_obj, length, content_type)
             self.client.put_object(
                 bucket_name,
                 object_name,
-                file_obj,
-                length
+                body,
+                -1 if stored_length is None else stored_length,
+                content_type=content_type,
+                metadata=metadata,
+                part_size=0 if stored_length is not None else STREAM_UPLOAD_PART_SIZE
             )
-            return {'success': True, 'bucket': bucket_name, 'object': object_name}
+            stored = body.bytes_written if metadata else length
+            self.cache.invalidate(bucket_name, object_name)
+            self.stats.record_upload(bucket_name, stored)
+            bytes_uploaded.labels(bucket_label(bucket_name)).inc(length)
+            self.index.record_put(bucket_name, object_name, stored, time.time())
+            result = {'success': True, 'bucket': bucket_name, 'object': object_name}
+            if metadata:
+                result.update(content_encoding=metadata['Content-Encoding'], stored_size=stored)
+            return result
         except Exception as e:
             logger.error(f"Error uploading file: {e}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
 
-    def get_stats(self):
-        if not self.connected: self.connect()
-        
+    @instrumented
+    def scan_usage(self, progress=None):
+        """Full listing of every bucket, calling ``progress(obj)`` per object if given.
+
+        Only run by the background reconciler and the rescan_stats job.
+        """
+        self._ensure_connected()
+
+        buckets = {}
+        for b in self.client.list_buckets():
+            totals = {'objects': 0, 'bytes': 0}
+            for obj in self.client.list_objects(b.name, recursive=True):
+                totals['objects'] += 1
+                totals['bytes'] += obj.size or 0
+                if progress is not None:
+                    progress(obj)
+            buckets[b.name] = totals
+        return buckets
+
+    def start_background_tasks(self):
+        self.health.start()
+        self.stats.start(self.scan_usage)
+        self.jobs.start()
+
+    @instrumented
+    def upload_stream(self, bucket_name, stream, object_name, length=None,
+                      part_size=None, content_type='application/octet-stream'):
+        """Pipe a file-like body into MinIO one part at a time.
+
+        Memory use is bounded by ``part_size`` regardless of object size. When
+        ``length`` is unknown (chunked request) MinIO needs an explicit part size.
+        """
+        reader = CountingReader(stream)
+        started = time.monotonic()
         try:
-            buckets = self.client.list_buckets()
-            total_buckets = len(buckets)
-            total_objects = 0
-            total_size = 0
-            
-            for b in buckets:
-                objects = self.client.list_objects(b.name, recursive=True)
-                for obj in objects:
-                    total_objects += 1
-                    total_size += obj.size
-            
+            self._ensure_connected()
+            if not self.client.bucket_exists(bucket_name):
+                self.client.make_bucket(bucket_name)
+                self.stats.record_bucket_created(bucket_name)
+
+            body, length, metadata = self._compressed_body(bucket_name, reader, length, content_type)
+            if length is None:
+                length, part_size = -1, part_size or STREAM_UPLOAD_PART_SIZE
+            result = self.client.put_object(
+                bucket_name,
+                object_name,
+                body,
+                length,
+                content_type=content_type,
+                metadata=metadata,
+                part_size=part_size or 0
+            )
+            stored = body.bytes_written if metadata else reader.bytes_read
+            self.cache.invalidate(bucket_name, object_name)
+            elapsed = time.monotonic() - started
+            throughput = reader.bytes_read / elapsed if elapsed > 0 else None
+            self.stats.record_upload(bucket_name, stored)
+            bytes_uploaded.labels(bucket_label(bucket_name)).inc(reader.bytes_read)
+            self.index.record_put(bucket_name, object_name, stored, time.time())
+            logger.info(
+                f"Streamed {reader.bytes_read} bytes to {bucket_name}/{object_name} "
+                f"in {elapsed:.3f}s ({(throughput or 0) / 1024 / 1024:.2f} MiB/s)"
+            )
+            return {
+                'success': True,
+                'bucket': bucket_name,
+                'object': object_name,
+                'etag': result.etag,
+                'size': reader.bytes_read,
+                'elapsed_seconds': round(elapsed, 6),
+                'throughput_bytes_per_sec': round(throughput) if throughput else None,
+                **({'content_encoding': metadata['Content-Encoding'], 'stored_size': stored} if metadata else {})
+            }
+        except Exception as e:
+            logger.error(f"Error streaming upload to {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def create_multipart_upload(self, bucket_name, object_name, content_type=None):
+        try:
+            self._ensure_connected()
+            if not self.client.bucket_exists(bucket_name):
+                self.client.make_bucket(bucket_name)
+                self.stats.record_bucket_created(bucket_name)
+
+            upload_id = self.client.create_multipart_upload(
+                bucket_name, object_name, {'Content-Type': content_type or 'application/octet-stream'}
+            )
+            return {'success': True, 'bucket': bucket_name, 'object': object_name, 'upload_id': upload_id}
+        except Exception as e:
+            logger.error(f"Error initiating multipart upload for {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def upload_part(self, bucket_name, object_name, upload_id, part_number, data):
+        """Upload one part; parts are independent so they can arrive on any worker."""
+        try:
+            self._ensure_connected()
+            etag = self.client.upload_part(bucket_name, object_name, data, None, upload_id, part_number)
+            bytes_uploaded.labels(bucket_label(bucket_name)).inc(len(data))
+            return {'success': True, 'part_number': part_number, 'etag': etag, 'size': len(data)}
+        except Exception as e:
+            logger.error(f"Error uploading part {part_number} of {upload_id}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    def _iter_parts(self, bucket_name, object_name, upload_id):
+        marker = None
+        while True:
+            result = self.client.list_parts(bucket_name, object_name, upload_id, part_number_marker=marker)
+            for part in result.parts:
+                yield {'part_number': int(part.part_number), 'etag': part.etag, 'size': part.size}
+            if not result.is_truncated:
+                return
+            marker = result.next_part_number_marker
+
+    @instrumented
+    def list_parts(self, bucket_name, object_name, upload_id):
+        try:
+            self._ensure_connected()
+            parts = list(self._iter_parts(bucket_name, object_name, upload_id))
+            return {'success': True, 'upload_id': upload_id, 'parts': parts}
+        except Exception as e:
+            logger.error(f"Error listing parts of {upload_id}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, part_numbers=None):
+        """Assemble the stored parts, optionally restricted to ``part_numbers``."""
+        try:
+            self._ensure_connected()
+            parts = list(self._iter_parts(bucket_name, object_name, upload_id))
+            if part_numbers is not None:
+                wanted = set(part_numbers)
+                missing = wanted - {p['part_number'] for p in parts}
+                if missing:
+                    return {'success': False, 'error': f'Missing parts: {sorted(missing)}'}
+                parts = [p for p in parts if p['part_number'] in wanted]
+            if not parts:
+                return {'success': False, 'error': 'No parts uploaded'}
+
+            parts.sort(key=lambda p: p['part_number'])
+            result = self.client.complete_multipart_upload(
+                bucket_name, object_name, upload_id,
+                [Part(p['part_number'], p['etag']) for p in parts]
+            )
+            size = sum(p['size'] or 0 for p in parts)
+            self.cache.invalidate(bucket_name, object_name)
+            self.stats.record_upload(bucket_name, size)
+            self.index.record_put(bucket_name, object_name, size, time.time())
+            return {
+                'success': True,
+                'bucket': bucket_name,
+                'object': object_name,
+                'etag': result.etag,
+                'parts': len(parts),
+                'size': size
+            }
+        except Exception as e:
+            logger.error(f"Error completing multipart upload {upload_id}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        try:
+            self._ensure_connected()
+            self.client.abort_multipart_upload(bucket_name, object_name, upload_id)
+            return {'success': True, 'upload_id': upload_id}
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload {upload_id}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def head_object(self, bucket_name, object_name):
+        """Object metadata; raises S3Error so callers can map NoSuchKey to 404."""
+        entry, fresh = self.cache.lookup(bucket_name, object_name)
+        if fresh:
+            return entry.info
+
+        self._ensure_connected()
+        stat = self.client.stat_object(bucket_name, object_name)
+        metadata = {k.lower(): v for k, v in (stat.metadata or {}).items()}
+        uncompressed_size = metadata.get(UNCOMPRESSED_SIZE_HEADER.lower())
+        info = {
+            'size': stat.size,
+            'etag': stat.etag,
+            'last_modified': stat.last_modified,
+            'content_type': stat.content_type or 'application/octet-stream',
+            'content_encoding': metadata.get('content-encoding'),
+            'uncompressed_size': int(uncompressed_size) if uncompressed_size else None
+        }
+        if entry is not None:
+            self.cache.revalidate(bucket_name, object_name, entry, info)
+        else:
+            self.cache.store(bucket_name, object_name, info)
+        return info
+
+    @instrumented
+    def iter_object(self, bucket_name, object_name, offset=0, length=0, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                    info=None):
+        """Yield an object (or one byte range of it) in chunks without buffering it.
+
+        Pass the ``info`` from head_object to serve small objects from the cache.
+        """
+        sent = 0
+        try:
+            for chunk in self._iter_object_chunks(bucket_name, object_name, offset, length, chunk_size, info):
+                sent += len(chunk)
+                yield chunk
+        finally:
+            bytes_downloaded.labels(bucket_label(bucket_name)).inc(sent)
+
+    def _iter_object_chunks(self, bucket_name, object_name, offset, length, chunk_size, info):
+        if info is not None and info['size'] <= self.cache.max_body_bytes:
+            body = self.cache.body(bucket_name, object_name, info['etag'])
+            if body is None:
+                body = self._read_small_object(bucket_name, object_name, info)
+            if body is not None:
+                view = memoryview(body)[offset:offset + length if length else None]
+                for start in range(0, len(view), chunk_size):
+                    yield bytes(view[start:start + chunk_size])
+                return
+
+        self._ensure_connected()
+        response = self.client.get_object(bucket_name, object_name, offset=offset, length=length)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
+    @instrumented
+    def open_object_file(self, bucket_name, object_name, info):
+        """Open the stored file of a whole object for wsgi.file_wrapper (sendfile).
+
+        Returns None when the backend has no local files, or when the object
+        is small enough to be served from the body cache instead.
+        """
+        open_file = getattr(self.client, 'open_file', None)
+        if not callable(open_file) or self.backend == 'minio' or info['size'] <= self.cache.max_body_bytes:
+            return None
+        self._ensure_connected()
+        f = open_file(bucket_name, object_name)
+        # Replaced since the stat: let iter_object serve it rather than send a wrong length
+        if os.fstat(f.fileno()).st_size != info['size']:
+            f.close()
+            return None
+        bytes_downloaded.labels(bucket_label(bucket_name)).inc(info['size'])
+        return f
+
+    def _read_small_object(self, bucket_name, object_name, info):
+        if not self.cache.enabled:
+            return None
+        self._ensure_connected()
+        response = self.client.get_object(bucket_name, object_name)
+        try:
+            body = response.read()
+            etag = (response.headers.get('ETag') or '').strip('"')
+        finally:
+            response.close()
+            response.release_conn()
+        # Only cache the body if it is the version the caller validated
+        if etag == info['etag']:
+            self.cache.store(bucket_name, object_name, info, body)
+        return body
+
+    @instrumented
+    def delete_object(self, bucket_name, object_name, size=None):
+        """Delete one object; pass its stored ``size`` when already known to skip the stat."""
+        try:
+            self._ensure_connected()
+            if size is None:
+                size = self.head_object(bucket_name, object_name)['size']
+            self.client.remove_object(bucket_name, object_name)
+            self.cache.invalidate(bucket_name, object_name)
+            self.stats.record_delete(bucket_name, size)
+            self.index.record_deletes(bucket_name, [object_name])
+            return {'success': True, 'bucket': bucket_name, 'object': object_name}
+        except Exception as e:
+            logger.error(f"Error deleting {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    def _copy(self, bucket_name, object_name, dest_bucket, dest_object):
+        """One server-side copy into an existing bucket; returns the copied (stored) size."""
+        stat = self.client.stat_object(bucket_name, object_name)
+        # Sources over 5 GiB are copied with a multipart compose, which does not
+        # carry metadata over by itself; smaller copies keep the source's as is
+        metadata = {k: v for k, v in (stat.metadata or {}).items()
+                    if k.lower().startswith('x-amz-meta-') or k.lower() == 'content-encoding'}
+        metadata['Content-Type'] = stat.content_type or 'application/octet-stream'
+        self.client.copy_object(dest_bucket, dest_object, CopySource(bucket_name, object_name),
+                                metadata=metadata if stat.size > MAX_PART_SIZE else None)
+        self.cache.invalidate(dest_bucket, dest_object)
+        self.stats.record_upload(dest_bucket, stat.size)
+        self.index.record_put(dest_bucket, dest_object, stat.size, time.time())
+        return stat.size
+
+    def _ensure_bucket_for_copy(self, bucket_name):
+        if not self.client.bucket_exists(bucket_name):
+            self.client.make_bucket(bucket_name)
+            self.stats.record_bucket_created(bucket_name)
+
+    @instrumented
+    def copy_object(self, bucket_name, object_name, dest_bucket, dest_object):
+        """Copy an object inside the storage backend; its bytes never pass through this process."""
+        if (bucket_name, object_name) == (dest_bucket, dest_object):
+            return {'success': False, 'error': 'Source and destination are the same object'}
+        try:
+            self._ensure_connected()
+            self._ensure_bucket_for_copy(dest_bucket)
+            size = self._copy(bucket_name, object_name, dest_bucket, dest_object)
+            return {'success': True, 'bucket': dest_bucket, 'object': dest_object, 'size': size}
+        except Exception as e:
+            logger.error(f"Error copying {bucket_name}/{object_name} to {dest_bucket}/{dest_object}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @staticmethod
+    def check_copy_prefix(bucket_name, prefix, dest_bucket, dest_prefix):
+        """ValueError for a prefix copy that would never finish or copy keys onto themselves."""
+        if bucket_name == dest_bucket and (dest_prefix.startswith(prefix) or prefix.startswith(dest_prefix)):
+            # Copies could land under the prefix being listed and be copied again,
+            # or overwrite sources that have not been copied yet
+            raise ValueError('prefix and dest_prefix must not overlap when copying within one bucket')
+
+    @instrumented
+    def iter_copy(self, bucket_name, prefix, dest_bucket, dest_prefix, move=False, workers=COPY_WORKERS,
+                  throttle=None):
+        """Copy every key under ``prefix`` to ``dest_prefix`` + the rest of the key, yielding per-key results.
+
+        Copies run server-side on a pool of ``workers`` threads with at most
+        two per worker in flight, so memory stays bounded however many keys
+        the prefix holds. With ``move`` the sources of successful copies are
+        then removed with batched multi-object deletes. ``throttle(n)`` is
+        called before every n storage operations.
+        """
+        prefix, dest_prefix = prefix or '', dest_prefix or ''
+        self.check_copy_prefix(bucket_name, prefix, dest_bucket, dest_prefix)
+        self._ensure_connected()
+        self._ensure_bucket_for_copy(dest_bucket)
+        objects = self.client.list_objects(bucket_name, prefix=prefix or None, recursive=True)
+        copied = []
+
+        def copy(key):
+            dest = dest_prefix + key[len(prefix):]
+            try:
+                return {'key': key, 'dest': dest, 'copied': True,
+                        'size': self._copy(bucket_name, key, dest_bucket, dest)}
+            except Exception as e:
+                self._failure_details(e)
+                return {'key': key, 'dest': dest, 'copied': False, 'error': str(e)}
+
+        def finish(result):
+            if not move or not result['copied']:
+                return [result]
+            copied.append(result)
+            return flush() if len(copied) >= BULK_DELETE_BATCH_SIZE else []
+
+        def flush():
+            batch = copied[:]
+            del copied[:]
+            if not batch:
+                return []
+            if throttle is not None:
+                throttle(len(batch))
+            deleted = {r['key']: r for r in self._delete_batch(bucket_name, [(r['key'], r['size']) for r in batch])}
+            for result in batch:
+                outcome = deleted[result['key']]
+                result['deleted'] = outcome['deleted']
+                if not outcome['deleted']:
+                    result['error'] = outcome['error']
+            return batch
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            pending = set()
+            for obj in objects:
+                if throttle is not None:
+                    throttle(1)
+                pending.add(pool.submit(copy, obj.object_name))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from finish(future.result())
+            for future in as_completed(pending):
+                yield from finish(future.result())
+        yield from flush()
+
+    def run_copy_job(self, ctx):
+        """Job: copy_prefix, or rename_prefix (copy then delete the sources), with progress counters."""
+        params, move = ctx.params, ctx.kind == 'rename_prefix'
+        for result in self.iter_copy(params['bucket'], params.get('prefix'),
+                                     params.get('dest_bucket') or params['bucket'], params.get('dest_prefix'),
+                                     move=move, throttle=ctx.throttle):
+            if result['copied'] and result.get('deleted', True):
+                ctx.advance(copied=1, bytes=result['size'])
+            else:
+                ctx.advance(errors=1)
+        if ctx.progress.get('errors'):
+            raise RuntimeError(f"{ctx.progress['errors']} objects could not be {'moved' if move else 'copied'}")
+        return {'objects': ctx.progress.get('copied', 0), 'bytes': ctx.progress.get('bytes', 0)}
+
+    def _presigner(self):
+        """A Minio client for the public endpoint, only ever used to sign URLs offline."""
+        if self.backend != 'minio' or not MINIO_PUBLIC_ENDPOINT:
+            raise PresignUnsupported('Presigned URLs need the MinIO backend and MINIO_PUBLIC_ENDPOINT')
+        if self._signer is None:
+            public = urlsplit(MINIO_PUBLIC_ENDPOINT)
+            self._signer = Minio(
+                public.netloc,
+                access_key=MINIO_ACCESS_KEY,
+                secret_key=MINIO_SECRET_KEY,
+                secure=public.scheme == 'https',
+                region=MINIO_REGION,
+                http_client=self.http_client
+            )
+        return self._signer
+
+    def _ensure_bucket(self, bucket_name):
+        self._ensure_connected()
+        if not self.client.bucket_exists(bucket_name):
+            self.client.make_bucket(bucket_name)
+            self.stats.record_bucket_created(bucket_name)
+
+    @instrumented
+    def presign_object(self, bucket_name, object_name, method='GET', expires=PRESIGN_DEFAULT_EXPIRY,
+                       download_name=None):
+        """A URL that GETs or PUTs the object directly on MinIO until it expires."""
+        try:
+            signer = self._presigner()
+            if method == 'PUT':
+                self._ensure_bucket(bucket_name)
+                url = signer.presigned_put_object(bucket_name, object_name, expires=timedelta(seconds=expires))
+            else:
+                headers = None
+                if download_name:
+                    headers = {'response-content-disposition':
+                               f"attachment; filename*=UTF-8''{quote(download_name, safe='')}"}
+                url = signer.presigned_get_object(bucket_name, object_name, expires=timedelta(seconds=expires),
+                                                  response_headers=headers)
             return {
-                'buckets': total_buckets,
-                'objects': total_objects,
-                'storage_used_bytes': total_size,
-                'status': 'healthy' if self.connected else 'unhealthy'
+                'success': True,
+                'bucket': bucket_name,
+                'object': object_name,
+                'method': method,
+                'url': url,
+                'expires_at': (datetime.now(timezone.utc) + timedelta(seconds=expires)).isoformat()
             }
+        except PresignUnsupported as e:
+            return {'success': False, 'error': str(e), 'unsupported': True}
         except Exception as e:
-            logger.error(f"Error getting stats: {e}")
-            return {'error': str(e)}
+            logger.error(f"Error presigning {method} {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def presign_post(self, bucket_name, object_name=None, prefix=None, expires=PRESIGN_DEFAULT_EXPIRY,
+                     max_size=PRESIGN_MAX_UPLOAD_BYTES, content_type=None):
+        """Form fields for a browser POST straight to MinIO, capped at ``max_size`` bytes.
+
+        The policy pins the key (or a key prefix), the size range and
+        optionally the content type, so the form cannot be reused for anything else.
+        """
+        try:
+            signer = self._presigner()
+            self._ensure_bucket(bucket_name)
+            policy = PostPolicy(bucket_name, datetime.now(timezone.utc) + timedelta(seconds=expires))
+            if object_name:
+                policy.add_equals_condition('key', object_name)
+            else:
+                policy.add_starts_with_condition('key', prefix or '')
+            policy.add_content_length_range_condition(0, max_size)
+            if content_type:
+                policy.add_equals_condition('Content-Type', content_type)
+            fields = signer.presigned_post_policy(policy)
+            if object_name:
+                fields['key'] = object_name
+            if content_type:
+                fields['Content-Type'] = content_type
+            return {
+                'success': True,
+                'bucket': bucket_name,
+                'url': f'{MINIO_PUBLIC_ENDPOINT}/{bucket_name}',
+                'fields': fields,
+                'max_size': max_size,
+                'expires_at': (datetime.now(timezone.utc) + timedelta(seconds=expires)).isoformat()
+            }
+        except PresignUnsupported as e:
+            return {'success': False, 'error': str(e), 'unsupported': True}
+        except Exception as e:
+            logger.error(f"Error presigning POST policy for {bucket_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    @instrumented
+    def record_presigned_upload(self, bucket_name, object_name):
+        """Account for an object a client uploaded straight to MinIO.
+
+        Those bytes never pass through the API, so the cache, usage totals and
+        key index only learn about them here (or from the next stats rescan).
+        """
+        try:
+            self._ensure_connected()
+            self.cache.invalidate(bucket_name, object_name)
+            info = self.head_object(bucket_name, object_name)
+            self.stats.record_upload(bucket_name, info['size'])
+            mtime = info['last_modified'].timestamp() if info['last_modified'] else time.time()
+            self.index.record_put(bucket_name, object_name, info['size'], mtime)
+            return {'success': True, 'bucket': bucket_name, 'object': object_name,
+                    'size': info['size'], 'etag': info['etag']}
+        except S3Error as e:
+            if e.code in ('NoSuchKey', 'NoSuchBucket', 'NoSuchObject'):
+                return {'success': False, 'error': f'{bucket_name}/{object_name} not found', 'missing': True}
+            logger.error(f"Error recording presigned upload {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"Error recording presigned upload {bucket_name}/{object_name}: {e}")
+            return {'success': False, 'error': str(e), **self._failure_details(e)}
+
+    def dedup_totals(self):
+        """Logical bytes (what keys hold) against physical bytes (distinct blobs), or None."""
+        if not isinstance(self.client, DedupBackend):
+            return None
+        totals = self.client.index.totals()
+        totals['saved_bytes'] = totals['logical_bytes'] - totals['physical_bytes']
+        return totals
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats['status'] = 'healthy' if self.connected else 'unhealthy'
+        dedup = self.dedup_totals()
+        if dedup is not None:
+            stats['dedup'] = dedup
+        return stats
 
 s3_client = S3Client()
 
+# Every worker reads the same dedup totals, so report them once rather than summed
+for _name, _doc in (('logical', 'Bytes held by deduplicated keys'),
+                    ('physical', 'Bytes stored once per distinct deduplicated body')):
+    computed_gauges.gauge(f's3_dedup_{_name}_bytes', _doc,
+                          lambda _name=_name: (s3_client.dedup_totals() or {}).get(f'{_name}_bytes', 0),
+                          multiprocess_mode='livemax')
+
+for _name, _doc in (('in_use', 'MinIO connections currently checked out'),
+                    ('idle', 'Idle keep-alive MinIO connections'),
+                    ('maxsize', 'Configured MinIO connection pool capacity')):
+    computed_gauges.gauge(f'minio_pool_connections_{_name}', _doc, lambda _name=_name: s3_client.pool_usage()[_name])
+
+profiler = (SlowRequestProfiler(PROFILE_SLOW_REQUESTS_MS, PROFILER_MODE, PROFILER_INTERVAL_MS / 1000,
+                                PROFILER_KEEP)
+            if PROFILE_SLOW_REQUESTS_MS > 0 else None)
+
+def close_trace(trace):
+    """Log and profile a finished request, then clear it from the context."""
+    try:
+        if profiler is not None:
+            profiler.finish(trace)
+        elapsed_ms = trace.elapsed() * 1000
+        if TRACE_LOG_SLOW_MS and elapsed_ms >= TRACE_LOG_SLOW_MS:
+            breakdown = ', '.join(f'{name}={ms}ms' for name, ms in trace.breakdown().items())
+            logger.warning(f"Slow request {trace.method} {trace.path} took {elapsed_ms:.1f}ms"
+                           f"{': ' + breakdown if breakdown else ''}")
+    except Exception as e:
+        logger.error(f"Error closing trace {trace.request_id}: {e}")
+    finally:
+        end_trace()
+
+@app.before_request
+def begin_trace():
+    trace = start_trace(request_id_from(request.headers.get('X-Request-ID')), request.method, request.path)
+    if profiler is not None:
+        profiler.begin(trace)
+
+@app.after_request
+def add_trace_headers(response):
+    trace = current_trace()
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        response.headers['Server-Timing'] = trace.server_timing()
+        # Close once the body has been sent, so streamed responses are timed in full
+        response.call_on_close(functools.partial(close_trace, trace))
+        g.trace_closing = True
+    return response
+
+@app.teardown_request
+def drop_unsent_trace(exc):
+    trace = current_trace()
+    if trace is not None and not g.pop('trace_closing', False):
+        close_trace(trace)
+
+def start_worker_tasks():
+    """Start this process's background threads; safe to call more than once."""
+    s3_client.start_background_tasks()
+    computed_gauges.start()
+
+@app.before_request
+def start_background_tasks():
+    # Threads do not survive a fork, so each worker starts its own: gunicorn's
+    # post_worker_init hook does, otherwise the first request
+    if not app.config.get('TESTING'):
+        start_worker_tasks()
+
+@app.before_request
+def track_request_start():
+    requests_in_flight.inc()
+    g.in_flight = True
+
+@app.teardown_request
+def track_request_end(exc):
+    # Only undo our own increment, in case an earlier before_request bailed out
+    if g.pop('in_flight', False):
+        requests_in_flight.dec()
+
+# Rate limiting per client and endpoint class. A client is its X-API-Key when
+# that key is one of RATE_LIMIT_API_KEYS (comma-separated), else its IP address,
+# so made-up keys cannot buy a fresh budget. Counters are shared by every worker through RATE_LIMIT_STORAGE_URI (also
+# memory:// or redis://). Each class takes Flask-Limiter limits; a burst and a
+# sustained rate together behave like a token bucket
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI',
+                                   f"{SQLiteStorage.STORAGE_SCHEME[0]}://{os.path.join(STATE_DIR, 'ratelimit.sqlite3')}")
+RATE_LIMIT_KEY_PREFIX = 's3sim'
+RATE_LIMIT_API_KEYS = frozenset(key.strip() for key in os.getenv('RATE_LIMIT_API_KEYS', '').split(',') if key.strip())
+RATE_LIMITS = {
+    'metadata': os.getenv('RATE_LIMIT_METADATA', '100/second;3000/minute'),
+    'listing': os.getenv('RATE_LIMIT_LISTING', '10/second;300/minute'),
+    'transfer': os.getenv('RATE_LIMIT_TRANSFER', '50/second;1500/minute')
+}
+# Requests of one worker using the storage backend at once (0 = no cap); the
+# rest get 429 straight away instead of queueing for a MinIO connection
+BACKEND_MAX_IN_FLIGHT = int(os.getenv('BACKEND_MAX_IN_FLIGHT', MINIO_POOL_MAXSIZE))
+BACKEND_BUSY_RETRY_AFTER = int(os.getenv('BACKEND_BUSY_RETRY_AFTER', 1))
+# Proxies in front of the app whose X-Forwarded-For is trusted for client IPs
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+LISTING_ENDPOINTS = {'buckets_object_list', 'buckets_bucket', 'buckets_bulk_delete', 'stats_stats',
+                     'copy_copy_prefix', 'copy_rename_prefix'}
+TRANSFER_ENDPOINTS = {'buckets_object', 'upload_upload', 'multipart_multipart_part', 'copy_copy_object'}
+UNLIMITED_ENDPOINTS = {'root', 'specs', 'health_health_status', 'admin_profile_list', 'admin_profile'}
+
+def endpoint_class(endpoint, method):
+    """'listing', 'transfer' or 'metadata' for an API endpoint; None when it is not limited."""
+    if endpoint is None or endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if endpoint in LISTING_ENDPOINTS:
+        return 'listing'
+    if endpoint in TRANSFER_ENDPOINTS and method not in ('HEAD', 'DELETE'):
+        return 'transfer'
+    return 'metadata'
+
+def client_key(api_key, address):
+    if api_key in RATE_LIMIT_API_KEYS:
+        # Keys are not written to the shared limit store in the clear
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    return f'ip:{address or "unknown"}'
+
+limiter = Limiter(
+    lambda: client_key(request.headers.get('X-API-Key'), request.remote_addr),
+    app=app,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy='fixed-window',
+    key_prefix=RATE_LIMIT_KEY_PREFIX,
+    headers_enabled=True,
+    enabled=RATE_LIMIT_ENABLED,
+    # A broken limit store lets requests through rather than failing them
+    swallow_errors=True
+)
+backend_slots = ConcurrencyLimit(BACKEND_MAX_IN_FLIGHT)
+requests_rejected = Counter('s3_requests_rejected_total', 'Requests refused with 429', ['reason', 'endpoint_class'],
+                            registry=metrics.registry)
+computed_gauges.gauge('s3_backend_requests_in_flight', 'Requests holding a backend slot',
+                      lambda: backend_slots.in_use)
+
+def check_rate_limit(cls, api_key, address):
+    """Seconds until the client may retry if it is over its ``cls`` limits, else None.
+
+    For requests the ASGI server answers itself, outside Flask-Limiter. The
+    counters are the ones Flask-Limiter keeps, so both paths share one budget.
+    """
+    if not limiter.enabled:
+        return None
+    args = (RATE_LIMIT_KEY_PREFIX, client_key(api_key, address), cls)
+    try:
+        for item in sorted(parse_many(RATE_LIMITS[cls])):
+            if not limiter.limiter.hit(item, *args):
+                requests_rejected.labels('rate_limit', cls).inc()
+                reset = limiter.limiter.get_window_stats(item, *args).reset_time
+                return max(int(reset - time.time()) + 1, 1)
+    except Exception as e:
+        logger.error(f"Rate limit check failed, letting the request through: {e}")
+    return None
+
+def limit_backend_concurrency(view):
+    """Hold a backend slot until the response has been sent, or answer 429 if none is free."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        cls = endpoint_class(request.endpoint, request.method)
+        if cls is None:
+            return view(*args, **kwargs)
+        if not backend_slots.try_acquire():
+            requests_rejected.labels('concurrency', cls).inc()
+            return ({'error': 'Too many requests in progress, retry shortly'}, 429,
+                    {'Retry-After': str(BACKEND_BUSY_RETRY_AFTER)})
+        try:
+            response = view(*args, **kwargs)
+        except BaseException:
+            backend_slots.release()
+            raise
+        if response.is_streamed:
+            # The backend is read while the body is sent
+            response.call_on_close(backend_slots.release)
+        else:
+            backend_slots.release()
+        return response
+    return wrapper
+
+# Every API resource registered below is limited by its class; the rate limit
+# is checked first, so refused requests never take a backend slot
+api.decorators = [
+    limit_backend_concurrency,
+    limiter.shared_limit(lambda: RATE_LIMITS.get(endpoint_class(request.endpoint, request.method), ''),
+                         scope=lambda endpoint: endpoint_class(endpoint, request.method) or 'unlimited')
+]
+
+@api.errorhandler(RateLimitExceeded)
+def rate_limit_exceeded(e):
+    requests_rejected.labels('rate_limit', endpoint_class(request.endpoint, request.method)).inc()
+    return {'error': f'Rate limit exceeded: {e.description}'}, 429
+
 # Routes
 @app.route('/')
 def index():
@@ -189,17 +1926,46 @@ def about():
 
 @app.route('/health')
 def health():
-    """Basic health check for Render"""
-    # Check if MinIO is reachable
-    s3_client.list_buckets()
+    """Basic health check for Render, answered from the health monitor's cached state"""
     status = 'healthy' if s3_client.connected else 'degraded'
     return jsonify({
         'status': status,
         'service': 'aws-s3-simulator',
-        'minio_connected': s3_client.connected
+        'minio_connected': s3_client.connected,
+        'circuit': s3_client.breaker.state
     }), 200 if status == 'healthy' else 503
 
+@app.route('/health/live')
+def health_live():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'alive', 'service': 'aws-s3-simulator'}), 200
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness: MinIO is reachable and the circuit breaker lets calls through"""
+    ready = s3_client.connected and s3_client.breaker.state != 'open'
+    response = jsonify({'status': 'ready' if ready else 'not_ready', **s3_client.health.snapshot()})
+    if not ready:
+        response.headers['Retry-After'] = str(s3_client.breaker.retry_after() or int(HEALTH_CHECK_INTERVAL))
+    return response, 200 if ready else 503
+
 # API Endpoints
+def _result_status(result, status=200):
+    if result['success']:
+        return result, status
+    if result.get('unavailable'):
+        return result, 503, {'Retry-After': str(s3_client.breaker.retry_after() or 1)}
+    if result.get('unsupported'):
+        return result, 501
+    return result, 500
+
+@ns_health.route('/')
+class HealthStatus(Resource):
+    @ns_health.doc('health_status')
+    def get(self):
+        """Detailed MinIO health from the background monitor"""
+        return s3_client.health.snapshot()
+
 @ns_buckets.route('/')
 class BucketList(Resource):
     @ns_buckets.doc('list_buckets')
@@ -224,35 +1990,398 @@ class BucketList(Resource):
 
 @ns_buckets.route('/<string:bucket_name>')
 class Bucket(Resource):
-    @ns_buckets.doc('delete_bucket')
+    @ns_buckets.doc('delete_bucket', params={
+        'force': "'true' to delete every object in the bucket first",
+        'async': "With force, 'true' to run it as a background job and answer 202 with the job"
+    })
     def delete(self, bucket_name):
+        if request.args.get('force', 'false').lower() == 'true':
+            if request.args.get('async', 'false').lower() == 'true':
+                job = s3_client.jobs.submit('delete_prefix', {'bucket': bucket_name, 'remove_bucket': True})
+                return job, 202, {'Location': api.url_for(Job, job_id=job['id'])}
+            return _result_status(s3_client.force_delete_bucket(bucket_name))
         return s3_client.delete_bucket(bucket_name)
 
+@ns_buckets.route('/<string:bucket_name>/compression')
+class BucketCompression(Resource):
+    @ns_buckets.doc('get_compression_policy')
+    def get(self, bucket_name):
+        policy = s3_client.compression.get(bucket_name)
+        if policy is None:
+            return {'error': f'No compression policy for {bucket_name}'}, 404
+        return policy.to_dict()
+
+    @ns_buckets.doc('put_compression_policy')
+    @ns_buckets.expect(compression_model)
+    def put(self, bucket_name):
+        """Compress matching uploads to this bucket from now on; existing objects are left as they are"""
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {'error': 'Expected a JSON object'}, 400
+        try:
+            policy = CompressionPolicy.from_dict(data)
+        except (TypeError, ValueError) as e:
+            return {'error': str(e)}, 400
+        s3_client.compression.set(bucket_name, policy)
+        return policy.to_dict()
+
+    @ns_buckets.doc('delete_compression_policy')
+    def delete(self, bucket_name):
+        s3_client.compression.delete(bucket_name)
+        return {'success': True}
+
+@ns_buckets.route('/<string:bucket_name>/delete')
+class BulkDelete(Resource):
+    @ns_buckets.doc('bulk_delete')
+    @ns_buckets.expect(bulk_delete_model)
+    def post(self, bucket_name):
+        """Delete many keys, or a whole prefix, streaming one NDJSON result per key"""
+        data = request.get_json(silent=True) or {}
+        keys, prefix = data.get('keys'), data.get('prefix')
+        if (keys is None) == (prefix is None):
+            return {'error': 'Provide either keys or prefix'}, 400
+        if keys is not None and not (isinstance(keys, list) and all(isinstance(k, str) and k for k in keys)):
+            return {'error': 'keys must be a list of object names'}, 400
+
+        def generate():
+            deleted = failed = 0
+            try:
+                for result in s3_client.iter_delete(bucket_name, keys=keys, prefix=prefix,
+                                                    workers=BULK_DELETE_WORKERS):
+                    if result['deleted']:
+                        deleted += 1
+                    else:
+                        failed += 1
+                    yield json.dumps(result) + '\n'
+            except Exception as e:
+                logger.error(f"Error in bulk delete on {bucket_name}: {e}")
+                yield json.dumps({'error': str(e)}) + '\n'
+            yield json.dumps({'summary': {'deleted': deleted, 'errors': failed}}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @ns_buckets.route('/<string:bucket_name>/objects')
 class ObjectList(Resource):
-    @ns_buckets.doc('list_objects')
+    @ns_buckets.doc('list_objects', params={
+        'prefix': 'Only list keys starting with this prefix',
+        'delimiter': "'/' to group keys into common prefixes, empty for a flat listing",
+        'max-keys': f'Page size (1-{LIST_MAX_KEYS})',
+        'continuation-token': 'Token from a previous truncated page',
+        'start-after': 'Only list keys sorting after this key',
+        'end-before': 'Only list keys sorting before this key (range scan)',
+        'count': "'true' to return the number of keys under the prefix instead of listing them",
+        'format': "'ndjson' to stream entries as they are listed"
+    })
     def get(self, bucket_name):
-        return s3_client.list_objects(bucket_name)
+        with span('validate'):
+            prefix = request.args.get('prefix', '')
+            delimiter = request.args.get('delimiter', '/')
+            if delimiter not in ('', '/'):
+                return {'error': "Only '/' or an empty delimiter is supported"}, 400
+
+            try:
+                token = decode_continuation_token(request.args.get('continuation-token'))
+            except BadRequest as e:
+                return {'error': e.description}, 400
+            start_after = max(filter(None, (token, request.args.get('start-after'))), default=None)
+            end_before = request.args.get('end-before') or None
+            counting = request.args.get('count', 'false').lower() == 'true'
+
+            streaming = (request.args.get('format') == 'ndjson' or
+                         request.accept_mimetypes.best == 'application/x-ndjson')
+            max_keys = request.args.get('max-keys', type=int)
+            if max_keys is not None and (max_keys < 1 or (max_keys > LIST_MAX_KEYS and not streaming)):
+                return {'error': f'max-keys must be between 1 and {LIST_MAX_KEYS}'}, 400
+
+        if counting:
+            return _result_status(s3_client.count_objects(bucket_name, prefix, start_after, end_before))
+
+        if not streaming:
+            return s3_client.list_objects(
+                bucket_name, prefix, delimiter, max_keys or LIST_MAX_KEYS,
+                request.args.get('continuation-token'), request.args.get('start-after'), end_before
+            )
+
+        def generate():
+            last = None
+            try:
+                entries = s3_client.iter_objects(bucket_name, prefix, delimiter, start_after, end_before)
+                for count, entry in enumerate(entries):
+                    if max_keys is not None and count >= max_keys:
+                        yield json.dumps({'next_continuation_token': encode_continuation_token(last)}) + '\n'
+                        return
+                    last = entry.get('name') or entry.get('prefix')
+                    yield json.dumps(entry) + '\n'
+            except Exception as e:
+                logger.error(f"Error streaming objects in {bucket_name}: {e}")
+                yield json.dumps({'error': str(e)}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@ns_buckets.route('/<string:bucket_name>/objects/<path:object_name>')
+class Object(Resource):
+    max_body_size = STREAM_UPLOAD_MAX_BYTES
+
+    @ns_buckets.doc('put_object', params={
+        'part_size': f'Multipart part size in bytes for chunked bodies (default {STREAM_UPLOAD_PART_SIZE})'
+    })
+    def put(self, bucket_name, object_name):
+        """Stream the raw request body into an object without spooling it"""
+        with span('validate'):
+            part_size = request.args.get('part_size', type=int)
+            if part_size is not None and not MIN_PART_SIZE <= part_size <= MAX_PART_SIZE:
+                return {'error': f'part_size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes'}, 400
+
+        result = s3_client.upload_stream(
+            bucket_name,
+            request.stream,
+            object_name,
+            length=request.content_length,
+            part_size=part_size,
+            content_type=request.mimetype or 'application/octet-stream'
+        )
+        return _result_status(result)
+
+    @ns_buckets.doc('get_object')
+    def get(self, bucket_name, object_name):
+        """Stream an object, honouring Range and conditional request headers"""
+        info, error = _stat_for_request(bucket_name, object_name)
+        if error:
+            return error
+
+        with span('validate'):
+            validators = _object_validators(info)
+            if not is_resource_modified(request.environ, etag=_served_etag(info),
+                                        last_modified=info['last_modified']):
+                return Response(status=304, headers=validators)
+            size = info['size']
+            # Ranges would address the uncompressed bytes, so compressed objects ignore them
+            ranges = None if info['content_encoding'] else _requested_ranges(info)
+        if ranges == []:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+        if info['content_encoding']:
+            headers, decode = _encoding_headers(info)
+            body = s3_client.iter_object(bucket_name, object_name, info=info)
+            if decode:
+                body = decompressed(body, info['content_encoding'])
+            return Response(body, 200, headers={**validators, **headers}, content_type=info['content_type'])
+
+        if not ranges:
+            headers = {**validators, 'Content-Length': str(size)}
+            f = s3_client.open_object_file(bucket_name, object_name, info)
+            if f is None:
+                return Response(s3_client.iter_object(bucket_name, object_name, info=info), 200, headers=headers,
+                                content_type=info['content_type'])
+            f = ClosingFile(f)
+            f.response = Response(wrap_file(request.environ, f, DOWNLOAD_CHUNK_SIZE), 200, headers=headers,
+                                  content_type=info['content_type'], direct_passthrough=True)
+            return f.response
+
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            body = s3_client.iter_object(bucket_name, object_name, offset=start, length=stop - start, info=info)
+            return Response(body, 206, headers={
+                **validators,
+                'Content-Length': str(stop - start),
+                'Content-Range': f'bytes {start}-{stop - 1}/{size}'
+            }, content_type=info['content_type'])
+
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (f'--{boundary}\r\nContent-Type: {info["content_type"]}\r\n'
+             f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode()
+            for start, stop in ranges
+        ]
+        closing = f'--{boundary}--\r\n'.encode()
+        length = sum(len(h) + (stop - start) + 2 for h, (start, stop) in zip(part_headers, ranges)) + len(closing)
+
+        def generate():
+            for header, (start, stop) in zip(part_headers, ranges):
+                yield header
+                yield from s3_client.iter_object(bucket_name, object_name, offset=start, length=stop - start,
+                                                 info=info)
+                yield b'\r\n'
+            yield closing
+
+        return Response(generate(), 206, headers={**validators, 'Content-Length': str(length)},
+                        content_type=f'multipart/byteranges; boundary={boundary}')
+
+    @ns_buckets.doc('delete_object')
+    def delete(self, bucket_name, object_name):
+        info, error = _stat_for_request(bucket_name, object_name)
+        if error:
+            return error
+        return _result_status(s3_client.delete_object(bucket_name, object_name, info['size']))
+
+    @ns_buckets.doc('head_object')
+    def head(self, bucket_name, object_name):
+        info, error = _stat_for_request(bucket_name, object_name)
+        if error:
+            return error
+        headers = {'Content-Length': str(info['size'])}
+        if info['content_encoding']:
+            headers, _ = _encoding_headers(info)
+        return Response(status=200, content_type=info['content_type'], headers={
+            **_object_validators(info), **headers
+        })
+
+def _stat_for_request(bucket_name, object_name):
+    try:
+        return s3_client.head_object(bucket_name, object_name), None
+    except S3Error as e:
+        if e.code in ('NoSuchKey', 'NoSuchBucket', 'NoSuchObject'):
+            return None, ({'error': f'{bucket_name}/{object_name} not found'}, 404)
+        logger.error(f"Error reading {bucket_name}/{object_name}: {e}")
+        return None, ({'error': str(e)}, 500)
+    except Exception as e:
+        logger.error(f"Error reading {bucket_name}/{object_name}: {e}")
+        result = {'error': str(e), **s3_client._failure_details(e)}
+        if result.get('unavailable'):
+            return None, (result, 503, {'Retry-After': str(s3_client.breaker.retry_after() or 1)})
+        return None, (result, 500)
+
+def _encoding_headers(info):
+    """Headers for a stored-compressed object, and whether it has to be decompressed.
+
+    Clients that accept the stored encoding get the stored bytes as they are.
+    """
+    encoding = info['content_encoding']
+    if request.accept_encodings[encoding]:
+        return {'Content-Encoding': encoding, 'Content-Length': str(info['size'])}, False
+    if info['uncompressed_size'] is not None:
+        return {'Content-Length': str(info['uncompressed_size'])}, True
+    return {}, True
+
+def representation_etag(info, decode):
+    """The stored object's ETag, or a distinct one for the identity bytes decompressed from it.
+
+    Both representations share a URL, so a cache holding one must not
+    revalidate it with the other's validator.
+    """
+    return f'{info["etag"]}-identity' if decode else info['etag']
+
+def _served_etag(info):
+    encoding = info['content_encoding']
+    return representation_etag(info, bool(encoding) and not request.accept_encodings[encoding])
+
+def _object_validators(info):
+    headers = {'ETag': f'"{_served_etag(info)}"', 'Accept-Ranges': 'bytes'}
+    if info['content_encoding']:
+        headers.update({'Accept-Ranges': 'none', 'Vary': 'Accept-Encoding'})
+    if info['last_modified']:
+        headers['Last-Modified'] = http_date(info['last_modified'])
+    return headers
+
+def _requested_ranges(info):
+    """Resolve the Range header to [(start, stop), ...] with exclusive stops.
+
+    Returns None to serve the whole object (no, invalid or stale If-Range) and
+    an empty list when no requested range overlaps the object.
+    """
+    if request.range is None or request.range.units != 'bytes':
+        return None
+
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != info['etag']:
+        return None
+    if if_range.date and (not info['last_modified'] or info['last_modified'] > if_range.date):
+        return None
+
+    size = info['size']
+    ranges = []
+    for start, stop in request.range.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        elif stop is None or stop > size:
+            stop = size
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
 
 @ns_upload.route('/')
 class Upload(Resource):
     @ns_upload.doc('upload_file')
     def post(self):
-        if 'file' not in request.files:
-            return {'error': 'No file part'}, 400
-        file = request.files['file']
-        if file.filename == '':
-            return {'error': 'No selected file'}, 400
-        
-        bucket_name = request.form.get('bucket', 'default')
-        object_name = secure_filename(file.filename)
-        
-        # Get file size
-        file.seek(0, os.SEEK_END)
-        size = file.tell()
-        file.seek(0)
-        
-        return s3_client.upload_file(bucket_name, file, object_name, size)
+        with span('parse'):
+            files = request.files
+        with span('validate'):
+            if 'file' not in files:
+                return {'error': 'No file part'}, 400
+            file = files['file']
+            if file.filename == '':
+                return {'error': 'No selected file'}, 400
+
+            bucket_name = request.form.get('bucket', 'default')
+            object_name = secure_filename(file.filename)
+
+            # Get file size
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            file.seek(0)
+
+        return s3_client.upload_file(bucket_name, file, object_name, size,
+                                     content_type=file.mimetype or 'application/octet-stream')
+
+def _multipart_target():
+    bucket_name = request.args.get('bucket')
+    object_name = request.args.get('key')
+    if not bucket_name or not object_name:
+        raise BadRequest('bucket and key query parameters are required')
+    return bucket_name, object_name
+
+@ns_multipart.route('/')
+class MultipartUploadList(Resource):
+    @ns_multipart.doc('create_multipart_upload')
+    @ns_multipart.expect(multipart_model)
+    def post(self):
+        data = request.get_json() or {}
+        if not data.get('bucket') or not data.get('key'):
+            return {'error': 'bucket and key are required'}, 400
+        result = s3_client.create_multipart_upload(data['bucket'], data['key'], data.get('content_type'))
+        return _result_status(result, 201)
+
+@ns_multipart.route('/<string:upload_id>')
+@ns_multipart.doc(params={'bucket': 'Bucket name', 'key': 'Object key'})
+class MultipartUpload(Resource):
+    @ns_multipart.doc('list_parts')
+    def get(self, upload_id):
+        """List uploaded parts so an interrupted upload can resend only the missing ones"""
+        bucket_name, object_name = _multipart_target()
+        return _result_status(s3_client.list_parts(bucket_name, object_name, upload_id))
+
+    @ns_multipart.doc('abort_multipart_upload')
+    def delete(self, upload_id):
+        bucket_name, object_name = _multipart_target()
+        return _result_status(s3_client.abort_multipart_upload(bucket_name, object_name, upload_id))
+
+@ns_multipart.route('/<string:upload_id>/parts/<int:part_number>')
+@ns_multipart.doc(params={'bucket': 'Bucket name', 'key': 'Object key'})
+class MultipartPart(Resource):
+    max_body_size = MULTIPART_MAX_PART_BYTES
+
+    @ns_multipart.doc('upload_part')
+    def put(self, upload_id, part_number):
+        """Upload the raw request body as one part"""
+        with span('validate'):
+            bucket_name, object_name = _multipart_target()
+            if not 1 <= part_number <= MAX_PART_NUMBER:
+                return {'error': f'part_number must be between 1 and {MAX_PART_NUMBER}'}, 400
+        with span('parse'):
+            data = request.get_data(cache=False)
+        return _result_status(s3_client.upload_part(bucket_name, object_name, upload_id, part_number, data))
+
+@ns_multipart.route('/<string:upload_id>/complete')
+@ns_multipart.doc(params={'bucket': 'Bucket name', 'key': 'Object key'})
+class MultipartComplete(Resource):
+    @ns_multipart.doc('complete_multipart_upload')
+    def post(self, upload_id):
+        """Assemble the parts; an optional JSON body {"parts": [1, 2, ...]} selects which"""
+        bucket_name, object_name = _multipart_target()
+        data = request.get_json(silent=True) or {}
+        return _result_status(s3_client.complete_multipart_upload(
+            bucket_name, object_name, upload_id, data.get('parts')
+        ))
 
 @ns_stats.route('/')
 class Stats(Resource):
@@ -260,6 +2389,216 @@ class Stats(Resource):
     def get(self):
         return s3_client.get_stats()
 
+def _presign_expiry(data):
+    expires = data.get('expires', PRESIGN_DEFAULT_EXPIRY)
+    if not isinstance(expires, int) or not 1 <= expires <= PRESIGN_MAX_EXPIRY:
+        raise BadRequest(f'expires must be between 1 and {PRESIGN_MAX_EXPIRY} seconds')
+    return expires
+
+@ns_presign.route('/')
+class PresignObject(Resource):
+    @ns_presign.doc('presign_object')
+    @ns_presign.expect(presign_model)
+    def post(self):
+        """Issue a URL that downloads or uploads one object on MinIO without going through the API"""
+        data = request.get_json(silent=True) or {}
+        bucket_name, object_name = data.get('bucket'), data.get('key')
+        method = str(data.get('method', 'GET')).upper()
+        if not bucket_name or not object_name:
+            return {'error': 'bucket and key are required'}, 400
+        if method not in ('GET', 'PUT'):
+            return {'error': "method must be 'GET' or 'PUT'"}, 400
+        expires = _presign_expiry(data)
+        if method == 'GET':
+            info, error = _stat_for_request(bucket_name, object_name)
+            if error:
+                return error
+        return _result_status(s3_client.presign_object(
+            bucket_name, object_name, method, expires,
+            download_name=object_name.rsplit('/', 1)[-1] if method == 'GET' else None
+        ))
+
+@ns_presign.route('/post')
+class PresignPost(Resource):
+    @ns_presign.doc('presign_post')
+    @ns_presign.expect(presign_post_model)
+    def post(self):
+        """Issue a POST policy: form fields a browser submits straight to MinIO, with a size cap"""
+        data = request.get_json(silent=True) or {}
+        if not data.get('bucket') or not (data.get('key') or data.get('prefix') is not None):
+            return {'error': 'bucket and either key or prefix are required'}, 400
+        max_size = data.get('max_size', PRESIGN_MAX_UPLOAD_BYTES)
+        if not isinstance(max_size, int) or not 0 < max_size <= PRESIGN_MAX_UPLOAD_BYTES:
+            return {'error': f'max_size must be between 1 and {PRESIGN_MAX_UPLOAD_BYTES} bytes'}, 400
+        return _result_status(s3_client.presign_post(
+            data['bucket'], data.get('key'), data.get('prefix'), _presign_expiry(data), max_size,
+            data.get('content_type')
+        ))
+
+@ns_presign.route('/complete')
+class PresignComplete(Resource):
+    @ns_presign.doc('presign_complete')
+    @ns_presign.expect(presign_complete_model)
+    def post(self):
+        """Tell the API about an object uploaded through a presigned URL or POST policy"""
+        data = request.get_json(silent=True) or {}
+        if not data.get('bucket') or not data.get('key'):
+            return {'error': 'bucket and key are required'}, 400
+        result = s3_client.record_presigned_upload(data['bucket'], data['key'])
+        if result.get('missing'):
+            return result, 404
+        return _result_status(result)
+
+def _admin_denied():
+    token = request.headers.get('X-Admin-Token', '')
+    if ADMIN_TOKEN and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return None
+    return {'error': 'A valid X-Admin-Token header is required' if ADMIN_TOKEN else 'ADMIN_TOKEN is not set'}, 403
+
+@ns_admin.route('/profiles')
+class ProfileList(Resource):
+    @ns_admin.doc('list_profiles')
+    def get(self):
+        """Requests slower than PROFILE_SLOW_REQUESTS_MS that this worker profiled, newest first"""
+        denied = _admin_denied()
+        if denied:
+            return denied
+        return {
+            'enabled': profiler is not None,
+            'threshold_ms': PROFILE_SLOW_REQUESTS_MS,
+            'profiles': profiler.profiles() if profiler is not None else []
+        }
+
+@ns_admin.route('/profiles/<string:request_id>')
+class Profile(Resource):
+    @ns_admin.doc('get_profile')
+    def get(self, request_id):
+        """Span breakdown plus folded stack samples or cProfile stats for one request"""
+        denied = _admin_denied()
+        if denied:
+            return denied
+        profile = profiler.get(request_id) if profiler is not None else None
+        if profile is None:
+            return {'error': f'No profile for request {request_id} on this worker'}, 404
+        return profile
+
+@ns_copy.route('/')
+class CopyObject(Resource):
+    @ns_copy.doc('copy_object')
+    @ns_copy.expect(copy_model)
+    def post(self):
+        """Copy one object inside the object store (multipart compose above 5 GiB)"""
+        data = request.get_json(silent=True) or {}
+        bucket_name, key, dest_key = data.get('bucket'), data.get('key'), data.get('dest_key')
+        if not bucket_name or not key or not dest_key:
+            return {'error': 'bucket, key and dest_key are required'}, 400
+        dest_bucket = data.get('dest_bucket') or bucket_name
+        if (bucket_name, key) == (dest_bucket, dest_key):
+            return {'error': 'Source and destination are the same object'}, 400
+        info, error = _stat_for_request(bucket_name, key)
+        if error:
+            return error
+        return _result_status(s3_client.copy_object(bucket_name, key, dest_bucket, dest_key))
+
+def _copy_prefix(move):
+    """Stream one NDJSON result per key and a summary, or queue the copy as a job with async."""
+    data = request.get_json(silent=True) or {}
+    bucket_name = data.get('bucket')
+    if not bucket_name:
+        return {'error': 'bucket is required'}, 400
+    prefix, dest_prefix = data.get('prefix') or '', data.get('dest_prefix') or ''
+    dest_bucket = data.get('dest_bucket') or bucket_name
+    try:
+        s3_client.check_copy_prefix(bucket_name, prefix, dest_bucket, dest_prefix)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    if data.get('async'):
+        job = s3_client.jobs.submit('rename_prefix' if move else 'copy_prefix', {
+            'bucket': bucket_name, 'prefix': prefix, 'dest_bucket': dest_bucket, 'dest_prefix': dest_prefix
+        })
+        return job, 202, {'Location': api.url_for(Job, job_id=job['id'])}
+
+    def generate():
+        copied = failed = 0
+        try:
+            for result in s3_client.iter_copy(bucket_name, prefix, dest_bucket, dest_prefix, move=move):
+                if result['copied'] and result.get('deleted', True):
+                    copied += 1
+                else:
+                    failed += 1
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            logger.error(f"Error copying {bucket_name}/{prefix} to {dest_bucket}/{dest_prefix}: {e}")
+            yield json.dumps({'error': str(e)}) + '\n'
+        yield json.dumps({'summary': {'moved' if move else 'copied': copied, 'errors': failed}}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@ns_copy.route('/prefix')
+class CopyPrefix(Resource):
+    @ns_copy.doc('copy_prefix')
+    @ns_copy.expect(copy_prefix_model)
+    def post(self):
+        """Copy every key under a prefix server-side, in parallel"""
+        return _copy_prefix(move=False)
+
+@ns_copy.route('/rename-prefix')
+class RenamePrefix(Resource):
+    @ns_copy.doc('rename_prefix')
+    @ns_copy.expect(copy_prefix_model)
+    def post(self):
+        """Move every key under a prefix: server-side copies, then batched deletes of the sources"""
+        return _copy_prefix(move=True)
+
+@ns_jobs.route('/')
+class JobList(Resource):
+    @ns_jobs.doc('list_jobs', params={'state': "Only jobs in this state ('queued', 'running', ...)",
+                                      'limit': 'Most recent jobs to return (default 100)'})
+    def get(self):
+        state = request.args.get('state')
+        if state is not None and state not in JOB_STATES:
+            return {'error': f"state must be one of {', '.join(JOB_STATES)}"}, 400
+        limit = request.args.get('limit', '100')
+        if not limit.isdigit() or not 1 <= int(limit) <= 1000:
+            return {'error': 'limit must be between 1 and 1000'}, 400
+        return {'jobs': s3_client.jobs.store.list(state, int(limit)), 'kinds': s3_client.jobs.kinds}
+
+    @ns_jobs.doc('submit_job')
+    @ns_jobs.expect(job_model)
+    def post(self):
+        """Queue a bulk operation; poll the returned job for progress"""
+        data = request.get_json(silent=True) or {}
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return {'error': 'params must be an object'}, 400
+        try:
+            job = s3_client.jobs.submit(data.get('kind'), params)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return job, 202, {'Location': api.url_for(Job, job_id=job['id'])}
+
+@ns_jobs.route('/<string:job_id>')
+class Job(Resource):
+    @ns_jobs.doc('get_job')
+    def get(self, job_id):
+        job = s3_client.jobs.store.get(job_id)
+        if job is None:
+            return {'error': f'Job {job_id} not found'}, 404
+        return job
+
+@ns_jobs.route('/<string:job_id>/cancel')
+class JobCancel(Resource):
+    @ns_jobs.doc('cancel_job')
+    def post(self, job_id):
+        """Cancel a queued job, or stop a running one at its next step"""
+        job = s3_client.jobs.store.cancel(job_id)
+        if job is None:
+            return {'error': f'Job {job_id} not found'}, 404
+        if job['state'] in ('succeeded', 'failed'):
+            return {'error': f"Job {job_id} already {job['state']}", **job}, 409
+        return job
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,486 @@
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+
+from minio.error import S3Error
+from werkzeug.http import parse_accept_header
+
+import app as app_module
+from app import (
+    app, close_trace, logger, requests_in_flight, requests_rejected, s3_client, LIST_MAX_KEYS, MIN_PART_SIZE,
+    MAX_PART_NUMBER, MAX_PART_SIZE, MULTIPART_MAX_PART_BYTES, STREAM_UPLOAD_MAX_BYTES, STREAM_UPLOAD_PART_SIZE,
+    BACKEND_BUSY_RETRY_AFTER,
+    check_rate_limit, decode_continuation_token, encode_continuation_token, representation_etag,
+    start_worker_tasks
+)
+from compression import decompressed
+from tracing import request_id_from, start_trace
+
+# ASGI entry point: uvicorn asgi:application
+#
+# Object transfer, multipart part uploads and NDJSON listing are handled here
+# with asyncio so a slow client only costs a coroutine: blocking MinIO calls are
+# offloaded to a bounded thread pool one part/chunk/page at a time. Every other
+# route runs the Flask app on a pool of its own, so the /api/v1 surface is
+# identical to the WSGI server; their request bodies are spooled first (to disk
+# past ASGI_SPOOL_BYTES), and their responses are pulled a chunk at a time so no
+# thread ever waits for a client to read.
+
+ASGI_MAX_THREADS = int(os.getenv('ASGI_MAX_THREADS', 64))
+ASGI_FLASK_THREADS = int(os.getenv('ASGI_FLASK_THREADS', 32))
+ASGI_SPOOL_BYTES = int(os.getenv('ASGI_SPOOL_BYTES', 1024 * 1024))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_MAX_THREADS, thread_name_prefix='asgi-offload')
+# Flask routes get their own threads, so they can never starve the native handlers
+flask_executor = ThreadPoolExecutor(max_workers=ASGI_FLASK_THREADS, thread_name_prefix='asgi-flask')
+
+OBJECT_PATH = re.compile(r'^/api/v1/buckets/(?P<bucket>[^/]+)/objects/(?P<key>.+)$')
+LISTING_PATH = re.compile(r'^/api/v1/buckets/(?P<bucket>[^/]+)/objects/?$')
+PART_PATH = re.compile(r'^/api/v1/multipart/(?P<upload_id>[^/]+)/parts/(?P<part_number>\d+)$')
+
+# Headers that need the Flask implementation (ranges, conditional requests)
+CONDITIONAL_HEADERS = {b'range', b'if-none-match', b'if-modified-since', b'if-range', b'if-match'}
+
+
+async def offload(fn, *args, **kwargs):
+    """Run a blocking call on the bounded pool without blocking the event loop.
+
+    The call runs in a copy of the caller's context, so its spans and log
+    lines belong to the request that made it.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _query(scope):
+    return {k: v[-1] for k, v in parse_qs(scope['query_string'].decode('latin-1'), keep_blank_values=True).items()}
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    *headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_result(send, result):
+    """Send an S3Client result dict with the status the Flask resources would use."""
+    if result['success']:
+        return await send_json(send, 200, result)
+    if result.get('unavailable'):
+        retry_after = str(s3_client.breaker.retry_after() or 1).encode()
+        return await send_json(send, 503, result, [(b'retry-after', retry_after)])
+    await send_json(send, 500, result)
+
+
+async def send_error(send, e, bucket_name, object_name=None):
+    if isinstance(e, S3Error) and e.code in ('NoSuchKey', 'NoSuchBucket', 'NoSuchObject'):
+        target = f'{bucket_name}/{object_name}' if object_name else bucket_name
+        return await send_json(send, 404, {'error': f'{target} not found'})
+    logger.error(f"Error serving {bucket_name}/{object_name or ''}: {e}")
+    details = s3_client._failure_details(e)
+    if details.get('unavailable'):
+        retry_after = str(s3_client.breaker.retry_after() or 1).encode()
+        return await send_json(send, 503, {'error': str(e), **details}, [(b'retry-after', retry_after)])
+    await send_json(send, 500, {'error': str(e)})
+
+
+async def get_object(scope, send, bucket_name, object_name):
+    try:
+        info = await offload(s3_client.head_object, bucket_name, object_name)
+    except Exception as e:
+        return await send_error(send, e, bucket_name, object_name)
+
+    encoding, decode = info['content_encoding'], False
+    if encoding:
+        # Same negotiation as the Flask route: stored bytes if accepted, else decompress
+        decode = not parse_accept_header(_header(scope, b'accept-encoding'))[encoding]
+    headers = [
+        (b'content-type', info['content_type'].encode('latin-1')),
+        (b'etag', f'"{representation_etag(info, decode)}"'.encode('latin-1')),
+    ]
+    if encoding:
+        headers += [(b'accept-ranges', b'none'), (b'vary', b'Accept-Encoding')]
+        if not decode:
+            headers += [(b'content-encoding', encoding.encode()), (b'content-length', str(info['size']).encode())]
+        elif info['uncompressed_size'] is not None:
+            headers.append((b'content-length', str(info['uncompressed_size']).encode()))
+    else:
+        headers += [(b'content-length', str(info['size']).encode()), (b'accept-ranges', b'bytes')]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    if scope['method'] == 'HEAD':
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    body = s3_client.iter_object(bucket_name, object_name, info=info)
+    if decode:
+        body = decompressed(body, encoding)
+    try:
+        while True:
+            chunk = await offload(next, body, None)
+            if chunk is None:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        await offload(body.close)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def put_object(scope, receive, send, bucket_name, object_name):
+    """Buffer at most one part in memory; only MinIO calls occupy a thread."""
+    part_size = _query(scope).get('part_size')
+    if part_size is not None:
+        if not part_size.isdigit() or not MIN_PART_SIZE <= int(part_size) <= MAX_PART_SIZE:
+            return await send_json(send, 400, {
+                'error': f'part_size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes'
+            })
+    part_size = int(part_size or STREAM_UPLOAD_PART_SIZE)
+    content_type = _header(scope, b'content-type') or 'application/octet-stream'
+
+    started = time.monotonic()
+    buffer = bytearray()
+    received = 0
+    upload_id = None
+    part_numbers = []
+    more_body = True
+    try:
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                if upload_id:
+                    await offload(s3_client.abort_multipart_upload, bucket_name, object_name, upload_id)
+                return
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if STREAM_UPLOAD_MAX_BYTES and received > STREAM_UPLOAD_MAX_BYTES:
+                if upload_id:
+                    await offload(s3_client.abort_multipart_upload, bucket_name, object_name, upload_id)
+                return await send_json(send, 413, {'error': 'Request body too large'})
+            buffer += chunk
+            more_body = message.get('more_body', False)
+
+            # Keep the last part back until the body ends so it is never empty
+            while len(buffer) > part_size or (len(buffer) == part_size and more_body):
+                if upload_id is None:
+                    result = await offload(s3_client.create_multipart_upload, bucket_name, object_name, content_type)
+                    if not result['success']:
+                        return await send_result(send, result)
+                    upload_id = result['upload_id']
+                part = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                part_numbers.append(len(part_numbers) + 1)
+                result = await offload(s3_client.upload_part, bucket_name, object_name, upload_id,
+                                       part_numbers[-1], part)
+                if not result['success']:
+                    await offload(s3_client.abort_multipart_upload, bucket_name, object_name, upload_id)
+                    return await send_result(send, result)
+
+        if upload_id is None:
+            result = await offload(s3_client.upload_stream, bucket_name, io.BytesIO(bytes(buffer)), object_name,
+                                   length=len(buffer), content_type=content_type)
+            return await send_result(send, result)
+
+        if buffer:
+            part_numbers.append(len(part_numbers) + 1)
+            result = await offload(s3_client.upload_part, bucket_name, object_name, upload_id,
+                                   part_numbers[-1], bytes(buffer))
+            if not result['success']:
+                await offload(s3_client.abort_multipart_upload, bucket_name, object_name, upload_id)
+                return await send_result(send, result)
+        result = await offload(s3_client.complete_multipart_upload, bucket_name, object_name, upload_id,
+                               part_numbers)
+    except Exception as e:
+        if upload_id:
+            await offload(s3_client.abort_multipart_upload, bucket_name, object_name, upload_id)
+        return await send_error(send, e, bucket_name, object_name)
+
+    if result['success']:
+        elapsed = time.monotonic() - started
+        result['elapsed_seconds'] = round(elapsed, 6)
+        result['throughput_bytes_per_sec'] = round(result['size'] / elapsed) if elapsed > 0 else None
+    await send_result(send, result)
+
+
+async def put_part(scope, receive, send, upload_id, part_number):
+    """Collect one multipart part in memory and upload it, without spooling it to a file first."""
+    query = _query(scope)
+    bucket_name, object_name = query.get('bucket'), query.get('key')
+    if not bucket_name or not object_name:
+        return await send_json(send, 400, {'message': 'bucket and key query parameters are required'})
+    if not 1 <= part_number <= MAX_PART_NUMBER:
+        return await send_json(send, 400, {'error': f'part_number must be between 1 and {MAX_PART_NUMBER}'})
+    length = _header(scope, b'content-length')
+    if length and length.isdigit() and int(length) > MULTIPART_MAX_PART_BYTES:
+        return await send_json(send, 413, {'error': 'Request body too large'})
+
+    buffer = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        buffer += message.get('body', b'')
+        if len(buffer) > MULTIPART_MAX_PART_BYTES:
+            return await send_json(send, 413, {'error': 'Request body too large'})
+        more_body = message.get('more_body', False)
+
+    result = await offload(s3_client.upload_part, bucket_name, object_name, upload_id, part_number, bytes(buffer))
+    await send_result(send, result)
+
+
+def _compressed_upload(scope, bucket_name):
+    """Uploads the bucket's compression policy covers go through Flask, which compresses as it streams."""
+    policy = s3_client.compression.get(bucket_name)
+    if policy is None:
+        return False
+    length = _header(scope, b'content-length')
+    return policy.applies(_header(scope, b'content-type'), int(length) if length and length.isdigit() else None)
+
+
+async def stream_listing(send, bucket_name, prefix, delimiter, start_after, max_keys):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+
+    entries = s3_client.iter_objects(bucket_name, prefix, delimiter, start_after)
+    count, last = 0, None
+    try:
+        while max_keys is None or count < max_keys:
+            size = LIST_MAX_KEYS if max_keys is None else min(LIST_MAX_KEYS, max_keys - count)
+            page = await offload(lambda: list(islice(entries, size)))
+            if not page:
+                break
+            count += len(page)
+            last = page[-1].get('name') or page[-1].get('prefix')
+            lines = ''.join(json.dumps(entry) + '\n' for entry in page)
+            await send({'type': 'http.response.body', 'body': lines.encode(), 'more_body': True})
+        else:
+            # max-keys reached: emit a token only if something is left
+            if await offload(next, entries, None) is not None:
+                line = json.dumps({'next_continuation_token': encode_continuation_token(last)}) + '\n'
+                await send({'type': 'http.response.body', 'body': line.encode(), 'more_body': True})
+    except Exception as e:
+        logger.error(f"Error streaming objects in {bucket_name}: {e}")
+        line = json.dumps({'error': str(e)}) + '\n'
+        await send({'type': 'http.response.body', 'body': line.encode(), 'more_body': True})
+    finally:
+        await offload(entries.close)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _native_listing(scope):
+    """Arguments for a natively streamed NDJSON listing, or None to let Flask answer."""
+    query = _query(scope)
+    accept = _header(scope, b'accept') or ''
+    if query.get('format') != 'ndjson' and not accept.startswith('application/x-ndjson'):
+        return None
+    # Range scans and counts are answered by the Flask route
+    if any(name in query for name in ('start-after', 'end-before', 'count')):
+        return None
+    delimiter = query.get('delimiter', '/')
+    max_keys = query.get('max-keys')
+    if delimiter not in ('', '/') or (max_keys is not None and (not max_keys.isdigit() or int(max_keys) < 1)):
+        return None
+    try:
+        start_after = decode_continuation_token(query.get('continuation-token'))
+    except Exception:
+        return None
+    return query.get('prefix', ''), delimiter, start_after, int(max_keys) if max_keys else None
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    """Run the Flask app on its pool, pulling the response from it one chunk at a time.
+
+    A pool thread runs the view and then each step of the response iterator,
+    never a write to the client, so a slow reader only holds a coroutine.
+    """
+    body = SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return
+        body.write(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    length = body.tell()
+    body.seek(0)
+
+    environ = build_environ(scope, body)
+    environ['CONTENT_LENGTH'] = str(length)
+    loop = asyncio.get_running_loop()
+    # Flask's request context lives in this one context while the response is
+    # iterated, whichever pool thread runs each step
+    context = contextvars.copy_context()
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    def run(fn, *args):
+        return loop.run_in_executor(flask_executor, functools.partial(context.run, fn, *args))
+
+    try:
+        result = await run(app, environ, start_response)
+        try:
+            chunks = await run(iter, result)
+            started = False
+            while True:
+                chunk = await run(next, chunks, None)
+                if chunk is None:
+                    break
+                if not started:
+                    await send({'type': 'http.response.start', 'status': response['status'],
+                                'headers': response['headers']})
+                    started = True
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                await send({'type': 'http.response.start', 'status': response['status'],
+                            'headers': response['headers']})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await run(result.close)
+    finally:
+        body.close()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_worker_tasks()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            flask_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def native(scope, send, handler, endpoint_class):
+    """Trace, count and limit a natively served request the way Flask does for its own.
+
+    ``handler`` is called with a ``send`` that adds the X-Request-ID header.
+    Requests over their ``endpoint_class`` rate limit, or finding no free
+    backend slot, get 429 instead. The slow request profiler only covers
+    Flask routes: a native request's time is spread over the event loop and
+    pool threads.
+    """
+    trace = start_trace(request_id_from(_header(scope, b'x-request-id')), scope['method'], scope['path'])
+
+    async def traced_send(message):
+        if message['type'] == 'http.response.start':
+            message = {**message, 'headers': [*message['headers'],
+                                              (b'x-request-id', trace.request_id.encode('latin-1'))]}
+        await send(message)
+
+    requests_in_flight.inc()
+    try:
+        client = scope.get('client') or (None,)
+        retry_after = await offload(check_rate_limit, endpoint_class, _header(scope, b'x-api-key'), client[0])
+        if retry_after is not None:
+            return await send_json(traced_send, 429, {'error': 'Rate limit exceeded'},
+                                   [(b'retry-after', str(retry_after).encode())])
+        # Looked up on the module so tests can swap the limit
+        slots = app_module.backend_slots
+        if not slots.try_acquire():
+            requests_rejected.labels('concurrency', endpoint_class).inc()
+            return await send_json(traced_send, 429, {'error': 'Too many requests in progress, retry shortly'},
+                                   [(b'retry-after', str(BACKEND_BUSY_RETRY_AFTER).encode())])
+        try:
+            return await handler(traced_send)
+        finally:
+            slots.release()
+    finally:
+        requests_in_flight.dec()
+        close_trace(trace)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    match = OBJECT_PATH.match(path)
+    if match:
+        # The policy lookup stats (and may read) the policy file, so it runs off the loop
+        if method == 'PUT' and not await offload(_compressed_upload, scope, match['bucket']):
+            return await native(scope, send,
+                                lambda send: put_object(scope, receive, send, match['bucket'], match['key']),
+                                'transfer')
+        if method in ('GET', 'HEAD') and not any(name in CONDITIONAL_HEADERS for name, _ in scope['headers']):
+            return await native(scope, send, lambda send: get_object(scope, send, match['bucket'], match['key']),
+                                'transfer' if method == 'GET' else 'metadata')
+
+    match = PART_PATH.match(path)
+    if match and method == 'PUT':
+        return await native(scope, send, lambda send: put_part(scope, receive, send, match['upload_id'],
+                                                               int(match['part_number'])),
+                            'transfer')
+
+    match = LISTING_PATH.match(path)
+    if match and method == 'GET':
+        listing = _native_listing(scope)
+        if listing is not None:
+            return await native(scope, send, lambda send: stream_listing(send, match['bucket'], *listing),
+                                'listing')
+
+    await call_flask(scope, receive, send)
@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+ENCODINGS = ('gzip', 'zstd') if zstandard is not None else ('gzip',)
+DEFAULT_CONTENT_TYPES = [
+    'text/*', 'application/json', 'application/x-ndjson', 'application/xml',
+    'application/javascript', 'application/x-yaml', 'image/svg+xml'
+]
+UNCOMPRESSED_SIZE_HEADER = 'X-Amz-Meta-Uncompressed-Size'
+READ_SIZE = 256 * 1024
+
+
+class CompressionPolicy:
+    """Which uploads to a bucket get compressed, and how."""
+
+    __slots__ = ('encoding', 'level', 'min_size', 'content_types')
+
+    def __init__(self, encoding='gzip', level=6, min_size=1024, content_types=None):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+        limits = (1, 9) if encoding == 'gzip' else (1, 22)
+        if not isinstance(level, int) or not limits[0] <= level <= limits[1]:
+            raise ValueError(f'{encoding} level must be between {limits[0]} and {limits[1]}')
+        if not isinstance(min_size, int) or min_size < 0:
+            raise ValueError('min_size must be a non-negative integer')
+        content_types = DEFAULT_CONTENT_TYPES if content_types is None else content_types
+        if not isinstance(content_types, list) or not all(isinstance(t, str) for t in content_types):
+            raise ValueError('content_types must be a list of MIME types, e.g. "text/*"')
+        self.encoding = encoding
+        self.level = level
+        self.min_size = min_size
+        self.content_types = content_types
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data) - set(cls.__slots__)
+        if unknown:
+            raise ValueError(f"Unknown policy fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def applies(self, content_type, length=None):
+        """Whether an upload of this type and length (None if unknown) should be compressed."""
+        if length is not None and length < self.min_size:
+            return False
+        content_type = (content_type or '').split(';', 1)[0].strip().lower()
+        for pattern in self.content_types:
+            if pattern.endswith('/*') and content_type.startswith(pattern[:-1]) or pattern == content_type:
+                return True
+        return False
+
+
+class CompressionPolicies:
+    """Per-bucket policies in a JSON file under STATE_DIR, shared by all workers.
+
+    Each call checks the file's mtime, so a policy set through one worker is
+    applied by the others on their next upload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._policies = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._policies, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._policies = {b: CompressionPolicy.from_dict(p) for b, p in json.load(f).items()}
+            self._mtime = mtime
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({b: p.to_dict() for b, p in self._policies.items()}, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def get(self, bucket_name):
+        with self._lock:
+            self._load()
+            return self._policies.get(bucket_name)
+
+    def set(self, bucket_name, policy):
+        with self._lock:
+            self._load()
+            self._policies[bucket_name] = policy
+            self._save()
+
+    def delete(self, bucket_name):
+        with self._lock:
+            self._load()
+            if self._policies.pop(bucket_name, None) is not None:
+                self._save()
+
+
+def _compressor(encoding, level):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def _decompressor(encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+class CompressingReader:
+    """File-like view of ``stream`` that returns its bytes compressed.
+
+    Input is pulled ``READ_SIZE`` bytes at a time, so memory stays bounded
+    however large the upload. ``bytes_written`` counts the compressed output.
+    """
+
+    def __init__(self, stream, encoding, level):
+        self.stream = stream
+        self.bytes_written = 0
+        self._compressor = _compressor(encoding, level)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.stream.read(READ_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = bytes(self._buffer), bytearray()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self.bytes_written += len(data)
+        return data
+
+
+def decompressed(chunks, encoding):
+    """Decompress an iterable of stored chunks lazily, chunk by chunk."""
+    decompressor = _decompressor(encoding)
+    try:
+        for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        if encoding == 'gzip':
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
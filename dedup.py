@@ -0,0 +1,374 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+from storage import StoredObject, StorageBackend, WriteResult, storage_error
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL,
+    key TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    content_type TEXT,
+    PRIMARY KEY (bucket, key)
+);
+-- Blobs whose last reference went away, until they are removed from the backend
+CREATE TABLE IF NOT EXISTS garbage (
+    key TEXT PRIMARY KEY
+);
+"""
+
+
+class Ref:
+    __slots__ = ('sha256', 'size', 'etag', 'content_type', 'blob_key')
+
+    def __init__(self, sha256, size, etag, content_type, blob_key=None):
+        self.sha256 = sha256
+        self.size = size
+        self.etag = etag
+        self.content_type = content_type
+        self.blob_key = blob_key
+
+
+class HashingReader:
+    """File-like wrapper that hashes (SHA-256 and MD5) and counts the bytes read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.md5.update(data)
+        self.bytes_read += len(data)
+        return data
+
+
+class DedupIndex:
+    """Refcounted blobs and the keys that reference them, in one SQLite file.
+
+    Every gunicorn worker opens the same file; writes take SQLite's write
+    lock (BEGIN IMMEDIATE), so refcounts stay exact across processes. Methods
+    that drop references return the keys of the blobs left unreferenced, for
+    the caller to remove from the backend once the transaction is committed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        db = self._db()
+        db.executescript(SCHEMA)
+        # Files written before each blob had its own key stored it under its hash
+        if 'key' not in [row[1] for row in db.execute('PRAGMA table_info(blobs)')]:
+            try:
+                db.execute('ALTER TABLE blobs ADD COLUMN key TEXT')
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+        db.execute("UPDATE blobs SET key = substr(sha256, 1, 2) || '/' || sha256 WHERE key IS NULL")
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        # A connection must not be shared with a forked child
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def lookup(self, bucket_name, object_name):
+        row = self._db().execute('SELECT refs.sha256, refs.size, refs.etag, refs.content_type, blobs.key '
+                                 'FROM refs LEFT JOIN blobs ON blobs.sha256 = refs.sha256 '
+                                 'WHERE refs.bucket = ? AND refs.key = ?', (bucket_name, object_name)).fetchone()
+        return Ref(*row) if row else None
+
+    def acquire(self, sha256, size, blob_key):
+        """Take a reference on the blob with this content, stored as ``blob_key`` if it is new.
+
+        Returns the key the blob is stored under: when that is not
+        ``blob_key``, the content was already stored and the caller's copy is
+        not needed.
+        """
+        with self._transaction() as db:
+            row = db.execute('SELECT key FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if row is None:
+                db.execute('INSERT INTO blobs (sha256, size, refcount, key) VALUES (?, ?, 1, ?)',
+                           (sha256, size, blob_key))
+                return blob_key
+            db.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+            return row[0]
+
+    def reference(self, sha256):
+        """Take another reference on a stored blob; False if it has gone away."""
+        with self._transaction() as db:
+            return db.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,)).rowcount > 0
+
+    def _decrement(self, db, sha256, unreferenced):
+        db.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+        refcount, blob_key = db.execute('SELECT refcount, key FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if refcount <= 0:
+            # Nothing can reference this key again: new uploads of the same
+            # content are stored under keys of their own
+            db.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+            db.execute('INSERT OR IGNORE INTO garbage (key) VALUES (?)', (blob_key,))
+            unreferenced.append(blob_key)
+
+    def release(self, sha256):
+        """Drop a reference taken with acquire() or reference() that never became a key."""
+        unreferenced = []
+        with self._transaction() as db:
+            self._decrement(db, sha256, unreferenced)
+        return unreferenced
+
+    def bind(self, bucket_name, object_name, ref):
+        """Point a key at a blob the caller holds a reference on, releasing what it pointed at before."""
+        unreferenced = []
+        with self._transaction() as db:
+            old = db.execute('SELECT sha256 FROM refs WHERE bucket = ? AND key = ?',
+                             (bucket_name, object_name)).fetchone()
+            db.execute('INSERT OR REPLACE INTO refs (bucket, key, sha256, size, etag, content_type) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (bucket_name, object_name, ref.sha256, ref.size, ref.etag, ref.content_type))
+            if old is not None:
+                self._decrement(db, old[0], unreferenced)
+        return unreferenced
+
+    def unbind(self, bucket_name, object_names):
+        """Forget keys that were deleted or overwritten with a plain object."""
+        unreferenced = []
+        with self._transaction() as db:
+            for object_name in object_names:
+                old = db.execute('SELECT sha256 FROM refs WHERE bucket = ? AND key = ?',
+                                 (bucket_name, object_name)).fetchone()
+                if old is not None:
+                    db.execute('DELETE FROM refs WHERE bucket = ? AND key = ?', (bucket_name, object_name))
+                    self._decrement(db, old[0], unreferenced)
+        return unreferenced
+
+    def garbage(self):
+        """Unreferenced blobs that are still waiting to be removed."""
+        return [row[0] for row in self._db().execute('SELECT key FROM garbage')]
+
+    def collected(self, blob_key):
+        self._db().execute('DELETE FROM garbage WHERE key = ?', (blob_key,))
+
+    def totals(self):
+        db = self._db()
+        logical, references = db.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM refs').fetchone()
+        physical, blobs = db.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM blobs').fetchone()
+        return {'logical_bytes': logical, 'physical_bytes': physical, 'references': references, 'blobs': blobs}
+
+
+class DedupBackend(StorageBackend):
+    """Stores each distinct object body once, wrapping another backend.
+
+    ``put_object`` streams the body into ``blob_bucket`` under a fresh key,
+    hashing it on the way. If a blob with the same SHA-256 is already stored
+    the new copy is removed again; otherwise it becomes that content's blob.
+    The real key gets a zero-byte reference object so listings, bucket
+    emptiness checks and deletes keep working. Stats, reads and listings
+    resolve references through the index; a blob is deleted when the last
+    key referencing it goes away.
+
+    Objects written some other way (multipart uploads, presigned uploads,
+    anything from before dedup was enabled) are stored and served as usual.
+    """
+
+    def __init__(self, inner, index_path, blob_bucket):
+        self.inner = inner
+        self.name = inner.name
+        self.blob_bucket = blob_bucket
+        self.index = DedupIndex(index_path)
+        if callable(getattr(inner, 'open_file', None)):
+            self.open_file = self._open_file
+        if not inner.bucket_exists(blob_bucket):
+            inner.make_bucket(blob_bucket)
+        # Blobs a worker stopped before removing
+        self._collect(self.index.garbage())
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    @staticmethod
+    def new_blob_key():
+        name = uuid.uuid4().hex
+        return f'{name[:2]}/{name}'
+
+    def _remove_blob(self, blob_key):
+        try:
+            self.inner.remove_object(self.blob_bucket, blob_key)
+            return True
+        except Exception as e:
+            # An orphaned blob only costs space; the reference is already gone
+            logger.error(f"Could not remove unreferenced blob {blob_key}: {e}")
+            return False
+
+    def _collect(self, blob_keys):
+        """Remove blobs the index no longer references; runs after the index transaction."""
+        for blob_key in blob_keys:
+            if self._remove_blob(blob_key):
+                self.index.collected(blob_key)
+
+    def _resolve(self, bucket_name, object_name, stat=None):
+        """The key's reference, or None if it holds a plain object (dropping a stale reference)."""
+        ref = self.index.lookup(bucket_name, object_name)
+        if ref is not None and stat is not None and stat.size:
+            # Overwritten behind our back, e.g. through a presigned URL
+            self._collect(self.index.unbind(bucket_name, [object_name]))
+            return None
+        return ref
+
+    # Buckets
+
+    def list_buckets(self):
+        return [b for b in self.inner.list_buckets() if b.name != self.blob_bucket]
+
+    def bucket_exists(self, bucket_name):
+        return self.inner.bucket_exists(bucket_name)
+
+    def make_bucket(self, bucket_name, **kwargs):
+        return self.inner.make_bucket(bucket_name, **kwargs)
+
+    def remove_bucket(self, bucket_name):
+        return self.inner.remove_bucket(bucket_name)
+
+    # Objects
+
+    def put_object(self, bucket_name, object_name, data, length,
+                   content_type='application/octet-stream', metadata=None, part_size=0, **kwargs):
+        if not self.inner.bucket_exists(bucket_name):
+            raise storage_error('NoSuchBucket', 'The specified bucket does not exist', bucket_name)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = memoryview(data)[:length] if length >= 0 else memoryview(data)
+            data, length = io.BytesIO(data), len(data)
+        body = HashingReader(data)
+        blob_key = self.new_blob_key()
+        self.inner.put_object(self.blob_bucket, blob_key, body, length, part_size=part_size)
+        sha256, md5, size = body.sha256.hexdigest(), body.md5.hexdigest(), body.bytes_read
+        if self.index.acquire(sha256, size, blob_key) != blob_key:
+            # The same content is already stored
+            self._remove_blob(blob_key)
+
+        try:
+            # The reference object carries the user metadata (e.g. Content-Encoding)
+            self.inner.put_object(bucket_name, object_name, b'', 0, content_type=content_type, metadata=metadata)
+        except BaseException:
+            self._collect(self.index.release(sha256))
+            raise
+        self._collect(self.index.bind(bucket_name, object_name, Ref(sha256, size, md5, content_type)))
+        return WriteResult(bucket_name, object_name, md5)
+
+    def copy_object(self, bucket_name, object_name, source, metadata=None, **kwargs):
+        """Copying a reference only takes another reference on its blob."""
+        ref = self._resolve(source.bucket_name, source.object_name,
+                            self.inner.stat_object(source.bucket_name, source.object_name))
+        if ref is None:
+            result = self.inner.copy_object(bucket_name, object_name, source, metadata=metadata, **kwargs)
+            self._collect(self.index.unbind(bucket_name, [object_name]))
+            return result
+        if not self.index.reference(ref.sha256):
+            # The blob went away with the source's last reference in the meantime
+            raise storage_error('NoSuchKey', 'The specified key does not exist.',
+                                source.bucket_name, source.object_name)
+        try:
+            self.inner.copy_object(bucket_name, object_name, source, metadata=metadata, **kwargs)
+        except BaseException:
+            self._collect(self.index.release(ref.sha256))
+            raise
+        self._collect(self.index.bind(bucket_name, object_name, ref))
+        return WriteResult(bucket_name, object_name, ref.etag)
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        stat = self.inner.stat_object(bucket_name, object_name, **kwargs)
+        ref = self._resolve(bucket_name, object_name, stat)
+        if ref is None:
+            return stat
+        return StoredObject(bucket_name, object_name, size=ref.size, etag=ref.etag,
+                            last_modified=stat.last_modified, content_type=ref.content_type,
+                            metadata=stat.metadata)
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, **kwargs):
+        ref = self._resolve(bucket_name, object_name)
+        if ref is None:
+            return self.inner.get_object(bucket_name, object_name, offset=offset, length=length, **kwargs)
+        return self.inner.get_object(self.blob_bucket, ref.blob_key, offset=offset, length=length)
+
+    def _open_file(self, bucket_name, object_name):
+        ref = self._resolve(bucket_name, object_name)
+        if ref is None:
+            return self.inner.open_file(bucket_name, object_name)
+        return self.inner.open_file(self.blob_bucket, ref.blob_key)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None, **kwargs):
+        for obj in self.inner.list_objects(bucket_name, prefix=prefix, recursive=recursive,
+                                           start_after=start_after, **kwargs):
+            ref = None if obj.is_dir or obj.size else self.index.lookup(bucket_name, obj.object_name)
+            if ref is None:
+                yield obj
+            else:
+                yield StoredObject(bucket_name, obj.object_name, size=ref.size, etag=ref.etag,
+                                   last_modified=obj.last_modified, content_type=ref.content_type)
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        self.inner.remove_object(bucket_name, object_name, **kwargs)
+        self._collect(self.index.unbind(bucket_name, [object_name]))
+
+    def remove_objects(self, bucket_name, delete_object_list, **kwargs):
+        delete_object_list = list(delete_object_list)
+        errors = list(self.inner.remove_objects(bucket_name, delete_object_list, **kwargs))
+        failed = {err.name for err in errors}
+        self._collect(self.index.unbind(bucket_name,
+                                        [d._name for d in delete_object_list if d._name not in failed]))
+        return iter(errors)
+
+    # Multipart uploads are not deduplicated; completing one replaces any reference
+
+    def create_multipart_upload(self, bucket_name, object_name, headers):
+        return self.inner.create_multipart_upload(bucket_name, object_name, headers)
+
+    def upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        return self.inner.upload_part(bucket_name, object_name, data, headers, upload_id, part_number)
+
+    def list_parts(self, bucket_name, object_name, upload_id, part_number_marker=None):
+        return self.inner.list_parts(bucket_name, object_name, upload_id, part_number_marker)
+
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        result = self.inner.complete_multipart_upload(bucket_name, object_name, upload_id, parts)
+        self._collect(self.index.unbind(bucket_name, [object_name]))
+        return result
+
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        return self.inner.abort_multipart_upload(bucket_name, object_name, upload_id)
+
+    def ping(self):
+        return self.inner.ping()
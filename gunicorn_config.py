@@ -1,4 +1,101 @@
+import glob
+import importlib.util
+import math
 import os
+import time
+
+# Runtime profile. Every setting can be overridden from the environment:
+#   WEB_CONCURRENCY / GUNICORN_WORKERS  worker processes (default: from the CPUs available)
+#   GUNICORN_WORKER_CLASS               gthread (default), gevent or sync
+#   GUNICORN_THREADS                    threads per gthread worker (default 4)
+#   GUNICORN_WORKER_CONNECTIONS         concurrent requests per gevent worker (default 1000)
+#   GUNICORN_MAX_WORKERS                cap on the derived worker count (default 8)
+#   GUNICORN_PRELOAD                    import the app once in the master (default true)
+STARTED = time.monotonic()
+
+
+def available_cpus():
+    """CPUs this container may use: its cgroup quota if it has one, else the CPUs it can run on."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(int(quota) / int(period), 1)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f, open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as g:
+            quota, period = int(f.read()), int(g.read())
+        if quota > 0:
+            return max(quota / period, 1)
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+cpus = math.ceil(available_cpus())
 bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
-workers = 2
-timeout = 120
\ No newline at end of file
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Logged from on_starting, once gunicorn's logger is set up
+gevent_missing = worker_class == 'gevent' and importlib.util.find_spec('gevent') is None
+if gevent_missing:
+    worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Threaded and sync workers block on MinIO, so run two per CPU; one gevent
+# worker per CPU is enough to keep a core busy
+default_workers = cpus if worker_class == 'gevent' else 2 * cpus + 1
+workers = int(os.getenv('WEB_CONCURRENCY') or os.getenv('GUNICORN_WORKERS') or
+              max(2, min(default_workers, int(os.getenv('GUNICORN_MAX_WORKERS', 8)))))
+
+# Flask-RESTX, MinIO and Prometheus are imported once and shared copy-on-write.
+# Nothing in the app connects at import time: each worker starts its health
+# monitor after the fork and that connects to the storage backend
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Prometheus multiprocess mode: each worker writes its samples to this
+# directory and /metrics adds them up. It has to be set before the app imports
+# prometheus_client
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def on_starting(server):
+    if gevent_missing:
+        server.log.warning('gevent is not installed (pip install gevent); using gthread workers')
+    # Discard the samples of a previous run. Only prometheus_client's own
+    # files: the directory may be one the operator shares with other things
+    for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def when_ready(server):
+    server.log.info(f"Cold start: master ready in {time.monotonic() - STARTED:.2f}s "
+                    f"({workers} {worker_class} workers, {cpus} CPUs, preload {'on' if preload_app else 'off'})")
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    # Runs in the worker once the app is loaded (and gevent has patched the
+    # standard library), so the background threads are safe to start
+    from app import start_worker_tasks
+    start_worker_tasks()
+    now = time.monotonic()
+    worker.log.info(f"Cold start: worker {worker.pid} ready {now - STARTED:.2f}s after launch "
+                    f"({now - worker.forked_at:.2f}s after fork)")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,355 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, created_at);
+"""
+
+STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class JobStore:
+    """Jobs and their progress in one SQLite file under STATE_DIR.
+
+    Every worker process opens the same file. A job is claimed inside
+    BEGIN IMMEDIATE, so only one worker ever runs it, and a running job whose
+    heartbeat stops (its worker was killed or recycled) is claimed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        # A connection must not be shared with a forked child
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'params': json.loads(row['params']),
+            'state': row['state'],
+            'progress': json.loads(row['progress']),
+            'result': json.loads(row['result']) if row['result'] is not None else None,
+            'error': row['error'],
+            'attempts': row['attempts'],
+            'cancel_requested': bool(row['cancel_requested']),
+            'created_at': _isoformat(row['created_at']),
+            'started_at': _isoformat(row['started_at']),
+            'finished_at': _isoformat(row['finished_at']),
+        }
+
+    def submit(self, kind, params):
+        job_id = uuid.uuid4().hex
+        self._db().execute('INSERT INTO jobs (id, kind, params, state, created_at) VALUES (?, ?, ?, ?, ?)',
+                           (job_id, kind, json.dumps(params), 'queued', time.time()))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        return self._job(self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def list(self, state=None, limit=100):
+        """Newest first, optionally only jobs in ``state``."""
+        if state is None:
+            rows = self._db().execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,))
+        else:
+            rows = self._db().execute('SELECT * FROM jobs WHERE state = ? ORDER BY created_at DESC LIMIT ?',
+                                      (state, limit))
+        return [self._job(row) for row in rows]
+
+    def claim(self, owner, stale_after, max_attempts):
+        """Take the oldest runnable job for ``owner``, or None.
+
+        Running jobs whose owner has not sent a heartbeat for ``stale_after``
+        seconds are recovered first: re-run if they have attempts left,
+        failed otherwise.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET state = 'failed', finished_at = ?, "
+                       "error = 'Worker lost ' || attempts || ' times; giving up' "
+                       "WHERE state = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                       (now, now - stale_after, max_attempts))
+            db.execute("UPDATE jobs SET state = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                       "finished_at = CASE WHEN cancel_requested THEN ? END, owner = NULL "
+                       "WHERE state = 'running' AND heartbeat_at < ?", (now, now - stale_after))
+            row = db.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = 'running', owner = ?, attempts = attempts + 1, progress = '{}', "
+                       "started_at = ?, heartbeat_at = ? WHERE id = ?", (owner, now, now, row['id']))
+            return self._job(db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+    def heartbeat(self, job_id, owner, progress):
+        """Save progress; returns whether a cancel was requested."""
+        db = self._db()
+        db.execute('UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ? AND owner = ?',
+                   (json.dumps(progress), time.time(), job_id, owner))
+        row = db.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def finish(self, job_id, owner, state, progress, result=None, error=None):
+        self._db().execute('UPDATE jobs SET state = ?, progress = ?, result = ?, error = ?, finished_at = ? '
+                           "WHERE id = ? AND owner = ? AND state = 'running'",
+                           (state, json.dumps(progress), json.dumps(result) if result is not None else None,
+                            error, time.time(), job_id, owner))
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask the worker running it to stop. None if unknown."""
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET state = 'cancelled', cancel_requested = 1, finished_at = ? "
+                       "WHERE id = ? AND state = 'queued'", (time.time(), job_id))
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def prune(self, older_than):
+        """Forget finished jobs that ended more than ``older_than`` seconds ago."""
+        placeholders = ', '.join('?' * len(FINISHED))
+        self._db().execute(f'DELETE FROM jobs WHERE state IN ({placeholders}) AND finished_at < ?',
+                           (*FINISHED, time.time() - older_than))
+
+
+class RateLimiter:
+    """Token bucket shared by a process's job workers; ``rate`` 0 means unlimited."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= min(n, self.burst):
+                    self._tokens -= n
+                    return
+                wait = (min(n, self.burst) - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class JobContext:
+    """What a handler sees of its job: params, progress counters, throttling and cancellation."""
+
+    def __init__(self, job, limiter):
+        self.id = job['id']
+        self.kind = job.get('kind')
+        self.params = job['params']
+        self.progress = {}
+        self.cancelled = threading.Event()
+        self._limiter = limiter
+
+    def advance(self, **counters):
+        """Add to progress counters, e.g. ``advance(deleted=1)``; raises JobCancelled once cancelled."""
+        for name, value in counters.items():
+            self.progress[name] = self.progress.get(name, 0) + value
+        self.check()
+
+    def update(self, **fields):
+        """Set progress fields outright, e.g. ``update(total=n)``."""
+        self.progress.update(fields)
+        self.check()
+
+    def throttle(self, operations=1):
+        """Wait for the rate limiter before ``operations`` storage calls."""
+        self.check()
+        self._limiter.acquire(operations)
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """Runs jobs from a JobStore on a bounded pool of threads in this process.
+
+    Handlers are ``handler(ctx)`` functions registered per kind; what they
+    return becomes the job's result. A heartbeat thread saves the progress of
+    every running job each ``heartbeat_interval`` seconds and passes on
+    cancel requests. A job picked up again after its worker died starts from
+    the beginning, so handlers must be safe to re-run.
+    """
+
+    def __init__(self, store, workers=2, rate_limit=0, heartbeat_interval=2.0, stale_after=30.0,
+                 max_attempts=3, poll_interval=1.0, retention=7 * 24 * 3600):
+        self.store = store
+        self.workers = workers
+        self.limiter = RateLimiter(rate_limit)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._handlers = {}
+        self._running = {}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def register(self, kind, handler, required=()):
+        self._handlers[kind] = (handler, tuple(required))
+
+    @property
+    def kinds(self):
+        return sorted(self._handlers)
+
+    def submit(self, kind, params):
+        """Queue a job; ValueError for an unknown kind or missing parameters."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind {kind!r}; expected one of {', '.join(self.kinds)}")
+        missing = [name for name in self._handlers[kind][1] if params.get(name) in (None, '')]
+        if missing:
+            raise ValueError(f"{kind} needs {', '.join(missing)}")
+        job = self.store.submit(kind, params)
+        self._wakeup.set()
+        return job
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self.running or self.workers <= 0:
+            return
+        with self._lock:
+            if self.running:
+                return
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._beat, name='job-heartbeat', daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def _owner(self):
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+    def _work(self):
+        while True:
+            try:
+                ran = self.run_next()
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _beat(self):
+        pruned = 0
+        while True:
+            time.sleep(self.heartbeat_interval)
+            self.beat()
+            if time.monotonic() - pruned > 3600:
+                try:
+                    self.store.prune(self.retention)
+                    pruned = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Pruning finished jobs failed: {e}")
+
+    def beat(self):
+        """Save the progress of this process's running jobs and pass on cancel requests."""
+        with self._lock:
+            running = list(self._running.items())
+        for (job_id, owner), ctx in running:
+            try:
+                if self.store.heartbeat(job_id, owner, ctx.progress):
+                    ctx.cancelled.set()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed for {job_id}: {e}")
+
+    def run_next(self):
+        """Claim and run one job in the calling thread; False if none was waiting."""
+        owner = self._owner()
+        job = self.store.claim(owner, self.stale_after, self.max_attempts)
+        if job is None:
+            return False
+        handler = self._handlers.get(job['kind'], (None,))[0]
+        ctx = JobContext(job, self.limiter)
+        with self._lock:
+            self._running[(job['id'], owner)] = ctx
+        logger.info(f"Job {job['id']} ({job['kind']}) started, attempt {job['attempts']}")
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind {job['kind']!r} in this worker")
+            result = handler(ctx)
+        except JobCancelled:
+            logger.info(f"Job {job['id']} cancelled")
+            self.store.finish(job['id'], owner, 'cancelled', ctx.progress)
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            self.store.finish(job['id'], owner, 'failed', ctx.progress, error=str(e))
+        else:
+            logger.info(f"Job {job['id']} ({job['kind']}) succeeded")
+            self.store.finish(job['id'], owner, 'succeeded', ctx.progress, result=result)
+        finally:
+            with self._lock:
+                self._running.pop((job['id'], owner), None)
+        return True
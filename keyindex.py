@@ -0,0 +1,278 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+INDEX_PAGE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _successor(prefix):
+    """Smallest string sorting after every key that starts with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+
+class IndexMissing(LookupError):
+    """The bucket's index was dropped (or never built); list the backend instead."""
+
+
+class BucketIndex:
+    """One bucket's keys in sorted order, with (size, mtime) per key."""
+
+    __slots__ = ('keys', 'meta', 'generation', 'offset', 'journal_entries')
+
+    def __init__(self, rows, generation):
+        self.keys = [row[0] for row in rows]
+        self.meta = {row[0]: (row[1], row[2]) for row in rows}
+        self.generation = generation
+        self.offset = 0
+        self.journal_entries = 0
+
+    def apply(self, event):
+        key = event['key']
+        if event['op'] == 'put':
+            if key not in self.meta:
+                insort(self.keys, key)
+            self.meta[key] = (event['size'], event['mtime'])
+        elif self.meta.pop(key, None) is not None:
+            del self.keys[bisect_left(self.keys, key)]
+
+    def rows(self):
+        return [[key, *self.meta[key]] for key in self.keys]
+
+
+class KeyIndex:
+    """Per-bucket sorted key index shared by every worker through files under ``root``.
+
+    For each bucket ``CURRENT`` names the live generation ``g``;
+    ``snapshot-<g>.json`` holds the sorted keys and ``journal-<g>.log`` the
+    put/delete events appended since. Workers replay the journal tail before
+    answering, so an upload handled by one worker is listed by all of them.
+    Appends, compaction and the initial build from a backend listing are
+    serialised with an flock on ``lock``.
+
+    Objects written to the backend behind the API's back are only picked up
+    when the bucket's index is rebuilt (delete its directory).
+    """
+
+    def __init__(self, root=None, compact_every=10000):
+        self.root = root
+        self.compact_every = compact_every
+        self._buckets = {}
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    # Files
+
+    def _dir(self, bucket_name):
+        return os.path.join(self.root, bucket_name)
+
+    def _path(self, bucket_name, name):
+        return os.path.join(self.root, bucket_name, name)
+
+    @contextmanager
+    def _file_lock(self, bucket_name):
+        os.makedirs(self._dir(bucket_name), exist_ok=True)
+        with open(self._path(bucket_name, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current(self, bucket_name):
+        try:
+            with open(self._path(bucket_name, 'CURRENT')) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_snapshot(self, bucket_name, rows, generation):
+        """Publish ``rows`` as a new generation; the caller holds the file lock."""
+        snapshot = self._path(bucket_name, f'snapshot-{generation}.json')
+        with open(snapshot + '.tmp', 'w') as f:
+            json.dump(rows, f, separators=(',', ':'))
+        os.replace(snapshot + '.tmp', snapshot)
+        open(self._path(bucket_name, f'journal-{generation}.log'), 'a').close()
+        with open(self._path(bucket_name, 'CURRENT.tmp'), 'w') as f:
+            f.write(str(generation))
+        os.replace(self._path(bucket_name, 'CURRENT.tmp'), self._path(bucket_name, 'CURRENT'))
+        # Every older generation, not just the previous one: generations from
+        # create() and ensure() are timestamps, not consecutive numbers
+        keep = {f'snapshot-{generation}.json', f'journal-{generation}.log'}
+        for name in os.listdir(self._dir(bucket_name)):
+            if name.startswith(('snapshot-', 'journal-')) and name not in keep:
+                try:
+                    os.unlink(self._path(bucket_name, name))
+                except FileNotFoundError:
+                    pass
+
+    def _catch_up(self, bucket_name, index):
+        path = self._path(bucket_name, f'journal-{index.generation}.log')
+        if os.path.getsize(path) <= index.offset:
+            return
+        with open(path, 'rb') as f:
+            f.seek(index.offset)
+            for line in f:
+                # A line without its newline is still being written by another worker
+                if not line.endswith(b'\n'):
+                    break
+                index.apply(json.loads(line))
+                index.offset += len(line)
+                index.journal_entries += 1
+
+    def _sync(self, bucket_name):
+        """The in-memory index brought up to date with disk, or None if never built."""
+        generation = self._current(bucket_name)
+        if generation is None:
+            self._buckets.pop(bucket_name, None)
+            return None
+        index = self._buckets.get(bucket_name)
+        if index is None or index.generation != generation:
+            try:
+                with open(self._path(bucket_name, f'snapshot-{generation}.json')) as f:
+                    index = BucketIndex(json.load(f), generation)
+            except FileNotFoundError:
+                # Compacted between reading CURRENT and opening the snapshot
+                return self._sync(bucket_name)
+            self._buckets[bucket_name] = index
+        try:
+            self._catch_up(bucket_name, index)
+        except FileNotFoundError:
+            # Journal compacted away under us: reload the new generation
+            return self._sync(bucket_name)
+        return index
+
+    # Maintenance
+
+    def ensure(self, bucket_name, list_objects):
+        """Build the bucket's index from a full backend listing unless it exists."""
+        with self._lock:
+            if self._sync(bucket_name) is not None:
+                return
+            with self._file_lock(bucket_name):
+                if self._current(bucket_name) is None:
+                    rows = sorted(
+                        [obj.object_name, obj.size or 0,
+                         obj.last_modified.timestamp() if obj.last_modified else None]
+                        for obj in list_objects()
+                    )
+                    self._write_snapshot(bucket_name, rows, time.time_ns())
+                self._sync(bucket_name)
+
+    def create(self, bucket_name):
+        """Start an empty index for a bucket that was just created."""
+        with self._lock, self._file_lock(bucket_name):
+            # Time-based generations never repeat, so workers cannot mistake
+            # a re-created bucket for the index they have cached
+            self._write_snapshot(bucket_name, [], time.time_ns())
+
+    def drop(self, bucket_name):
+        with self._lock:
+            self._buckets.pop(bucket_name, None)
+            shutil.rmtree(self._dir(bucket_name), ignore_errors=True)
+
+    def _record(self, bucket_name, events):
+        try:
+            with self._lock, self._file_lock(bucket_name):
+                index = self._sync(bucket_name)
+                if index is None:
+                    # Not built yet: the first listing will see these changes in the backend
+                    return
+                data = b''.join((json.dumps(e, separators=(',', ':')) + '\n').encode() for e in events)
+                with open(self._path(bucket_name, f'journal-{index.generation}.log'), 'ab') as f:
+                    # Nobody else is writing, so bytes past the last complete line
+                    # were left by a worker that died mid-append
+                    if os.fstat(f.fileno()).st_size > index.offset:
+                        f.truncate(index.offset)
+                    f.write(data)
+                for event in events:
+                    index.apply(event)
+                index.offset += len(data)
+                index.journal_entries += len(events)
+                if index.journal_entries >= self.compact_every:
+                    self._write_snapshot(bucket_name, index.rows(), index.generation + 1)
+                    index.generation += 1
+                    index.offset = index.journal_entries = 0
+        except Exception as e:
+            # The backend write already happened; a stale index is worse than a rebuild
+            logger.error(f"Key index update for {bucket_name} failed, dropping it: {e}")
+            self.drop(bucket_name)
+
+    def record_put(self, bucket_name, object_name, size, mtime):
+        if self.enabled:
+            self._record(bucket_name, [{'op': 'put', 'key': object_name, 'size': size, 'mtime': mtime}])
+
+    def record_deletes(self, bucket_name, object_names):
+        if self.enabled and object_names:
+            self._record(bucket_name, [{'op': 'delete', 'key': key} for key in object_names])
+
+    # Queries
+
+    def count(self, bucket_name, prefix='', start_after=None, end_before=None):
+        """Keys under ``prefix`` within (start_after, end_before), by two bisections."""
+        with self._lock:
+            index = self._sync(bucket_name)
+            if index is None:
+                raise IndexMissing(bucket_name)
+            keys = index.keys
+            lo = bisect_left(keys, prefix)
+            if start_after:
+                lo = max(lo, bisect_left(keys, start_after + '\0'))
+            hi = len(keys)
+            upper = _successor(prefix)
+            if upper is not None:
+                hi = bisect_left(keys, upper)
+            if end_before is not None:
+                hi = min(hi, bisect_left(keys, end_before))
+            return max(hi - lo, 0)
+
+    def entries(self, bucket_name, prefix='', delimiter='/', start_after=None, end_before=None):
+        """Yield listing entries like _listing_entry, a page at a time.
+
+        With a delimiter each common prefix costs one bisection to skip, so a
+        "directory" page touches only the entries it returns. Raises
+        IndexMissing if the index is dropped before or during the listing.
+        """
+        prefix = prefix or ''
+        resume = max(prefix, start_after + '\0') if start_after else prefix
+        while True:
+            page = []
+            with self._lock:
+                index = self._sync(bucket_name)
+                if index is None:
+                    raise IndexMissing(bucket_name)
+                keys = index.keys
+                i = bisect_left(keys, resume)
+                while i < len(keys) and len(page) < INDEX_PAGE_SIZE:
+                    key = keys[i]
+                    if not key.startswith(prefix) or (end_before is not None and key >= end_before):
+                        break
+                    slash = key.find(delimiter, len(prefix)) if delimiter else -1
+                    if slash >= 0:
+                        common = key[:slash + len(delimiter)]
+                        page.append({'prefix': common})
+                        resume = _successor(common)
+                        i = bisect_left(keys, resume)
+                        continue
+                    size, mtime = index.meta[key]
+                    page.append({
+                        'name': key,
+                        'size': size,
+                        'last_modified': datetime.fromtimestamp(mtime, tz=timezone.utc).isoformat() if mtime else None
+                    })
+                    resume = key + '\0'
+                    i += 1
+            if not page:
+                return
+            yield from page
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote
+
+from limits.storage import Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+PRUNE_EVERY = 1000
+
+
+class SQLiteStorage(Storage):
+    """Flask-Limiter counters in one SQLite file, shared by every worker on the host.
+
+    Selected with ``sqlite:///path/to/file``. Counters only matter for the
+    current window, so the file is written without fsync.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = unquote(uri.split('://', 1)[1])
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._db().executescript(SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        # A connection must not be shared with a forked child
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=OFF')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    # elastic_expiry is only passed by older versions of limits
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'INSERT INTO counters (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = CASE WHEN expires > ? THEN value + excluded.value ELSE excluded.value END, '
+                'expires = CASE WHEN expires > ? AND NOT ? THEN expires ELSE excluded.expires END',
+                (key, amount, now + expiry, now, now, bool(elastic_expiry))
+            )
+            value = db.execute('SELECT value FROM counters WHERE key = ?', (key,)).fetchone()[0]
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                db.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def get(self, key):
+        row = self._db().execute('SELECT value FROM counters WHERE key = ? AND expires > ?',
+                                 (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._db().execute('SELECT expires FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row and row[0] > time.time() else time.time()
+
+    def check(self):
+        try:
+            self._db().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._db().execute('DELETE FROM counters').rowcount
+
+    def clear(self, key):
+        self._db().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+
+class ConcurrencyLimit:
+    """Caps the requests of one worker that are using the storage backend at once.
+
+    Requests that find every slot taken are refused straight away instead of
+    queueing behind MinIO; ``limit`` 0 means no cap.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_use += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        if self._slots is not None:
+            self._slots.release()
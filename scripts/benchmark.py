@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""Load-test the /api/v1 endpoints and report latency percentiles and throughput as JSON.
+
+By default the app is driven in-process against the in-memory storage engine,
+so a run needs no MinIO and no network:
+
+    python scripts/benchmark.py --concurrency 8 --output bench.json
+    python scripts/benchmark.py --baseline bench.json --fail-on-regression
+
+Point --url at a running server (gunicorn or uvicorn) to measure the real
+stack instead; --backend filesystem benchmarks the embedded file engine.
+--servers gunicorn,uvicorn starts each server in turn on the same storage and
+compares the second with the first:
+
+    python scripts/benchmark.py --servers gunicorn,uvicorn --concurrency 32
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNITS = {'b': 1, 'kib': 1024, 'kb': 1000, 'mib': 1024 ** 2, 'mb': 1000 ** 2, 'gib': 1024 ** 3}
+DEFAULT_SCENARIOS = 'create_bucket,upload,download,list,list_prefix,stats'
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * UNITS[unit])
+    return int(text)
+
+
+def format_size(size):
+    for unit, factor in (('MiB', 1024 ** 2), ('KiB', 1024)):
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{unit}'
+    return f'{size}B'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class HttpTarget:
+    """A running server, reached over a shared urllib3 pool."""
+
+    def __init__(self, url, concurrency):
+        import urllib3
+        self.base_url = url.rstrip('/')
+        self.pool = urllib3.PoolManager(maxsize=concurrency, block=True, retries=False)
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.pool.request(method, self.base_url + path, body=body, headers=headers,
+                                     preload_content=False)
+        received = 0
+        for chunk in response.stream(64 * 1024):
+            received += len(chunk)
+        response.release_conn()
+        return response.status, received
+
+    def seed(self, bucket, keys, body):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(lambda key: self.request('PUT', f'/api/v1/buckets/{bucket}/objects/{key}', body), keys))
+
+    def describe(self):
+        return {'mode': 'http', 'url': self.base_url}
+
+
+class ServerTarget(HttpTarget):
+    """gunicorn (app.py) or uvicorn (asgi.py) started on a free local port for one run."""
+
+    COMMANDS = {
+        'gunicorn': lambda port, workers: [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+                                           'app:app'],
+        'uvicorn': lambda port, workers: [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                                          '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+    }
+
+    def __init__(self, server, workers, concurrency, env):
+        if server not in self.COMMANDS:
+            raise SystemExit(f'Unknown server {server!r}; choose from {", ".join(self.COMMANDS)}')
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.server = server
+        self.workers = workers
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            self.COMMANDS[server](port, workers), cwd=ROOT, stdout=self.log, stderr=subprocess.STDOUT,
+            env={**os.environ, **env, 'PORT': str(port), 'WEB_CONCURRENCY': str(workers)}
+        )
+        super().__init__(f'http://127.0.0.1:{port}', concurrency)
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.poll() is None:
+            try:
+                if self.request('GET', '/health/ready')[0] == 200:
+                    return
+            except Exception:
+                pass
+            time.sleep(0.2)
+        self.close()
+        self.log.seek(0)
+        raise SystemExit(f'{self.server} did not become ready:\n{self.log.read().decode(errors="replace")[-2000:]}')
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.pool.clear()
+
+    def describe(self):
+        return {'mode': 'server', 'server': self.server, 'workers': self.workers, 'url': self.base_url}
+
+
+class InProcessTarget:
+    """The Flask app itself, driven through one werkzeug test client per thread."""
+
+    def __init__(self, backend, path=None):
+        self.backend = backend
+        self.path = path or (tempfile.mkdtemp(prefix='s3sim-bench-') if backend == 'filesystem' else None)
+        os.environ.setdefault('STORAGE_BACKEND', backend)
+        # Every request comes from one client, which the rate limits would throttle
+        os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+        if self.path:
+            os.environ.setdefault('STORAGE_PATH', self.path)
+        sys.path.insert(0, ROOT)
+        from app import app, s3_client
+        from storage import create_backend
+
+        # Per-request INFO logs would end up measuring the log handler
+        logging.getLogger('app').setLevel(logging.WARNING)
+        s3_client.backend = backend
+        s3_client.client = create_backend(backend, self.path)
+        s3_client.connected = True
+        self.app = app
+        self.s3_client = s3_client
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, headers=headers)
+        received = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return response.status_code, received
+
+    def seed(self, bucket, keys, body):
+        # Straight into the engine: pushing 10^6 keys through HTTP would dominate the run
+        backend = self.s3_client.client
+        if not backend.bucket_exists(bucket):
+            backend.make_bucket(bucket)
+        for key in keys:
+            backend.put_object(bucket, key, body, len(body))
+        self.s3_client.stats.request_rescan()
+
+    def describe(self):
+        return {'mode': 'in-process', 'backend': self.backend}
+
+
+class Scenario:
+    def __init__(self, name, make_request, setup=None):
+        self.name = name
+        self.make_request = make_request
+        self.setup = setup
+
+
+def build_scenarios(target, names, sizes, list_keys, run_id):
+    bucket = f'bench-{run_id}'
+    list_bucket = f'bench-list-{run_id}'
+    scenarios = []
+    created = set()
+    bucket_counter = itertools.count()
+
+    def ensure_bucket(name):
+        if name not in created:
+            created.add(name)
+            target.request('POST', '/api/v1/buckets/', json.dumps({'bucket_name': name}).encode(),
+                           {'Content-Type': 'application/json'})
+
+    def seed_listing():
+        if list_bucket not in created:
+            created.add(list_bucket)
+            target.seed(list_bucket, (f'dir-{i % 100:03d}/key-{i:08d}' for i in range(list_keys)), b'x')
+
+    for name in names:
+        if name == 'create_bucket':
+            scenarios.append(Scenario(name, lambda: (
+                'POST', '/api/v1/buckets/', json.dumps({'bucket_name': f'{bucket}-b{next(bucket_counter)}'}).encode(),
+                {'Content-Type': 'application/json'}
+            )))
+        elif name in ('upload', 'download'):
+            for size in sizes:
+                body = os.urandom(size)
+                label = f'{name}_{format_size(size)}'
+                if name == 'upload':
+                    counter = itertools.count()
+                    scenarios.append(Scenario(label, lambda n=counter, body=body, label=label: (
+                        'PUT', f'/api/v1/buckets/{bucket}/objects/{label}/{next(n)}', body, None
+                    ), setup=lambda: ensure_bucket(bucket)))
+                else:
+                    key = f'{label}/object'
+                    scenarios.append(Scenario(label, lambda key=key: (
+                        'GET', f'/api/v1/buckets/{bucket}/objects/{key}', None, None
+                    ), setup=lambda key=key, body=body: (
+                        ensure_bucket(bucket),
+                        target.request('PUT', f'/api/v1/buckets/{bucket}/objects/{key}', body)
+                    )))
+        elif name == 'range':
+            # Ranged GETs of the first KiB; the ASGI server hands these to the Flask app
+            for size in sizes:
+                key = f'range_{format_size(size)}/object'
+                scenarios.append(Scenario(f'range_{format_size(size)}', lambda key=key: (
+                    'GET', f'/api/v1/buckets/{bucket}/objects/{key}', None, {'Range': 'bytes=0-1023'}
+                ), setup=lambda key=key, body=os.urandom(size): (
+                    ensure_bucket(bucket),
+                    target.request('PUT', f'/api/v1/buckets/{bucket}/objects/{key}', body)
+                )))
+        elif name == 'list':
+            scenarios.append(Scenario(f'list_{list_keys}_keys', lambda: (
+                'GET', f'/api/v1/buckets/{list_bucket}/objects?delimiter=&max-keys=1000', None, None
+            ), setup=seed_listing))
+        elif name == 'list_prefix':
+            counter = itertools.count()
+            scenarios.append(Scenario(f'list_prefix_{list_keys}_keys', lambda n=counter: (
+                'GET', f'/api/v1/buckets/{list_bucket}/objects?prefix=dir-{next(n) % 100:03d}/&max-keys=100',
+                None, None
+            ), setup=seed_listing))
+        elif name == 'stats':
+            scenarios.append(Scenario(name, lambda: ('GET', '/api/v1/stats/', None, None)))
+        else:
+            raise SystemExit(f'Unknown scenario {name!r}')
+
+    def cleanup():
+        created.update(f'{bucket}-b{i}' for i in range(next(bucket_counter)))
+        for name in created:
+            target.request('DELETE', f'/api/v1/buckets/{name}?force=true')
+    return scenarios, cleanup
+
+
+def run_scenario(target, scenario, concurrency, requests, duration, warmup):
+    """Hammer one scenario from ``concurrency`` threads and summarise the latencies."""
+    if scenario.setup:
+        scenario.setup()
+    for _ in range(warmup):
+        target.request(*scenario.make_request())
+
+    issued = itertools.count()
+    lock = threading.Lock()
+    latencies, errors, transferred = [], [0], [0]
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        local_latencies, local_errors, local_bytes = [], 0, 0
+        while True:
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    break
+            elif next(issued) >= requests:
+                break
+            method, path, body, headers = scenario.make_request()
+            started = time.perf_counter()
+            try:
+                status, received = target.request(method, path, body, headers)
+            except Exception:
+                status, received = None, 0
+            local_latencies.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                local_errors += 1
+            local_bytes += received + (len(body) if body else 0)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            transferred[0] += local_bytes
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mb_per_sec': round(transferred[0] / elapsed / 1024 / 1024, 3) if elapsed else None,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None)
+        }
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Per-scenario change against a stored run; slower p95 or lower req/s beyond tolerance is a regression."""
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        change = lambda new, old: round((new - old) / old * 100, 1) if new is not None and old else None
+        p95_change = change(current['latency_ms']['p95'], previous['latency_ms']['p95'])
+        rps_change = change(current['requests_per_sec'], previous['requests_per_sec'])
+        comparison[name] = {
+            'p50_change_pct': change(current['latency_ms']['p50'], previous['latency_ms']['p50']),
+            'p95_change_pct': p95_change,
+            'p99_change_pct': change(current['latency_ms']['p99'], previous['latency_ms']['p99']),
+            'requests_per_sec_change_pct': rps_change,
+            'regression': bool((p95_change or 0) > tolerance or (rps_change or 0) < -tolerance)
+        }
+    return comparison
+
+
+def run_all(target, args, names, sizes):
+    scenarios, cleanup = build_scenarios(target, names, sizes, args.list_keys, uuid.uuid4().hex[:8])
+    results = {}
+    try:
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(target, scenario, args.concurrency, args.requests,
+                                                  args.duration, args.warmup)
+            print(f'{scenario.name}: {results[scenario.name]["requests_per_sec"]} req/s, '
+                  f'p95 {results[scenario.name]["latency_ms"]["p95"]} ms', file=sys.stderr)
+    finally:
+        cleanup()
+    return results
+
+
+def compare_servers(args, names, sizes):
+    """Run the scenarios on each of ``args.servers`` in turn, all on one storage directory."""
+    servers = [s.strip() for s in args.servers.split(',') if s.strip()]
+    backend = args.backend or 'filesystem'
+    if backend == 'memory' and args.workers > 1:
+        raise SystemExit('The memory engine is per process; use --backend filesystem with several workers')
+    path = args.storage_path or tempfile.mkdtemp(prefix='s3sim-bench-')
+    env = {
+        'STORAGE_BACKEND': backend,
+        'STORAGE_PATH': path,
+        'STATE_DIR': os.path.join(path, '.state'),
+        'PROMETHEUS_MULTIPROC_DIR': tempfile.mkdtemp(prefix='s3sim-bench-metrics-'),
+        # Every request comes from one client, which the rate limits would throttle
+        'RATE_LIMIT_ENABLED': 'false',
+    }
+    runs = {}
+    for server in servers:
+        target = ServerTarget(server, args.workers, args.concurrency, env)
+        try:
+            print(f'--- {server} ({args.workers} workers, {backend})', file=sys.stderr)
+            runs[server] = {'target': target.describe(), 'scenarios': run_all(target, args, names, sizes)}
+        finally:
+            target.close()
+    report = {'servers': runs}
+    if len(servers) >= 2:
+        first, second = servers[0], servers[1]
+        report['comparison'] = {'baseline': first, 'candidate': second,
+                                'scenarios': compare(runs[second]['scenarios'], runs[first], args.tolerance)}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process app')
+    parser.add_argument('--servers', help='Start these servers in turn (gunicorn,uvicorn) and compare them')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes per server with --servers')
+    parser.add_argument('--backend', choices=['memory', 'filesystem'],
+                        help='Storage engine (default: memory in-process, filesystem with --servers)')
+    parser.add_argument('--storage-path', help='Directory for the filesystem engine (default: a temp dir)')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help=f'Comma-separated (default: {DEFAULT_SCENARIOS})')
+    parser.add_argument('--sizes', default='1KiB,64KiB,1MiB', help='Object sizes for upload/download')
+    parser.add_argument('--list-keys', type=int, default=1000, help='Keys seeded for the listing scenarios')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--duration', type=float, help='Seconds per scenario (overrides --requests)')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests before each scenario')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='Compare against a previous JSON report')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Allowed regression in percent')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if any scenario regressed')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    meta = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'concurrency': args.concurrency,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+    regressed = False
+    if args.servers:
+        report = {'meta': meta, **compare_servers(args, names, sizes)}
+    else:
+        if args.url:
+            target = HttpTarget(args.url, args.concurrency)
+        else:
+            target = InProcessTarget(args.backend or 'memory', args.storage_path)
+        results = run_all(target, args, names, sizes)
+        report = {'meta': {**meta, 'target': target.describe()}, 'scenarios': results}
+    if args.baseline and not args.servers:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(results, json.load(f), args.tolerance)
+        regressed = any(c['regression'] for c in report['comparison'].values())
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
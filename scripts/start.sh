@@ -2,6 +2,13 @@
 set -e
 set -x
 
+# The embedded storage engines need no MinIO process
+if [ "${STORAGE_BACKEND:-minio}" != "minio" ]; then
+    mkdir -p "${STORAGE_PATH:-/data}"
+    SKIP_MINIO=1
+fi
+
+if [ -z "$SKIP_MINIO" ]; then
 # Start MinIO in the background, redirecting logs
 echo "Starting MinIO server..."
 mkdir -p /data
@@ -37,6 +44,7 @@ if [ $timeout -eq 0 ]; then
     echo "=================="
     exit 1
 fi
+fi
 
 # Configure MinIO alias (optional, for debugging)
 # mc alias set local http://localhost:9000 $MINIO_ROOT_USER $MINIO_ROOT_PASSWORD
@@ -45,6 +53,11 @@ fi
 # Note: We'll handle bucket creation in the app code or here if needed
 # mc mb local/my-bucket || true
 
-# Start Flask App
+# Start Flask App (SERVER_MODE=asgi serves the same API from asgi.py under uvicorn)
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    echo "Starting ASGI application..."
+    exec uvicorn asgi:application --host 0.0.0.0 --port "${PORT:-5000}" --workers "${WEB_CONCURRENCY:-2}"
+fi
+
 echo "Starting Flask application..."
 exec gunicorn --config gunicorn_config.py app:app
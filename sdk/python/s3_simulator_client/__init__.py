@@ -1,34 +1,72 @@
 import requests
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .errors import ChecksumMismatchError, MultipartUploadError
+from .transfer import AsyncTransferManager, TransferManager, chunk_size_for
 
 class S3SimulatorClient:
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, pool_maxsize=10, max_retries=3, backoff_factor=0.2):
         self.base_url = base_url or os.environ.get('S3_SIMULATOR_URL', 'http://localhost:5000/api/v1/s3')
+        # One keep-alive pool per client, shared by the thread-pool helpers
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+        # Idempotent requests are retried on connection errors and busy/unavailable
+        # answers, after Retry-After; once retries run out the last answer is
+        # returned, so raise_for_status reports its status
+        adapter = HTTPAdapter(
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(total=max_retries, backoff_factor=backoff_factor,
+                              status_forcelist=[429, 502, 503, 504], raise_on_status=False) if max_retries else 0
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def list_buckets(self):
         """List all buckets."""
-        response = requests.get(f"{self.base_url}/buckets")
+        response = self.session.get(f"{self.base_url}/buckets")
         response.raise_for_status()
         return response.json()
 
     def create_bucket(self, bucket_name):
         """Create a new bucket."""
-        response = requests.post(f"{self.base_url}/buckets", json={'name': bucket_name})
+        response = self.session.post(f"{self.base_url}/buckets", json={'name': bucket_name})
         response.raise_for_status()
         return response.json()
 
     def delete_bucket(self, bucket_name):
         """Delete a bucket."""
-        response = requests.delete(f"{self.base_url}/buckets/{bucket_name}")
+        response = self.session.delete(f"{self.base_url}/buckets/{bucket_name}")
         response.raise_for_status()
         return response.json()
 
-    def list_objects(self, bucket_name):
-        """List objects in a bucket."""
-        response = requests.get(f"{self.base_url}/buckets/{bucket_name}/objects")
+    def list_objects(self, bucket_name, prefix=None, delimiter=None, max_keys=None, continuation_token=None):
+        """List one page of objects in a bucket."""
+        params = {'prefix': prefix, 'delimiter': delimiter, 'max-keys': max_keys,
+                  'continuation-token': continuation_token}
+        params = {k: v for k, v in params.items() if v is not None}
+        response = self.session.get(f"{self.base_url}/buckets/{bucket_name}/objects", params=params)
         response.raise_for_status()
         return response.json()
 
+    def iter_objects(self, bucket_name, prefix=None, delimiter=''):
+        """Iterate over every object under a prefix, following continuation tokens."""
+        token = None
+        while True:
+            page = self.list_objects(bucket_name, prefix, delimiter, continuation_token=token)
+            for obj in page.get('objects', []):
+                yield obj
+            token = page.get('next_continuation_token')
+            if not token:
+                return
+
     def upload_file(self, bucket_name, file_path, object_name=None):
         """Upload a file to a bucket."""
         if object_name is None:
@@ -36,14 +74,68 @@ class S3SimulatorClient:
             
         with open(file_path, 'rb') as f:
             files = {'file': (object_name, f)}
-            response = requests.post(f"{self.base_url}/buckets/{bucket_name}/objects", files=files)
+            response = self.session.post(f"{self.base_url}/buckets/{bucket_name}/objects", files=files)
             
         response.raise_for_status()
         return response.json()
 
+    def upload_file_parallel(self, bucket_name, file_path, object_name=None,
+                             part_size=8 * 1024 * 1024, max_workers=4, upload_id=None):
+        """Upload a file as a multipart upload, sending up to max_workers parts at once.
+
+        Pass the upload_id of an interrupted upload to resume it: parts already
+        stored with a matching ETag are not sent again.
+        """
+        if object_name is None:
+            object_name = os.path.basename(file_path)
+        params = {'bucket': bucket_name, 'key': object_name}
+        # More threads than pooled connections would just churn connections
+        max_workers = min(max_workers, self.pool_maxsize)
+
+        uploaded = {}
+        if upload_id is None:
+            response = self.session.post(f"{self.base_url}/multipart/", json=params)
+            response.raise_for_status()
+            upload_id = response.json()['upload_id']
+        else:
+            response = self.session.get(f"{self.base_url}/multipart/{upload_id}", params=params)
+            response.raise_for_status()
+            uploaded = {p['part_number']: p['etag'] for p in response.json()['parts']}
+
+        size = os.path.getsize(file_path)
+        part_numbers = range(1, max(1, -(-size // part_size)) + 1)
+
+        def upload_part(part_number):
+            with open(file_path, 'rb') as f:
+                f.seek((part_number - 1) * part_size)
+                data = f.read(part_size)
+            if uploaded.get(part_number) == hashlib.md5(data).hexdigest():
+                return
+            response = self.session.put(f"{self.base_url}/multipart/{upload_id}/parts/{part_number}",
+                                    params=params, data=data)
+            response.raise_for_status()
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(upload_part, part_numbers))
+
+            response = self.session.post(f"{self.base_url}/multipart/{upload_id}/complete",
+                                     params=params, json={'parts': list(part_numbers)})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise MultipartUploadError(upload_id, e) from e
+        return response.json()
+
+    def abort_upload(self, bucket_name, object_name, upload_id):
+        """Abort a multipart upload and discard its parts."""
+        response = self.session.delete(f"{self.base_url}/multipart/{upload_id}",
+                                   params={'bucket': bucket_name, 'key': object_name})
+        response.raise_for_status()
+        return response.json()
+
     def download_file(self, bucket_name, object_name, download_path):
         """Download a file from a bucket."""
-        response = requests.get(f"{self.base_url}/buckets/{bucket_name}/objects/{object_name}", stream=True)
+        response = self.session.get(f"{self.base_url}/buckets/{bucket_name}/objects/{object_name}", stream=True)
         response.raise_for_status()
         
         with open(download_path, 'wb') as f:
@@ -51,8 +143,202 @@ class S3SimulatorClient:
                 f.write(chunk)
         return download_path
 
+    def download_file_parallel(self, bucket_name, object_name, download_path,
+                               part_size=8 * 1024 * 1024, max_workers=4, retries=3, verify=True):
+        """Download a file as concurrent byte ranges written straight to their offsets.
+
+        The file is preallocated and each range is written in place as it
+        arrives, so throughput scales with max_workers. A range that drops
+        mid-transfer resumes from the last byte received. Ranges carry If-Range,
+        so an object replaced during the download fails it rather than mixing
+        versions. With verify, the file is checked against a plain MD5 ETag
+        (multipart ETags only get the size check). Objects that are small or
+        not range-addressable are downloaded in one stream.
+        """
+        url = f"{self.base_url}/buckets/{bucket_name}/objects/{quote(object_name)}"
+        response = self.session.head(url)
+        response.raise_for_status()
+        size = int(response.headers.get('Content-Length') or 0)
+        etag = response.headers.get('ETag', '')
+        if response.headers.get('Accept-Ranges') != 'bytes' or not etag or size <= part_size:
+            return self.download_file(bucket_name, object_name, download_path)
+        max_workers = min(max_workers, self.pool_maxsize)
+        ranges = [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+        tmp = download_path + '.s3part'
+        write_lock = threading.Lock()
+
+        def write_at(fd, data, offset):
+            if hasattr(os, 'pwrite'):
+                os.pwrite(fd, data, offset)
+            else:
+                with write_lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, data)
+
+        def fetch(fd, start, stop):
+            offset = start
+            for attempt in range(retries + 1):
+                try:
+                    with self.session.get(url, stream=True, headers={
+                        'Range': f'bytes={offset}-{stop - 1}', 'If-Range': etag,
+                        'Accept-Encoding': 'identity'
+                    }) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise ChecksumMismatchError(download_path, etag, 'object changed during download')
+                        for chunk in response.iter_content(chunk_size=chunk_size_for(stop - start)):
+                            write_at(fd, chunk, offset)
+                            offset += len(chunk)
+                    if offset != stop:
+                        raise requests.ConnectionError(f'range {start}-{stop - 1} ended at {offset}')
+                    return
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                    if attempt == retries:
+                        raise
+                    time.sleep(0.2 * 2 ** attempt)
+
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            try:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    futures = [pool.submit(fetch, fd, start, stop) for start, stop in ranges]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            finally:
+                os.close(fd)
+            if os.path.getsize(tmp) != size:
+                raise ChecksumMismatchError(download_path, f'{size} bytes', f'{os.path.getsize(tmp)} bytes')
+            expected = etag.strip('"')
+            if verify and '-' not in expected:
+                md5 = hashlib.md5()
+                with open(tmp, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        md5.update(block)
+                if md5.hexdigest() != expected:
+                    raise ChecksumMismatchError(download_path, expected, md5.hexdigest())
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        os.replace(tmp, download_path)
+        return download_path
+
+    def presign_url(self, bucket_name, object_name, method='GET', expires=None):
+        """Get a URL that GETs or PUTs the object directly on the object store."""
+        payload = {'bucket': bucket_name, 'key': object_name, 'method': method}
+        if expires is not None:
+            payload['expires'] = expires
+        response = self.session.post(f"{self.base_url}/presign/", json=payload)
+        response.raise_for_status()
+        return response.json()['url']
+
+    def presign_post(self, bucket_name, object_name=None, prefix=None, max_size=None, content_type=None,
+                     expires=None):
+        """Get a POST policy (url and form fields) for a browser form upload to the object store."""
+        payload = {'bucket': bucket_name, 'key': object_name, 'prefix': prefix, 'max_size': max_size,
+                   'content_type': content_type, 'expires': expires}
+        response = self.session.post(f"{self.base_url}/presign/post",
+                                     json={k: v for k, v in payload.items() if v is not None})
+        response.raise_for_status()
+        return response.json()
+
+    def upload_file_presigned(self, bucket_name, file_path, object_name=None, expires=None):
+        """Upload a file straight to the object store, then register it with the API.
+
+        The bytes never pass through the API server. Needs the server to run on
+        MinIO with MINIO_PUBLIC_ENDPOINT set.
+        """
+        if object_name is None:
+            object_name = os.path.basename(file_path)
+        url = self.presign_url(bucket_name, object_name, 'PUT', expires)
+        with open(file_path, 'rb') as f:
+            response = self.session.put(url, data=f)
+        response.raise_for_status()
+
+        response = self.session.post(f"{self.base_url}/presign/complete",
+                                     json={'bucket': bucket_name, 'key': object_name})
+        response.raise_for_status()
+        return response.json()
+
+    def download_file_presigned(self, bucket_name, object_name, download_path, expires=None):
+        """Download a file straight from the object store."""
+        url = self.presign_url(bucket_name, object_name, 'GET', expires)
+        response = self.session.get(url, stream=True)
+        response.raise_for_status()
+
+        with open(download_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+        return download_path
+
     def delete_object(self, bucket_name, object_name):
         """Delete an object from a bucket."""
-        response = requests.delete(f"{self.base_url}/buckets/{bucket_name}/objects/{object_name}")
+        response = self.session.delete(f"{self.base_url}/buckets/{bucket_name}/objects/{object_name}")
+        response.raise_for_status()
+        return response.json()
+
+    def submit_job(self, kind, **params):
+        """Queue a background job, e.g. ``submit_job('delete_prefix', bucket='logs', prefix='2023/')``."""
+        response = self.session.post(f"{self.base_url}/jobs/", json={'kind': kind, 'params': params})
         response.raise_for_status()
         return response.json()
+
+    def get_job(self, job_id):
+        """Current state, progress and result of a job."""
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def cancel_job(self, job_id):
+        """Cancel a queued job, or ask a running one to stop."""
+        response = self.session.post(f"{self.base_url}/jobs/{job_id}/cancel")
+        response.raise_for_status()
+        return response.json()
+
+    def wait_for_job(self, job_id, poll_interval=1.0, timeout=None):
+        """Poll a job until it finishes and return it; TimeoutError after ``timeout`` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job['state'] in ('succeeded', 'failed', 'cancelled'):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} still {job['state']} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def copy_object(self, bucket_name, object_name, dest_key, dest_bucket=None):
+        """Copy an object inside the object store; no bytes go through the client or API."""
+        payload = {'bucket': bucket_name, 'key': object_name, 'dest_key': dest_key, 'dest_bucket': dest_bucket}
+        response = self.session.post(f"{self.base_url}/copy/",
+                                     json={k: v for k, v in payload.items() if v is not None})
+        response.raise_for_status()
+        return response.json()
+
+    def copy_prefix(self, bucket_name, prefix, dest_prefix='', dest_bucket=None, move=False):
+        """Copy (or with ``move``, rename) every key under a prefix as a background job; returns the job."""
+        payload = {'bucket': bucket_name, 'prefix': prefix, 'dest_prefix': dest_prefix, 'async': True}
+        if dest_bucket is not None:
+            payload['dest_bucket'] = dest_bucket
+        response = self.session.post(f"{self.base_url}/copy/{'rename-prefix' if move else 'prefix'}", json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def without_retries(self):
+        """A client for the same server whose requests are tried once, for callers that retry themselves."""
+        client = S3SimulatorClient(self.base_url, pool_maxsize=self.pool_maxsize, max_retries=0)
+        client.session.headers.update(self.session.headers)
+        client.session.auth = self.session.auth
+        return client
+
+    def transfer_manager(self, **options):
+        """A TransferManager for directory uploads, prefix downloads and syncs through this client."""
+        return TransferManager(self, **options)
@@ -0,0 +1,16 @@
+class MultipartUploadError(Exception):
+    """Raised when a parallel upload fails; ``upload_id`` can be passed back to resume it."""
+
+    def __init__(self, upload_id, cause):
+        super().__init__(f"Multipart upload {upload_id} failed: {cause}")
+        self.upload_id = upload_id
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a downloaded file does not match the object it was read from."""
+
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path}: expected {expected}, got {actual}")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
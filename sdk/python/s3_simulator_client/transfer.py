@@ -0,0 +1,438 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from urllib.parse import quote
+
+import requests
+
+from .errors import ChecksumMismatchError, MultipartUploadError
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 1000
+DELETE_BATCH_SIZE = 1000  # bulk delete endpoint limit
+MAX_PART_WORKERS = 4  # parts of one large file in flight
+
+
+def chunk_size_for(size):
+    """Read/write block for an object of ``size`` bytes: about 1/16 of it, within 64 KiB-8 MiB."""
+    return min(max((size or 0) // 16, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def part_size_for(size):
+    """Multipart part size that keeps a file under MAX_PARTS parts, in whole MiB."""
+    mib = 1024 * 1024
+    return max(MIN_PART_SIZE, -(-size // MAX_PARTS // mib) * mib)
+
+
+def _timestamp(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MAX_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TransferSummary:
+    """Counters for one upload_directory/download_prefix/sync run."""
+
+    def __init__(self, total_files=0, total_bytes=0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.transferred = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.bytes = 0
+        self.failed = {}
+        self._lock = threading.Lock()
+
+    def record(self, action, size=0, key=None, error=None):
+        with self._lock:
+            if error is not None:
+                self.failed[key] = error
+            elif action == 'skip':
+                self.skipped += 1
+            elif action == 'delete':
+                self.deleted += 1
+            else:
+                self.transferred += 1
+                self.bytes += size
+
+    @property
+    def done_files(self):
+        return self.transferred + self.skipped + len(self.failed)
+
+    def to_dict(self):
+        return {'transferred': self.transferred, 'skipped': self.skipped, 'deleted': self.deleted,
+                'bytes': self.bytes, 'failed': dict(self.failed)}
+
+
+class TransferManager:
+    """Moves whole directories to and from a bucket on a pool of ``workers`` threads.
+
+    Files that have not changed (same size, destination not older; or the
+    same MD5 as the ETag with ``checksum=True``) are skipped. Each file is
+    retried up to ``retries`` times with exponential backoff and jitter,
+    honouring Retry-After. ``progress(event)`` is called after every file
+    with a dict of ``action`` ('upload', 'download', 'skip', 'delete' or
+    'error'), ``key``, ``path``, ``size`` and the running ``files_done``,
+    ``files_total``, ``bytes_done`` and ``bytes_total``.
+
+    Files over ``multipart_threshold`` move as parallel parts, with the
+    connection pool split between files so that ``workers`` files' parts
+    together never need more than ``client.pool_maxsize`` connections.
+
+    Objects stored compressed are listed with their compressed size, so
+    they always look changed unless ``checksum`` is used.
+
+    These retries are the only ones: requests go through
+    ``client.without_retries()``, so a failing request is not retried again
+    by the client's own retry policy underneath.
+    """
+
+    def __init__(self, client, workers=8, retries=4, backoff=0.5, max_backoff=30.0,
+                 multipart_threshold=64 * 1024 * 1024, checksum=False, progress=None):
+        self.client = client.without_retries()
+        # More threads than pooled connections would just churn connections, and
+        # each large file's parts share its worker's slice of the pool
+        self.workers = max(1, min(workers, client.pool_maxsize))
+        self.part_workers = max(1, min(MAX_PART_WORKERS, client.pool_maxsize // self.workers))
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.multipart_threshold = multipart_threshold
+        self.checksum = checksum
+        self.progress = progress
+
+    def _url(self, bucket_name, key):
+        return f"{self.client.base_url}/buckets/{bucket_name}/objects/{quote(key)}"
+
+    # Retries
+
+    def _delay(self, attempt, error):
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _retryable(error):
+        response = getattr(error, 'response', None)
+        if response is None:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return response.status_code == 429 or response.status_code >= 500
+
+    def _with_retries(self, fn, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args)
+            except requests.RequestException as e:
+                if attempt == self.retries or not self._retryable(e):
+                    raise
+                time.sleep(self._delay(attempt, e))
+
+    # Remote and local state
+
+    def _remote(self, bucket_name, prefix):
+        def listing():
+            return {obj['name']: obj for obj in self.client.iter_objects(bucket_name, prefix=prefix or None)}
+        return self._with_retries(listing)
+
+    @staticmethod
+    def _local(directory):
+        files = {}
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith('.s3part'):
+                    continue
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, directory).replace(os.sep, '/')] = path
+        return files
+
+    def _etag(self, bucket_name, key):
+        response = self.client.session.head(self._url(bucket_name, key))
+        response.raise_for_status()
+        return response.headers.get('ETag', '').strip('"')
+
+    def _unchanged(self, path, remote, bucket_name, key, upload):
+        """Whether the copy at the destination is already current."""
+        st = os.stat(path)
+        if remote is None or remote.get('size') != st.st_size:
+            return False
+        if self.checksum:
+            etag = self._etag(bucket_name, key)
+            # Multipart ETags are not an MD5 of the content; fall back to mtimes
+            if '-' not in etag:
+                return etag == _md5(path)
+        remote_mtime = _timestamp(remote.get('last_modified'))
+        if remote_mtime is None:
+            return False
+        # Destination not older than the source, allowing for second-resolution clocks
+        return remote_mtime >= st.st_mtime - 1 if upload else st.st_mtime >= remote_mtime - 1
+
+    # Single files
+
+    def upload_file(self, bucket_name, path, key):
+        """Upload one file: one PUT when small, a parallel multipart upload when large."""
+        size = os.path.getsize(path)
+        if size >= self.multipart_threshold:
+            upload_id = None
+            for attempt in range(self.retries + 1):
+                try:
+                    return self.client.upload_file_parallel(bucket_name, path, key, part_size=part_size_for(size),
+                                                            max_workers=self.part_workers, upload_id=upload_id)
+                except MultipartUploadError as e:
+                    if attempt == self.retries or not self._retryable(e.__cause__):
+                        raise
+                    # Resume: parts already stored are not sent again
+                    upload_id = e.upload_id
+                    time.sleep(self._delay(attempt, e.__cause__))
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            # Small files go out in a single write instead of 8 KiB blocks
+            body = f.read() if size <= MAX_CHUNK_SIZE else f
+            response = self.client.session.put(self._url(bucket_name, key), data=body,
+                                               headers={'Content-Type': content_type})
+        response.raise_for_status()
+        return response.json()
+
+    def download_file(self, bucket_name, key, path, remote=None):
+        """Download one object into ``path`` atomically, keeping the object's mtime.
+
+        Objects over ``multipart_threshold`` are fetched as parallel byte ranges.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        size = (remote or {}).get('size') or 0
+        if size >= self.multipart_threshold:
+            # A failed range fails the file, which _with_retries downloads again
+            self.client.download_file_parallel(bucket_name, key, path, part_size=part_size_for(size),
+                                               max_workers=self.part_workers, retries=0)
+            self._set_mtime(path, remote)
+            return path
+        tmp = path + '.s3part'
+        response = self.client.session.get(self._url(bucket_name, key), stream=True)
+        try:
+            response.raise_for_status()
+            size = int(response.headers.get('Content-Length') or (remote or {}).get('size') or 0)
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size_for(size)):
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        finally:
+            response.close()
+        os.replace(tmp, path)
+        self._set_mtime(path, remote)
+        return path
+
+    @staticmethod
+    def _set_mtime(path, remote):
+        mtime = _timestamp((remote or {}).get('last_modified'))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    # Plans: (action, key, path, size, remote) tuples
+
+    def _plan_upload(self, directory, bucket_name, prefix, delete):
+        remote = self._remote(bucket_name, prefix)
+        plan = []
+        for rel, path in sorted(self._local(directory).items()):
+            key = (prefix or '') + rel
+            plan.append(('upload', key, path, os.path.getsize(path), remote.pop(key, None)))
+        if delete:
+            plan.extend(('delete', key, None, 0, obj) for key, obj in sorted(remote.items()))
+        return plan
+
+    def _plan_download(self, bucket_name, prefix, directory, delete):
+        root = os.path.abspath(directory)
+        local = self._local(directory) if delete else {}
+        plan = []
+        for key, obj in sorted(self._remote(bucket_name, prefix).items()):
+            rel = key[len(prefix or ''):]
+            path = os.path.abspath(os.path.join(root, *rel.split('/')))
+            if not rel or key.endswith('/') or not path.startswith(root + os.sep):
+                plan.append(('error', key, None, 0, ValueError(f'{key} does not map to a file under {root}')))
+                continue
+            local.pop(rel, None)
+            plan.append(('download', key, path, obj.get('size') or 0, obj))
+        plan.extend(('delete', rel, path, 0, None) for rel, path in sorted(local.items()))
+        return plan
+
+    def _run_one(self, bucket_name, step):
+        """Carry out one planned transfer or local delete; returns (action, error)."""
+        action, key, path, size, remote = step
+        if action == 'error':
+            return 'error', str(remote)
+        try:
+            if action == 'upload':
+                if self._with_retries(self._unchanged, path, remote, bucket_name, key, True):
+                    return 'skip', None
+                self._with_retries(self.upload_file, bucket_name, path, key)
+            elif action == 'download':
+                if os.path.exists(path) and self._with_retries(self._unchanged, path, remote, bucket_name, key, False):
+                    return 'skip', None
+                self._with_retries(self.download_file, bucket_name, key, path, remote)
+            else:
+                os.unlink(path)
+            return action, None
+        except (requests.RequestException, MultipartUploadError, ChecksumMismatchError, OSError) as e:
+            return 'error', str(e)
+
+    def _delete_remote(self, bucket_name, keys):
+        """Delete up to 1000 keys with one bulk delete request; {key: error or None}."""
+        response = self.client.session.post(f"{self.client.base_url}/buckets/{bucket_name}/delete",
+                                            json={'keys': keys}, stream=True)
+        response.raise_for_status()
+        errors = dict.fromkeys(keys, 'not deleted')
+        for line in response.iter_lines():
+            result = json.loads(line)
+            if 'key' in result:
+                errors[result['key']] = None if result['deleted'] else result.get('error')
+        return errors
+
+    def _units(self, bucket_name, plan):
+        """Split a plan into (transfer units, delete units); a unit returns [(step, action, error)].
+
+        Deletes run only after every transfer has been tried, and remote ones
+        go out as bulk deletes of 1000 keys.
+        """
+        def single(step):
+            return lambda: [(step, *self._run_one(bucket_name, step))]
+
+        def bulk(steps):
+            def run():
+                try:
+                    errors = self._with_retries(self._delete_remote, bucket_name, [s[1] for s in steps])
+                except requests.RequestException as e:
+                    errors = dict.fromkeys((s[1] for s in steps), str(e))
+                return [(s, 'error' if errors[s[1]] else 'delete', errors[s[1]]) for s in steps]
+            return run
+
+        transfers = [single(step) for step in plan if step[0] != 'delete']
+        deletes = [single(step) for step in plan if step[0] == 'delete' and step[2] is not None]
+        remote = [step for step in plan if step[0] == 'delete' and step[2] is None]
+        deletes += [bulk(remote[i:i + DELETE_BATCH_SIZE]) for i in range(0, len(remote), DELETE_BATCH_SIZE)]
+        return transfers, deletes
+
+    def _summary(self, plan):
+        transfers = [step for step in plan if step[0] != 'delete']
+        return TransferSummary(len(transfers), sum(step[3] for step in transfers))
+
+    def _event(self, summary, step, action, error):
+        _, key, path, size, _ = step
+        summary.record(action, size, key, error)
+        return {'action': action, 'key': key, 'path': path, 'size': size, 'error': error,
+                'files_done': summary.done_files, 'files_total': summary.total_files,
+                'bytes_done': summary.bytes, 'bytes_total': summary.total_bytes}
+
+    def _execute(self, bucket_name, plan):
+        summary = self._summary(plan)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for units in self._units(bucket_name, plan):
+                for future in as_completed([pool.submit(unit) for unit in units]):
+                    for outcome in future.result():
+                        event = self._event(summary, *outcome)
+                        if self.progress is not None:
+                            self.progress(event)
+        return summary.to_dict()
+
+    # Public API
+
+    def upload_directory(self, directory, bucket_name, prefix=''):
+        """Upload every file under ``directory`` to ``prefix`` + its relative path, skipping unchanged files."""
+        return self._execute(bucket_name, self._plan_upload(directory, bucket_name, prefix, delete=False))
+
+    def download_prefix(self, bucket_name, prefix, directory):
+        """Download every object under ``prefix`` into ``directory``, skipping unchanged files."""
+        return self._execute(bucket_name, self._plan_download(bucket_name, prefix, directory, delete=False))
+
+    def sync(self, directory, bucket_name, prefix='', direction='upload', delete=False):
+        """Make the destination match the source; with ``delete`` also remove what the source lacks."""
+        if direction == 'upload':
+            plan = self._plan_upload(directory, bucket_name, prefix, delete)
+        elif direction == 'download':
+            plan = self._plan_download(bucket_name, prefix, directory, delete)
+        else:
+            raise ValueError("direction must be 'upload' or 'download'")
+        return self._execute(bucket_name, plan)
+
+
+class AsyncTransferManager:
+    """TransferManager for code running on an asyncio event loop.
+
+    Planning and each file transfer run on a thread pool so the loop is
+    never blocked, with at most ``workers`` files in flight. ``progress`` may
+    be a plain function or a coroutine function; it is called on the loop.
+    Cancelling the calling task stops new files from starting.
+    """
+
+    def __init__(self, client, workers=8, progress=None, **options):
+        self.manager = TransferManager(client, workers=workers, **options)
+        self.progress = progress
+        self._executor = ThreadPoolExecutor(max_workers=self.manager.workers + 1,
+                                            thread_name_prefix='s3sim-transfer')
+
+    async def _offload(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _execute(self, bucket_name, plan):
+        manager = self.manager
+        summary = manager._summary(plan)
+        semaphore = asyncio.Semaphore(manager.workers)
+
+        async def run(unit):
+            async with semaphore:
+                outcomes = await self._offload(unit)
+            for outcome in outcomes:
+                event = manager._event(summary, *outcome)
+                if self.progress is not None:
+                    result = self.progress(event)
+                    if asyncio.iscoroutine(result):
+                        await result
+
+        for units in manager._units(bucket_name, plan):
+            await asyncio.gather(*(run(unit) for unit in units))
+        return summary.to_dict()
+
+    async def upload_directory(self, directory, bucket_name, prefix=''):
+        plan = await self._offload(self.manager._plan_upload, directory, bucket_name, prefix, False)
+        return await self._execute(bucket_name, plan)
+
+    async def download_prefix(self, bucket_name, prefix, directory):
+        plan = await self._offload(self.manager._plan_download, bucket_name, prefix, directory, False)
+        return await self._execute(bucket_name, plan)
+
+    async def sync(self, directory, bucket_name, prefix='', direction='upload', delete=False):
+        if direction == 'upload':
+            plan = await self._offload(self.manager._plan_upload, directory, bucket_name, prefix, delete)
+        elif direction == 'download':
+            plan = await self._offload(self.manager._plan_download, bucket_name, prefix, directory, delete)
+        else:
+            raise ValueError("direction must be 'upload' or 'download'")
+        return await self._execute(bucket_name, plan)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
@@ -0,0 +1,929 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote
+
+from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteError
+from minio.error import S3Error
+
+COPY_CHUNK_SIZE = 1024 * 1024
+LIST_PAGE_SIZE = 1000
+MAX_FILENAME_LENGTH = 200
+# A directory written this recently may change again within the same mtime tick
+KEY_CACHE_QUIET_NS = 1_000_000_000
+# linux/fs.h: make the destination share the source's extents copy-on-write
+FICLONE = 0x40049409
+BUCKET_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,254}$')
+
+
+def storage_error(code, message, bucket_name=None, object_name=None):
+    """S3Error as MinIO would raise it, so callers handle every backend alike."""
+    resource = '/' + '/'.join(p for p in (bucket_name, object_name) if p)
+    return S3Error(code, message, resource, None, None, None, bucket_name, object_name)
+
+
+class StoredObject:
+    """Listing entry / stat result with the attributes of minio.datatypes.Object."""
+
+    __slots__ = ('bucket_name', 'object_name', 'size', 'etag', 'last_modified', 'content_type', 'is_dir',
+                 'metadata')
+
+    def __init__(self, bucket_name, object_name, size=None, etag=None, last_modified=None,
+                 content_type=None, is_dir=False, metadata=None):
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.is_dir = is_dir
+        self.metadata = metadata or {}
+
+
+class StoredBucket:
+    __slots__ = ('name', 'creation_date')
+
+    def __init__(self, name, creation_date=None):
+        self.name = name
+        self.creation_date = creation_date
+
+
+class WriteResult:
+    __slots__ = ('bucket_name', 'object_name', 'etag', 'version_id')
+
+    def __init__(self, bucket_name, object_name, etag):
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.etag = etag
+        self.version_id = None
+
+
+class PartsPage:
+    __slots__ = ('parts', 'is_truncated', 'next_part_number_marker')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.is_truncated = False
+        self.next_part_number_marker = None
+
+
+def multipart_etag(part_etags):
+    """ETag S3 gives a completed multipart object: md5 of the part digests plus the count."""
+    digest = hashlib.md5(b''.join(bytes.fromhex(etag.strip('"')) for etag in part_etags))
+    return f'{digest.hexdigest()}-{len(part_etags)}'
+
+
+def iter_prefix(keys, prefix=None, recursive=False, start_after=None):
+    """Walk a sorted key list from the first candidate, grouping on '/' unless recursive.
+
+    Yields ``(key, is_dir)``; common prefixes are yielded once, like S3.
+    """
+    prefix = prefix or ''
+    start = bisect_left(keys, prefix)
+    if start_after and start_after > prefix:
+        start = max(start, bisect_left(keys, start_after))
+    last_dir = None
+    for i in range(start, len(keys)):
+        key = keys[i]
+        if not key.startswith(prefix):
+            return
+        if start_after and key <= start_after:
+            continue
+        if not recursive:
+            slash = key.find('/', len(prefix))
+            if slash >= 0:
+                common = key[:slash + 1]
+                if common != last_dir:
+                    last_dir = common
+                    yield common, True
+                continue
+        yield key, False
+
+
+class StorageBackend:
+    """Operations S3Client needs from a storage engine.
+
+    The signatures follow the Minio SDK so the MinIO client can be used as
+    is; embedded engines raise S3Error with the same codes MinIO returns.
+    """
+
+    name = None
+
+    def list_buckets(self):
+        raise NotImplementedError
+
+    def bucket_exists(self, bucket_name):
+        raise NotImplementedError
+
+    def make_bucket(self, bucket_name):
+        raise NotImplementedError
+
+    def remove_bucket(self, bucket_name):
+        raise NotImplementedError
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None):
+        raise NotImplementedError
+
+    def put_object(self, bucket_name, object_name, data, length,
+                   content_type='application/octet-stream', metadata=None, part_size=0):
+        raise NotImplementedError
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        raise NotImplementedError
+
+    def stat_object(self, bucket_name, object_name):
+        raise NotImplementedError
+
+    def copy_object(self, bucket_name, object_name, source, metadata=None):
+        """Server-side copy of ``source`` (a minio.commonconfig.CopySource) with its metadata."""
+        raise NotImplementedError
+
+    def remove_object(self, bucket_name, object_name):
+        raise NotImplementedError
+
+    def remove_objects(self, bucket_name, delete_object_list):
+        raise NotImplementedError
+
+    def create_multipart_upload(self, bucket_name, object_name, headers):
+        raise NotImplementedError
+
+    def upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        raise NotImplementedError
+
+    def list_parts(self, bucket_name, object_name, upload_id, part_number_marker=None):
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        raise NotImplementedError
+
+    def ping(self):
+        """Raise if the engine cannot serve requests."""
+
+
+class MinioBackend(Minio, StorageBackend):
+    """The Minio SDK client, with its multipart calls exposed under public names."""
+
+    name = 'minio'
+
+    def create_multipart_upload(self, bucket_name, object_name, headers):
+        return self._create_multipart_upload(bucket_name, object_name, headers)
+
+    def upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        return self._upload_part(bucket_name, object_name, data, headers, upload_id, part_number)
+
+    def list_parts(self, bucket_name, object_name, upload_id, part_number_marker=None):
+        return self._list_parts(bucket_name, object_name, upload_id, part_number_marker=part_number_marker)
+
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        return self._complete_multipart_upload(bucket_name, object_name, upload_id, parts)
+
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        return self._abort_multipart_upload(bucket_name, object_name, upload_id)
+
+
+class FileResponse:
+    """Stands in for the urllib3 response Minio.get_object returns, reading through mmap."""
+
+    def __init__(self, f, offset, length, headers):
+        self.file = f
+        self.headers = headers
+        size = os.fstat(f.fileno()).st_size
+        self.start = min(offset, size)
+        self.stop = min(offset + length, size) if length else size
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def stream(self, amt=COPY_CHUNK_SIZE):
+        pos = self.start
+        while pos < self.stop:
+            end = min(pos + amt, self.stop)
+            yield self._map[pos:end]
+            pos = end
+
+    def read(self):
+        return self._map[self.start:self.stop] if self._map is not None else b''
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self.file.close()
+
+    def release_conn(self):
+        pass
+
+
+class FilesystemBackend(StorageBackend):
+    """Objects stored as plain files under ``root``.
+
+    Layout: ``<bucket>/meta/<key>.json`` holds the metadata (key, size, ETag,
+    content type, mtime) and names the body, ``<bucket>/data/<key>~<uuid>``.
+    Keys are percent-encoded into a single file name; names that would get
+    too long are hashed and the real key is read back from the metadata.
+    Writes are spooled into ``.tmp``, moved to a body file of their own and
+    published by replacing the metadata with ``os.replace``, so a reader
+    always gets a body together with its own ETag and size. The replaced
+    body is unlinked afterwards; readers that already opened it keep reading it.
+
+    Each process keeps a bucket's sorted keys and reuses them for listings
+    until the ``meta`` directory's mtime changes, which every write or delete
+    by any process does.
+    """
+
+    name = 'filesystem'
+
+    def __init__(self, root, fsync=False):
+        self.root = os.path.abspath(root)
+        self.fsync = fsync
+        self._tmp = os.path.join(self.root, '.tmp')
+        self._uploads = os.path.join(self.root, '.multipart')
+        self._key_cache = {}
+        os.makedirs(self._tmp, exist_ok=True)
+        os.makedirs(self._uploads, exist_ok=True)
+
+    # Paths
+
+    def _bucket_dir(self, bucket_name):
+        if not BUCKET_NAME_RE.match(bucket_name or ''):
+            raise storage_error('InvalidBucketName', 'The specified bucket is not valid.', bucket_name)
+        return os.path.join(self.root, bucket_name)
+
+    def _existing_bucket_dir(self, bucket_name):
+        path = self._bucket_dir(bucket_name)
+        if not os.path.isdir(path):
+            raise storage_error('NoSuchBucket', 'The specified bucket does not exist', bucket_name)
+        return path
+
+    @staticmethod
+    def _filename(object_name):
+        name = quote(object_name, safe='')
+        if name in ('.', '..'):
+            name = name.replace('.', '%2E')
+        if len(name) > MAX_FILENAME_LENGTH:
+            # '%%' never comes out of quote(), so hashed names cannot collide
+            name = '%%' + hashlib.sha256(object_name.encode()).hexdigest()
+        return name
+
+    def _paths(self, bucket_name, object_name):
+        bucket_dir = self._existing_bucket_dir(bucket_name)
+        if not object_name:
+            raise storage_error('InvalidArgument', 'Object name must not be empty', bucket_name)
+        name = self._filename(object_name)
+        return os.path.join(bucket_dir, 'data', name), os.path.join(bucket_dir, 'meta', name + '.json')
+
+    @staticmethod
+    def _meta_at(meta_path):
+        try:
+            with open(meta_path, 'rb') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _body_path(data_path, meta):
+        # Objects written before bodies were versioned live at the bare name
+        return os.path.join(os.path.dirname(data_path), meta['data']) if 'data' in meta else data_path
+
+    def _read_meta(self, bucket_name, object_name):
+        _, meta_path = self._paths(bucket_name, object_name)
+        meta = self._meta_at(meta_path)
+        if meta is None:
+            raise storage_error('NoSuchKey', 'The specified key does not exist.', bucket_name, object_name)
+        return meta
+
+    @contextmanager
+    def _bucket_lock(self, bucket_name):
+        """Serialises publishing and removing metadata, so every replaced body is unlinked once."""
+        with open(os.path.join(self._existing_bucket_dir(bucket_name), '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Writes
+
+    def _spool(self, data, length, directory=None):
+        """Copy ``length`` bytes (or until EOF if -1) into a temp file; returns (path, size, md5)."""
+        fd, path = tempfile.mkstemp(dir=directory or self._tmp)
+        digest = hashlib.md5()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    chunk = memoryview(data)[:length if length >= 0 else None]
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size = len(chunk)
+                else:
+                    while length < 0 or size < length:
+                        want = COPY_CHUNK_SIZE if length < 0 else min(COPY_CHUNK_SIZE, length - size)
+                        chunk = data.read(want)
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        out.write(chunk)
+                        size += len(chunk)
+                if length >= 0 and size < length:
+                    raise storage_error('IncompleteBody', f'Expected {length} bytes, got {size}')
+                if self.fsync:
+                    out.flush()
+                    os.fsync(out.fileno())
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, size, digest.hexdigest()
+
+    def _write_json(self, path, document):
+        fd, tmp = tempfile.mkstemp(dir=self._tmp)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp, path)
+
+    def _commit(self, bucket_name, object_name, tmp_path, size, etag, content_type, metadata=None):
+        data_path, meta_path = self._paths(bucket_name, object_name)
+        body = f'{os.path.basename(data_path)}~{uuid.uuid4().hex}'
+        body_path = os.path.join(os.path.dirname(data_path), body)
+        os.replace(tmp_path, body_path)
+        try:
+            with self._bucket_lock(bucket_name):
+                old = self._meta_at(meta_path)
+                self._write_json(meta_path, {
+                    'key': object_name,
+                    'data': body,
+                    'size': size,
+                    'etag': etag,
+                    'content_type': content_type or 'application/octet-stream',
+                    'last_modified': os.stat(body_path).st_mtime,
+                    'metadata': metadata or {}
+                })
+        except BaseException:
+            os.unlink(body_path)
+            raise
+        if old is not None:
+            self._unlink_body(data_path, old)
+        return WriteResult(bucket_name, object_name, etag)
+
+    def _unlink_body(self, data_path, meta):
+        try:
+            os.unlink(self._body_path(data_path, meta))
+        except FileNotFoundError:
+            pass
+
+    def put_object(self, bucket_name, object_name, data, length,
+                   content_type='application/octet-stream', metadata=None, part_size=0, **kwargs):
+        self._paths(bucket_name, object_name)
+        tmp_path, size, etag = self._spool(data, length)
+        try:
+            return self._commit(bucket_name, object_name, tmp_path, size, etag, content_type, metadata)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _clone(src, tmp_path):
+        """Copy an open body as a reflink where the filesystem has them, else in the kernel if it can."""
+        with open(tmp_path, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+            try:
+                while os.copy_file_range(src.fileno(), dst.fileno(), 64 * COPY_CHUNK_SIZE):
+                    pass
+                return
+            except (AttributeError, OSError):
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+    def copy_object(self, bucket_name, object_name, source, metadata=None, **kwargs):
+        """Copy the source's data file under the new key, sharing its blocks when the filesystem can.
+
+        The copy is a file of its own, so its mtime (the new key's
+        last_modified) is the time of the copy, not of the source's upload.
+        """
+        self._paths(bucket_name, object_name)
+        src, meta = self._open_body(source.bucket_name, source.object_name)
+        tmp_path = os.path.join(self._tmp, uuid.uuid4().hex)
+        try:
+            with src:
+                self._clone(src, tmp_path)
+            return self._commit(bucket_name, object_name, tmp_path, meta['size'], meta['etag'],
+                                meta['content_type'], meta.get('metadata'))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    # Reads
+
+    def _stored_object(self, bucket_name, meta):
+        return StoredObject(
+            bucket_name, meta['key'], size=meta['size'], etag=meta['etag'],
+            last_modified=datetime.fromtimestamp(meta['last_modified'], tz=timezone.utc),
+            content_type=meta['content_type'], metadata=meta.get('metadata')
+        )
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        return self._stored_object(bucket_name, self._read_meta(bucket_name, object_name))
+
+    def _open_body(self, bucket_name, object_name):
+        """The current body opened for reading, with the metadata that names it."""
+        data_path, _ = self._paths(bucket_name, object_name)
+        while True:
+            meta = self._read_meta(bucket_name, object_name)
+            try:
+                return open(self._body_path(data_path, meta), 'rb'), meta
+            except FileNotFoundError:
+                continue  # replaced between reading the metadata and opening its body
+
+    def open_file(self, bucket_name, object_name):
+        """The object's data file opened for reading, for zero-copy responses."""
+        return self._open_body(bucket_name, object_name)[0]
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, **kwargs):
+        f, meta = self._open_body(bucket_name, object_name)
+        headers = {'ETag': f'"{meta["etag"]}"', 'Content-Type': meta['content_type']}
+        return FileResponse(f, offset, length, headers)
+
+    def _keys(self, bucket_name):
+        meta_dir = os.path.join(self._existing_bucket_dir(bucket_name), 'meta')
+        mtime = os.stat(meta_dir).st_mtime_ns
+        cached = self._key_cache.get(meta_dir)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        started = time.time_ns()
+        keys = []
+        with os.scandir(meta_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('%%'):
+                    meta = self._meta_at(entry.path)
+                    if meta is not None:
+                        keys.append(meta['key'])
+                else:
+                    keys.append(unquote(entry.name[:-len('.json')]))
+        keys.sort()
+        # A write in the same tick as the mtime read would leave it unchanged
+        if started - mtime > KEY_CACHE_QUIET_NS:
+            self._key_cache[meta_dir] = (mtime, keys)
+        return keys
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None, **kwargs):
+        meta_dir = os.path.join(self._existing_bucket_dir(bucket_name), 'meta')
+        for key, is_dir in iter_prefix(self._keys(bucket_name), prefix, recursive, start_after):
+            if is_dir:
+                yield StoredObject(bucket_name, key, is_dir=True)
+                continue
+            meta = self._meta_at(os.path.join(meta_dir, self._filename(key) + '.json'))
+            if meta is None:
+                continue  # deleted while listing
+            yield self._stored_object(bucket_name, meta)
+
+    # Deletes
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        data_path, meta_path = self._paths(bucket_name, object_name)
+        with self._bucket_lock(bucket_name):
+            meta = self._meta_at(meta_path)
+            if meta is None:
+                return
+            os.unlink(meta_path)
+        self._unlink_body(data_path, meta)
+
+    def remove_objects(self, bucket_name, delete_object_list, **kwargs):
+        for obj in delete_object_list:
+            # DeleteObject only exposes its key to the SDK's XML serialiser
+            key = getattr(obj, '_name', obj)
+            try:
+                self.remove_object(bucket_name, key)
+            except S3Error as e:
+                yield DeleteError(e.code, e.message, key, None)
+            except OSError as e:
+                yield DeleteError('InternalError', str(e), key, None)
+
+    # Buckets
+
+    def list_buckets(self):
+        buckets = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir() and BUCKET_NAME_RE.match(entry.name):
+                    created = datetime.fromtimestamp(entry.stat().st_ctime, tz=timezone.utc)
+                    buckets.append(StoredBucket(entry.name, created))
+        return sorted(buckets, key=lambda b: b.name)
+
+    def bucket_exists(self, bucket_name):
+        return os.path.isdir(self._bucket_dir(bucket_name))
+
+    def make_bucket(self, bucket_name, **kwargs):
+        path = self._bucket_dir(bucket_name)
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            raise storage_error('BucketAlreadyOwnedByYou',
+                                'Your previous request to create the named bucket succeeded and you already own it.',
+                                bucket_name)
+        os.mkdir(os.path.join(path, 'data'))
+        os.mkdir(os.path.join(path, 'meta'))
+
+    def remove_bucket(self, bucket_name):
+        path = self._existing_bucket_dir(bucket_name)
+        try:
+            # The metadata is what makes an object exist; a body left without it is garbage
+            os.rmdir(os.path.join(path, 'meta'))
+        except OSError:
+            raise storage_error('BucketNotEmpty', 'The bucket you tried to delete is not empty', bucket_name)
+        self._key_cache.pop(os.path.join(path, 'meta'), None)
+        shutil.rmtree(path)
+
+    # Multipart uploads
+
+    def _upload_dir(self, upload_id):
+        path = os.path.join(self._uploads, upload_id)
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or '') or not os.path.isdir(path):
+            raise storage_error('NoSuchUpload', 'The specified multipart upload does not exist.')
+        return path
+
+    def create_multipart_upload(self, bucket_name, object_name, headers):
+        self._paths(bucket_name, object_name)
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self._uploads, upload_id)
+        os.mkdir(path)
+        self._write_json(os.path.join(path, 'upload.json'), {
+            'bucket': bucket_name,
+            'key': object_name,
+            'content_type': (headers or {}).get('Content-Type') or 'application/octet-stream'
+        })
+        return upload_id
+
+    def upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        path = self._upload_dir(upload_id)
+        tmp_path, size, etag = self._spool(data, len(data))
+        name = os.path.join(path, f'{part_number:05d}')
+        os.replace(tmp_path, name)
+        self._write_json(name + '.json', {'etag': etag, 'size': size})
+        return etag
+
+    def _stored_parts(self, path):
+        parts = {}
+        for name in os.listdir(path):
+            if name.endswith('.json') and name[:-5].isdigit():
+                with open(os.path.join(path, name), 'rb') as f:
+                    meta = json.load(f)
+                parts[int(name[:-5])] = Part(int(name[:-5]), meta['etag'], size=meta['size'])
+        return parts
+
+    def list_parts(self, bucket_name, object_name, upload_id, part_number_marker=None, **kwargs):
+        parts = self._stored_parts(self._upload_dir(upload_id))
+        marker = int(part_number_marker or 0)
+        return PartsPage([parts[n] for n in sorted(parts) if n > marker])
+
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        path = self._upload_dir(upload_id)
+        with open(os.path.join(path, 'upload.json'), 'rb') as f:
+            upload = json.load(f)
+        stored = self._stored_parts(path)
+        for part in parts:
+            found = stored.get(part.part_number)
+            if found is None or found.etag != part.etag.strip('"'):
+                raise storage_error('InvalidPart', f'Part {part.part_number} was not uploaded or its ETag differs',
+                                    bucket_name, object_name)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for part in parts:
+                    with open(os.path.join(path, f'{part.part_number:05d}'), 'rb') as src:
+                        shutil.copyfileobj(src, out, COPY_CHUNK_SIZE)
+                    size += stored[part.part_number].size
+                if self.fsync:
+                    out.flush()
+                    os.fsync(out.fileno())
+            result = self._commit(bucket_name, object_name, tmp_path, size,
+                                  multipart_etag([p.etag for p in parts]), upload['content_type'])
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        shutil.rmtree(path, ignore_errors=True)
+        return result
+
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        shutil.rmtree(self._upload_dir(upload_id))
+
+    def ping(self):
+        if not os.access(self.root, os.W_OK):
+            raise ConnectionError(f'Storage root {self.root} is not writable')
+
+
+class MemoryObject:
+    __slots__ = ('data', 'etag', 'content_type', 'last_modified', 'metadata')
+
+    def __init__(self, data, etag, content_type, last_modified, metadata=None):
+        self.data = data
+        self.etag = etag
+        self.content_type = content_type
+        self.last_modified = last_modified
+        self.metadata = metadata or {}
+
+
+class MemoryBucket:
+    """Objects by key plus the same keys in a sorted list for range scans."""
+
+    __slots__ = ('creation_date', 'objects', 'keys')
+
+    def __init__(self):
+        self.creation_date = datetime.now(timezone.utc)
+        self.objects = {}
+        self.keys = []
+
+
+class MemoryResponse:
+    """get_object response over a memoryview of the stored body."""
+
+    def __init__(self, view, headers):
+        self.view = view
+        self.headers = headers
+
+    def stream(self, amt=COPY_CHUNK_SIZE):
+        for start in range(0, len(self.view), amt):
+            yield bytes(self.view[start:start + amt])
+
+    def read(self):
+        return bytes(self.view)
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+def _frozen(data):
+    """Keep immutable buffers as they are; only mutable ones have to be copied."""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, memoryview) and data.readonly:
+        return data
+    return bytes(data)
+
+
+class MemoryBackend(StorageBackend):
+    """Thread-safe engine keeping every object in process memory.
+
+    Meant for tests and throwaway load-test targets; nothing survives a
+    restart. ``latency`` (seconds) is added to every call and a share
+    ``error_rate`` of calls, plus every call named in ``fail_operations``,
+    raise ConnectionError, which S3Client treats like an unreachable MinIO.
+    """
+
+    name = 'memory'
+
+    def __init__(self, path=None, latency=0.0, error_rate=0.0, fail_operations=(), seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_operations = set(fail_operations)
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._buckets = {}
+        self._uploads = {}
+
+    def _inject(self, operation):
+        if self.latency:
+            time.sleep(self.latency)
+        if operation in self.fail_operations or (self.error_rate and self._random.random() < self.error_rate):
+            raise ConnectionError(f'Injected failure in {operation}')
+
+    def _bucket(self, bucket_name):
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            raise storage_error('NoSuchBucket', 'The specified bucket does not exist', bucket_name)
+        return bucket
+
+    def _object(self, bucket_name, object_name):
+        obj = self._bucket(bucket_name).objects.get(object_name)
+        if obj is None:
+            raise storage_error('NoSuchKey', 'The specified key does not exist.', bucket_name, object_name)
+        return obj
+
+    def _store(self, bucket_name, object_name, data, etag, content_type, metadata=None):
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            if object_name not in bucket.objects:
+                insort(bucket.keys, object_name)
+            bucket.objects[object_name] = MemoryObject(
+                data, etag, content_type or 'application/octet-stream', datetime.now(timezone.utc), metadata
+            )
+        return WriteResult(bucket_name, object_name, etag)
+
+    # Buckets
+
+    def list_buckets(self):
+        self._inject('list_buckets')
+        with self._lock:
+            return [StoredBucket(name, b.creation_date) for name, b in sorted(self._buckets.items())]
+
+    def bucket_exists(self, bucket_name):
+        self._inject('bucket_exists')
+        return bucket_name in self._buckets
+
+    def make_bucket(self, bucket_name, **kwargs):
+        self._inject('make_bucket')
+        if not BUCKET_NAME_RE.match(bucket_name or ''):
+            raise storage_error('InvalidBucketName', 'The specified bucket is not valid.', bucket_name)
+        with self._lock:
+            if bucket_name in self._buckets:
+                raise storage_error('BucketAlreadyOwnedByYou',
+                                    'Your previous request to create the named bucket succeeded and you already own it.',
+                                    bucket_name)
+            self._buckets[bucket_name] = MemoryBucket()
+
+    def remove_bucket(self, bucket_name):
+        self._inject('remove_bucket')
+        with self._lock:
+            if self._bucket(bucket_name).keys:
+                raise storage_error('BucketNotEmpty', 'The bucket you tried to delete is not empty', bucket_name)
+            del self._buckets[bucket_name]
+
+    # Objects
+
+    def put_object(self, bucket_name, object_name, data, length,
+                   content_type='application/octet-stream', metadata=None, part_size=0, **kwargs):
+        self._inject('put_object')
+        self._bucket(bucket_name)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            body = _frozen(data if length < 0 or length >= len(data) else memoryview(data)[:length])
+        else:
+            body = data.read() if length < 0 else data.read(length)
+        if length >= 0 and len(body) < length:
+            raise storage_error('IncompleteBody', f'Expected {length} bytes, got {len(body)}')
+        return self._store(bucket_name, object_name, body, hashlib.md5(body).hexdigest(), content_type, metadata)
+
+    def copy_object(self, bucket_name, object_name, source, metadata=None, **kwargs):
+        """Share the source's immutable body; only the key and timestamp are new."""
+        self._inject('copy_object')
+        with self._lock:
+            obj = self._object(source.bucket_name, source.object_name)
+            self._bucket(bucket_name)
+            return self._store(bucket_name, object_name, obj.data, obj.etag, obj.content_type, dict(obj.metadata))
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        self._inject('stat_object')
+        with self._lock:
+            obj = self._object(bucket_name, object_name)
+        return StoredObject(bucket_name, object_name, size=len(obj.data), etag=obj.etag,
+                            last_modified=obj.last_modified, content_type=obj.content_type,
+                            metadata=obj.metadata)
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, **kwargs):
+        self._inject('get_object')
+        with self._lock:
+            obj = self._object(bucket_name, object_name)
+        view = memoryview(obj.data)[offset:offset + length if length else None]
+        return MemoryResponse(view, {'ETag': f'"{obj.etag}"', 'Content-Type': obj.content_type})
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None, **kwargs):
+        """Binary-search to the first candidate key, then walk the index a page at a time.
+
+        The lock is only held while a page is collected, so a slow consumer
+        never blocks writers; keys written between pages may or may not appear.
+        """
+        self._inject('list_objects')
+        prefix = prefix or ''
+        resume = max(prefix, start_after + '\0') if start_after else prefix
+        while True:
+            page = []
+            with self._lock:
+                bucket = self._bucket(bucket_name)
+                keys = bucket.keys
+                i = bisect_left(keys, resume)
+                while i < len(keys) and len(page) < LIST_PAGE_SIZE:
+                    key = keys[i]
+                    if not key.startswith(prefix):
+                        break
+                    slash = -1 if recursive else key.find('/', len(prefix))
+                    if slash >= 0:
+                        common = key[:slash + 1]
+                        page.append(StoredObject(bucket_name, common, is_dir=True))
+                        # '0' sorts right after '/', so this skips every key under the prefix
+                        resume = common[:-1] + '0'
+                        i = bisect_left(keys, resume)
+                        continue
+                    obj = bucket.objects[key]
+                    page.append(StoredObject(bucket_name, key, size=len(obj.data), etag=obj.etag,
+                                             last_modified=obj.last_modified))
+                    resume = key + '\0'
+                    i += 1
+            if not page:
+                return
+            yield from page
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        self._inject('remove_object')
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            if bucket.objects.pop(object_name, None) is not None:
+                del bucket.keys[bisect_left(bucket.keys, object_name)]
+
+    def remove_objects(self, bucket_name, delete_object_list, **kwargs):
+        self._inject('remove_objects')
+        for obj in delete_object_list:
+            key = getattr(obj, '_name', obj)
+            try:
+                self.remove_object(bucket_name, key)
+            except S3Error as e:
+                yield DeleteError(e.code, e.message, key, None)
+
+    # Multipart uploads
+
+    def _upload(self, upload_id):
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise storage_error('NoSuchUpload', 'The specified multipart upload does not exist.')
+        return upload
+
+    def create_multipart_upload(self, bucket_name, object_name, headers):
+        self._inject('create_multipart_upload')
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._bucket(bucket_name)
+            self._uploads[upload_id] = {
+                'content_type': (headers or {}).get('Content-Type') or 'application/octet-stream',
+                'parts': {}
+            }
+        return upload_id
+
+    def upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        self._inject('upload_part')
+        body = _frozen(data)
+        etag = hashlib.md5(body).hexdigest()
+        with self._lock:
+            self._upload(upload_id)['parts'][part_number] = (body, etag)
+        return etag
+
+    def list_parts(self, bucket_name, object_name, upload_id, part_number_marker=None, **kwargs):
+        self._inject('list_parts')
+        marker = int(part_number_marker or 0)
+        with self._lock:
+            parts = self._upload(upload_id)['parts']
+            return PartsPage([Part(n, etag, size=len(body))
+                              for n, (body, etag) in sorted(parts.items()) if n > marker])
+
+    def complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        self._inject('complete_multipart_upload')
+        with self._lock:
+            upload = self._upload(upload_id)
+            bodies = []
+            for part in parts:
+                stored = upload['parts'].get(part.part_number)
+                if stored is None or stored[1] != part.etag.strip('"'):
+                    raise storage_error('InvalidPart', f'Part {part.part_number} was not uploaded or its ETag differs',
+                                        bucket_name, object_name)
+                bodies.append(stored[0])
+            del self._uploads[upload_id]
+        etag = multipart_etag([p.etag for p in parts])
+        return self._store(bucket_name, object_name, b''.join(bodies), etag, upload['content_type'])
+
+    def abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        self._inject('abort_multipart_upload')
+        with self._lock:
+            self._upload(upload_id)
+            del self._uploads[upload_id]
+
+    def ping(self):
+        self._inject('ping')
+
+
+LOCAL_BACKENDS = {
+    FilesystemBackend.name: FilesystemBackend,
+    MemoryBackend.name: MemoryBackend,
+}
+
+
+def create_backend(name, path=None, **options):
+    """Instantiate one of the embedded engines by its STORAGE_BACKEND name."""
+    try:
+        backend_class = LOCAL_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown storage backend {name!r}; expected minio or one of {sorted(LOCAL_BACKENDS)}')
+    return backend_class(path, **options)
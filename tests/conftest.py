@@ -0,0 +1,37 @@
+import sys
+import os
+import pytest
+from flask.testing import FlaskClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, limiter, s3_client, CircuitBreaker, ObjectCache, UsageStats
+from storage import MemoryBackend
+
+class ClosingClient(FlaskClient):
+    """Test client that closes each response once it has been read, as a server does.
+
+    Backend slots and traces are only given back when a response is closed.
+    """
+
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
+
+app.test_client_class = ClosingClient
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Start every test with empty rate limit counters"""
+    limiter.reset()
+
+@pytest.fixture
+def memory_storage(monkeypatch, tmp_path):
+    """Point the shared s3_client at a fresh in-memory backend for one test"""
+    backend = MemoryBackend()
+    monkeypatch.setattr(s3_client, 'backend', 'memory')
+    monkeypatch.setattr(s3_client, 'client', backend)
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+    monkeypatch.setattr(s3_client, 'cache', ObjectCache())
+    monkeypatch.setattr(s3_client, 'breaker', CircuitBreaker())
+    return backend
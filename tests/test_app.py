@@ -2,11 +2,17 @@ import pytest
 from unittest.mock import MagicMock, patch
 import sys
 import os
+import json
+import time
+from datetime import datetime, timezone
 
 # Add root directory to path so we can import app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app, s3_client
+import urllib3
+from minio.error import S3Error
+
+from app import app, metrics, s3_client, CircuitBreaker, GaugeRefresher, HealthMonitor, ObjectCache, S3Client, UsageStats
 
 @pytest.fixture
 def client():
@@ -16,7 +22,7 @@ def client():
 
 @pytest.fixture
 def mock_minio():
-    with patch('app.Minio') as mock:
+    with patch('app.MinioBackend') as mock:
         yield mock
 
 def test_health_check(client, mock_minio):
@@ -51,3 +57,620 @@ def test_create_bucket_missing_name(client):
     assert response.status_code == 400
     data = response.get_json()
     assert 'error' in data
+
+def test_stats_served_from_incremental_totals(client, tmp_path, monkeypatch):
+    """Test stats reflect uploads and bucket deletes without listing objects"""
+    monkeypatch.setattr(s3_client, 'client', MagicMock())
+    s3_client.client.bucket_exists.return_value = False
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+
+    s3_client.upload_file('stats-bucket', MagicMock(), 'a.txt', 10)
+    s3_client.upload_file('stats-bucket', MagicMock(), 'b.txt', 32)
+
+    response = client.get('/api/v1/stats/')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['buckets'] == 1
+    assert data['objects'] == 2
+    assert data['storage_used_bytes'] == 42
+    assert data['snapshot_age_seconds'] is None
+    s3_client.client.list_objects.assert_not_called()
+
+    s3_client.delete_bucket('stats-bucket')
+    assert client.get('/api/v1/stats/').get_json()['buckets'] == 0
+
+def test_stats_rescan_reconciles_totals(tmp_path, monkeypatch):
+    """Test a full rescan replaces the incremental totals"""
+    bucket = MagicMock()
+    bucket.name = 'scanned'
+    monkeypatch.setattr(s3_client, 'client', MagicMock())
+    s3_client.client.list_buckets.return_value = [bucket]
+    s3_client.client.list_objects.return_value = [MagicMock(size=5), MagicMock(size=7)]
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+    s3_client.stats.record_upload('stale', 100)
+
+    s3_client.stats.replace(s3_client.scan_usage())
+
+    stats = s3_client.get_stats()
+    assert stats['per_bucket'] == {'scanned': {'objects': 2, 'bytes': 12}}
+    assert stats['snapshot_age_seconds'] is not None
+
+def test_stats_are_shared_and_rescanned_by_one_worker(tmp_path):
+    """Test workers share totals, only one rescans at a time, and writes during a scan survive it"""
+    path = str(tmp_path / 'usage.sqlite3')
+    first, second = UsageStats(path), UsageStats(path)
+    first.record_upload('b', 10)
+    assert second.snapshot()['per_bucket'] == {'b': {'objects': 1, 'bytes': 10}}
+
+    def scan():
+        # Meanwhile another worker handles writes and cannot start its own rescan
+        assert second.rescan(lambda: pytest.fail('rescanned twice')) is None
+        second.record_upload('b', 5)
+        second.record_bucket_created('new')
+        second.record_upload('new', 1)
+        second.record_bucket_deleted('gone')
+        return {'b': {'objects': 1, 'bytes': 10}, 'gone': {'objects': 3, 'bytes': 3}}
+
+    assert first.rescan(scan) is not None
+    stats = second.snapshot()
+    assert stats['per_bucket'] == {'b': {'objects': 2, 'bytes': 15}, 'new': {'objects': 1, 'bytes': 1}}
+    assert stats['snapshot_age_seconds'] is not None
+    # A fresh snapshot from any worker makes the next scheduled rescan unnecessary
+    assert second.rescan(lambda: pytest.fail('rescanned too soon'), newer_than=time.time() - 60) is None
+
+def _listed(name, size=1, is_dir=False):
+    obj = MagicMock()
+    obj.object_name = name
+    obj.size = size
+    obj.is_dir = is_dir
+    obj.last_modified = None
+    return obj
+
+def test_list_objects_paginates_with_continuation_token(client):
+    """Test max-keys truncates the listing and the token resumes after the last key"""
+    s3_client.client = MagicMock()
+    s3_client.client.list_objects.side_effect = lambda bucket, **kwargs: iter([
+        o for o in [_listed('a.txt'), _listed('b.txt'), _listed('docs/', None, True)]
+        if not kwargs['start_after'] or o.object_name > kwargs['start_after']
+    ])
+    s3_client.connected = True
+
+    first = client.get('/api/v1/buckets/test-bucket/objects?max-keys=2').get_json()
+    assert [o['name'] for o in first['objects']] == ['a.txt', 'b.txt']
+    assert first['is_truncated'] is True
+
+    token = first['next_continuation_token']
+    second = client.get(f'/api/v1/buckets/test-bucket/objects?max-keys=2&continuation-token={token}').get_json()
+    assert second['objects'] == []
+    assert second['common_prefixes'] == ['docs/']
+    assert second['is_truncated'] is False
+    assert s3_client.client.list_objects.call_args.kwargs['start_after'] == 'b.txt'
+
+def test_list_objects_streams_ndjson(client):
+    """Test the NDJSON mode emits one entry per line"""
+    s3_client.client = MagicMock()
+    s3_client.client.list_objects.return_value = iter([_listed('a.txt'), _listed('b.txt')])
+    s3_client.connected = True
+
+    response = client.get('/api/v1/buckets/test-bucket/objects?format=ndjson&delimiter=')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['name'] for line in lines] == ['a.txt', 'b.txt']
+    assert s3_client.client.list_objects.call_args.kwargs['recursive'] is True
+
+def test_stream_upload_bypasses_form_size_limit(client):
+    """Test the streaming PUT accepts bodies above MAX_CONTENT_LENGTH and reports throughput"""
+    received = {}
+
+    def put_object(bucket, name, data, length, **kwargs):
+        received['bytes'] = len(data.read())
+        received['length'] = length
+        return MagicMock(etag='abc')
+
+    s3_client.client = MagicMock()
+    s3_client.client.put_object.side_effect = put_object
+    s3_client.connected = True
+    body = b'x' * (app.config['MAX_CONTENT_LENGTH'] + 1)
+
+    response = client.put('/api/v1/buckets/test-bucket/objects/dir/big.bin', data=body)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['object'] == 'dir/big.bin'
+    assert data['size'] == len(body)
+    assert received == {'bytes': len(body), 'length': len(body)}
+    assert 'throughput_bytes_per_sec' in data
+
+def test_stream_upload_rejects_small_part_size(client):
+    """Test part_size below the S3 minimum is rejected"""
+    response = client.put('/api/v1/buckets/test-bucket/objects/a.bin?part_size=1024', data=b'x')
+    assert response.status_code == 400
+
+def test_multipart_upload_resumes_and_completes(client, tmp_path, monkeypatch):
+    """Test parts upload independently and complete assembles the listed parts"""
+    listed = MagicMock(is_truncated=False, parts=[
+        MagicMock(part_number='1', etag='e1', size=5),
+        MagicMock(part_number='2', etag='e2', size=3),
+    ])
+    monkeypatch.setattr(s3_client, 'client', MagicMock())
+    s3_client.client.create_multipart_upload.return_value = 'upload-1'
+    s3_client.client.upload_part.return_value = 'e2'
+    s3_client.client.list_parts.return_value = listed
+    s3_client.client.complete_multipart_upload.return_value = MagicMock(etag='final-2')
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+
+    response = client.post('/api/v1/multipart/', json={'bucket': 'ci', 'key': 'build.tar'})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload_id']
+
+    response = client.put(f'/api/v1/multipart/{upload_id}/parts/2?bucket=ci&key=build.tar', data=b'abc')
+    assert response.get_json() == {'success': True, 'part_number': 2, 'etag': 'e2', 'size': 3}
+    assert s3_client.client.upload_part.call_args.args[2] == b'abc'
+
+    parts = client.get(f'/api/v1/multipart/{upload_id}?bucket=ci&key=build.tar').get_json()['parts']
+    assert [p['part_number'] for p in parts] == [1, 2]
+
+    response = client.post(f'/api/v1/multipart/{upload_id}/complete?bucket=ci&key=build.tar',
+                           json={'parts': [1, 2, 3]})
+    assert response.status_code == 500
+    assert 'Missing parts' in response.get_json()['error']
+
+    response = client.post(f'/api/v1/multipart/{upload_id}/complete?bucket=ci&key=build.tar')
+    assert response.get_json()['size'] == 8
+    completed = s3_client.client.complete_multipart_upload.call_args.args[3]
+    assert [p.part_number for p in completed] == [1, 2]
+    assert s3_client.get_stats()['storage_used_bytes'] == 8
+
+def test_multipart_part_requires_target(client):
+    """Test part uploads without bucket/key are rejected"""
+    response = client.put('/api/v1/multipart/upload-1/parts/1', data=b'abc')
+    assert response.status_code == 400
+
+def _mock_object(body, etag='etag-1', cache=None):
+    """Point s3_client at a MagicMock serving one object"""
+    def get_object(bucket, name, offset=0, length=0):
+        response = MagicMock()
+        data = body[offset:offset + length] if length else body[offset:]
+        response.stream.return_value = iter([data[i:i + 4] for i in range(0, len(data), 4)])
+        response.read.return_value = data
+        response.headers = {'ETag': f'"{etag}"'}
+        return response
+
+    s3_client.cache = cache or ObjectCache(max_body_bytes=0)
+
+    s3_client.client = MagicMock()
+    s3_client.client.stat_object.return_value = MagicMock(
+        size=len(body), etag=etag, last_modified=datetime(2025, 1, 1, tzinfo=timezone.utc),
+        content_type='text/plain'
+    )
+    s3_client.client.get_object.side_effect = get_object
+    s3_client.connected = True
+
+def test_download_streams_full_object(client):
+    """Test GET streams the whole object with validators"""
+    _mock_object(b'0123456789')
+    response = client.get('/api/v1/buckets/b/objects/docs/a.txt')
+    assert response.status_code == 200
+    assert response.data == b'0123456789'
+    assert response.headers['ETag'] == '"etag-1"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+def test_download_single_and_multiple_ranges(client):
+    """Test Range requests fetch only the requested bytes"""
+    _mock_object(b'0123456789')
+    response = client.get('/api/v1/buckets/b/objects/a.txt', headers={'Range': 'bytes=2-5'})
+    assert response.status_code == 206
+    assert response.data == b'2345'
+    assert response.headers['Content-Range'] == 'bytes 2-5/10'
+    s3_client.client.get_object.assert_called_with('b', 'a.txt', offset=2, length=4)
+
+    response = client.get('/api/v1/buckets/b/objects/a.txt', headers={'Range': 'bytes=0-1,-3'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n' in response.data
+    assert b'Content-Range: bytes 7-9/10\r\n\r\n789\r\n' in response.data
+
+    response = client.get('/api/v1/buckets/b/objects/a.txt', headers={'Range': 'bytes=20-30'})
+    assert response.status_code == 416
+
+def test_download_conditional_not_modified(client):
+    """Test If-None-Match and If-Modified-Since short-circuit with 304"""
+    _mock_object(b'0123456789')
+    response = client.get('/api/v1/buckets/b/objects/a.txt', headers={'If-None-Match': '"etag-1"'})
+    assert response.status_code == 304
+    response = client.get('/api/v1/buckets/b/objects/a.txt',
+                          headers={'If-Modified-Since': 'Thu, 02 Jan 2025 00:00:00 GMT'})
+    assert response.status_code == 304
+    s3_client.client.get_object.assert_not_called()
+
+def test_download_missing_object(client):
+    """Test a missing key maps to 404"""
+    s3_client.client = MagicMock()
+    s3_client.client.stat_object.side_effect = S3Error('NoSuchKey', 'missing', 'a.txt', 'req', 'host', None)
+    s3_client.connected = True
+    s3_client.cache = ObjectCache()
+    assert client.get('/api/v1/buckets/b/objects/a.txt').status_code == 404
+
+def test_object_cache_serves_hot_reads_and_revalidates(client):
+    """Test small objects are served from cache and expired entries are revalidated by ETag"""
+    cache = ObjectCache(ttl=60)
+    _mock_object(b'hot-object', cache=cache)
+
+    for _ in range(3):
+        response = client.get('/api/v1/buckets/b/objects/hot.txt')
+        assert response.data == b'hot-object'
+    assert s3_client.client.stat_object.call_count == 1
+    assert s3_client.client.get_object.call_count == 1
+
+    # Expire the entry: a stat revalidates it and the cached body is reused
+    cache.lookup('b', 'hot.txt')[0].expires_at = 0
+    assert client.get('/api/v1/buckets/b/objects/hot.txt').data == b'hot-object'
+    assert s3_client.client.stat_object.call_count == 2
+    assert s3_client.client.get_object.call_count == 1
+
+def test_object_cache_invalidated_on_delete_and_upload(client, tmp_path, monkeypatch):
+    """Test writes through the API drop cached entries"""
+    cache = ObjectCache(ttl=60)
+    _mock_object(b'0123456789', cache=cache)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+
+    client.head('/api/v1/buckets/b/objects/a.txt')
+    assert cache.lookup('b', 'a.txt')[0] is not None
+
+    response = client.delete('/api/v1/buckets/b/objects/a.txt')
+    assert response.status_code == 200
+    s3_client.client.remove_object.assert_called_once_with('b', 'a.txt')
+    assert cache.lookup('b', 'a.txt')[0] is None
+
+    client.head('/api/v1/buckets/b/objects/a.txt')
+    s3_client.client.put_object.return_value = MagicMock(etag='etag-2')
+    client.put('/api/v1/buckets/b/objects/a.txt', data=b'new')
+    assert cache.lookup('b', 'a.txt')[0] is None
+
+def test_object_cache_evicts_least_recently_used():
+    """Test the entry cap evicts the oldest entries"""
+    cache = ObjectCache(max_entries=2, ttl=60)
+    for name in ('a', 'b', 'c'):
+        cache.store('bucket', name, {'etag': name, 'size': 1})
+    assert cache.lookup('bucket', 'a')[0] is None
+    assert cache.lookup('bucket', 'c')[1] is True
+
+def test_object_cache_body_matched_by_etag_not_age():
+    """Test a body is reused for its ETag after the entry expires, and never for another ETag"""
+    cache = ObjectCache(ttl=0.01)
+    cache.store('bucket', 'a', {'etag': 'v1', 'size': 4}, b'body')
+    time.sleep(0.02)
+    assert cache.lookup('bucket', 'a')[1] is False
+    assert cache.body('bucket', 'a', 'v1') == b'body'
+    assert cache.body('bucket', 'a', 'v2') is None
+
+def test_connect_reuses_shared_pool(mock_minio):
+    """Test reconnects build the Minio client on the shared, configured pool"""
+    s3_client.connected = False
+    s3_client.connect()
+    assert mock_minio.call_args.kwargs['http_client'] is s3_client.http_client
+    assert s3_client.connected is True
+
+def test_pool_usage_metrics(client):
+    """Test pool saturation gauges are exported"""
+    pool = s3_client.http_client.connection_from_host('localhost', 9000, scheme='http')
+    usage = s3_client.pool_usage()
+    assert usage['maxsize'] >= pool.pool.maxsize
+    assert usage['in_use'] == 0
+
+    response = client.get('/metrics')
+    assert b'minio_pool_connections_maxsize' in response.data
+
+def test_liveness_and_readiness(client):
+    """Test liveness always answers and readiness follows the cached MinIO state"""
+    s3_client.connected = True
+    s3_client.breaker = CircuitBreaker()
+    assert client.get('/health/live').status_code == 200
+    assert client.get('/health/ready').status_code == 200
+
+    s3_client.connected = False
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert client.get('/health/live').status_code == 200
+
+def test_circuit_breaker_fails_fast(client):
+    """Test repeated connection errors open the breaker and later calls skip MinIO"""
+    s3_client.client = MagicMock()
+    s3_client.client.bucket_exists.side_effect = urllib3.exceptions.MaxRetryError(None, '/', 'refused')
+    s3_client.connected = True
+    s3_client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        response = client.post('/api/v1/multipart/', json={'bucket': 'b', 'key': 'k'})
+        assert response.status_code == 503
+    assert s3_client.breaker.state == 'open'
+
+    response = client.post('/api/v1/multipart/', json={'bucket': 'b', 'key': 'k'})
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'MinIO unavailable (circuit open)'
+    assert s3_client.client.bucket_exists.call_count == 2
+
+    s3_client.breaker = CircuitBreaker()
+
+def test_health_probe_trips_and_recovers():
+    """Test failed probes count towards the breaker threshold and a good probe restores MinIO"""
+    s3_client.breaker = CircuitBreaker(failure_threshold=2)
+    s3_client.connected = True
+    monitor = HealthMonitor(s3_client)
+    with patch.object(s3_client.http_client, 'request', side_effect=urllib3.exceptions.NewConnectionError(None, 'down')):
+        assert monitor.probe() is False
+        assert (s3_client.connected, s3_client.breaker.state) == (True, 'closed')
+        assert monitor.probe() is False
+    assert s3_client.connected is False
+    assert s3_client.breaker.state == 'open'
+
+    with patch.object(s3_client.http_client, 'request', return_value=MagicMock(status=200)), \
+         patch.object(s3_client, 'connect', side_effect=lambda: setattr(s3_client, 'connected', True)):
+        assert monitor.probe() is True
+    assert s3_client.breaker.state == 'closed'
+    assert monitor.snapshot()['consecutive_failures'] == 0
+
+def test_half_open_breaker_admits_one_trial_call(monkeypatch):
+    """Test a half-open breaker lets one call through at a time until it succeeds or fails"""
+    clock = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock[0] += 10
+    assert breaker.allow() and breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    clock[0] += 10
+    assert breaker.allow()
+    # A trial that never reports back does not hold the breaker forever
+    clock[0] += 10
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+def test_successful_trial_call_closes_the_breaker(client, memory_storage, monkeypatch):
+    """Test the call a half-open breaker lets through closes it when MinIO answers, even with an error"""
+    clock = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    monkeypatch.setattr(s3_client, 'breaker', breaker)
+    memory_storage.make_bucket('trial')
+    breaker.record_failure()
+    assert client.get('/api/v1/buckets/trial/objects/missing').status_code == 503
+
+    clock[0] += 10
+    with patch.object(memory_storage, 'stat_object', side_effect=urllib3.exceptions.ProtocolError('reset')):
+        assert client.get('/api/v1/buckets/trial/objects/missing').status_code == 503
+    assert breaker.state == 'open'
+
+    clock[0] += 10
+    assert client.get('/api/v1/buckets/trial/objects/missing').status_code == 404
+    assert breaker.state == 'closed'
+    assert client.get('/api/v1/buckets/').status_code == 200
+
+def test_health_monitor_probes_when_the_breaker_goes_half_open(monkeypatch):
+    """Test a backed-off monitor sleeps no longer than the breaker stays open"""
+    monkeypatch.setattr(time, 'monotonic', lambda: 100.0)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=3)
+    monkeypatch.setattr(s3_client, 'breaker', breaker)
+    monitor = HealthMonitor(s3_client, max_backoff=60)
+    monitor.consecutive_failures = 10
+    breaker.record_failure()
+    monkeypatch.setattr(monitor, 'probe', lambda: False)
+
+    def sleep(delay):
+        raise InterruptedError(delay)
+    monkeypatch.setattr(time, 'sleep', sleep)
+    with pytest.raises(InterruptedError) as excinfo:
+        monitor._run()
+    assert excinfo.value.args == (4,)
+
+def test_delete_stats_the_object_once(client, memory_storage, monkeypatch):
+    """Test deleting reuses the size the request already read instead of a second stat"""
+    monkeypatch.setattr(s3_client, 'cache', ObjectCache(max_entries=0))
+    client.put('/api/v1/buckets/mem/objects/a.bin', data=b'x' * 10)
+    stats = []
+    stat_object = memory_storage.stat_object
+    monkeypatch.setattr(memory_storage, 'stat_object', lambda *a, **kw: stats.append(a) or stat_object(*a, **kw))
+
+    assert client.delete('/api/v1/buckets/mem/objects/a.bin').status_code == 200
+    assert len(stats) == 1
+    assert s3_client.stats.snapshot()['per_bucket']['mem'] == {'objects': 0, 'bytes': 0}
+
+def test_bulk_delete_streams_per_key_results(client):
+    """Test keys are deleted in multi-object batches with per-key results"""
+    error = MagicMock(code='AccessDenied', message='denied')
+    error.name = 'locked.txt'
+    s3_client.client = MagicMock()
+    s3_client.client.remove_objects.return_value = iter([error])
+    s3_client.connected = True
+
+    response = client.post('/api/v1/buckets/b/delete', json={'keys': ['a.txt', 'locked.txt']})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {'key': 'a.txt', 'deleted': True}
+    assert lines[1]['deleted'] is False and 'AccessDenied' in lines[1]['error']
+    assert lines[-1] == {'summary': {'deleted': 1, 'errors': 1}}
+    deleted = s3_client.client.remove_objects.call_args.args[1]
+    assert [d._name for d in deleted] == ['a.txt', 'locked.txt']
+
+def test_bulk_delete_requires_keys_or_prefix(client):
+    """Test the request must name keys or a prefix, not both"""
+    assert client.post('/api/v1/buckets/b/delete', json={}).status_code == 400
+    assert client.post('/api/v1/buckets/b/delete', json={'keys': ['a'], 'prefix': 'x/'}).status_code == 400
+
+def test_force_delete_bucket_empties_in_batches(client, tmp_path, monkeypatch):
+    """Test force delete removes all objects in parallel batches of 1000 before the bucket"""
+    monkeypatch.setattr(s3_client, 'client', MagicMock())
+    s3_client.client.list_objects.return_value = iter([_listed(f'k{i:04d}', 2) for i in range(2500)])
+    s3_client.client.remove_objects.side_effect = lambda bucket, objects: iter([])
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+
+    response = client.delete('/api/v1/buckets/b?force=true')
+    assert response.status_code == 200
+    assert response.get_json()['objects_deleted'] == 2500
+    batch_sizes = sorted(len(c.args[1]) for c in s3_client.client.remove_objects.call_args_list)
+    assert batch_sizes == [500, 1000, 1000]
+    s3_client.client.remove_bucket.assert_called_once_with('b')
+
+def test_deleting_listed_keys_leaves_the_counts_to_the_rescan(client, memory_storage):
+    """Test deletes of listed keys, which may not exist, do not decrement the usage totals"""
+    client.post('/api/v1/buckets/', json={'bucket_name': 'listed'})
+    for key in ('a', 'b'):
+        client.put(f'/api/v1/buckets/listed/objects/{key}', data=b'12345')
+
+    results = list(s3_client.iter_delete('listed', keys=['a', 'missing', 'also-missing']))
+
+    assert all(r['deleted'] for r in results)
+    assert s3_client.get_stats()['per_bucket']['listed'] == {'objects': 2, 'bytes': 10}
+    s3_client.stats.replace(s3_client.scan_usage())
+    assert s3_client.get_stats()['per_bucket']['listed'] == {'objects': 1, 'bytes': 5}
+
+def test_multipart_round_trip_on_memory_storage(client, memory_storage):
+    """Test a multipart upload through the API produces the assembled object"""
+    upload_id = client.post('/api/v1/multipart/', json={'bucket': 'mem', 'key': 'big.bin'}).get_json()['upload_id']
+    for number, chunk in ((2, b'world'), (1, b'hello ')):
+        response = client.put(f'/api/v1/multipart/{upload_id}/parts/{number}?bucket=mem&key=big.bin', data=chunk)
+        assert response.status_code == 200
+
+    done = client.post(f'/api/v1/multipart/{upload_id}/complete?bucket=mem&key=big.bin')
+    assert done.status_code == 200
+    assert done.get_json()['size'] == 11
+    assert client.get('/api/v1/buckets/mem/objects/big.bin').data == b'hello world'
+
+def test_listing_and_bulk_delete_on_memory_storage(client, memory_storage):
+    """Test pagination and prefix deletes against real listings"""
+    memory_storage.make_bucket('mem')
+    for i in range(5):
+        memory_storage.put_object('mem', f'logs/{i}.txt', b'x' * i, i)
+    memory_storage.put_object('mem', 'readme', b'r', 1)
+
+    page = client.get('/api/v1/buckets/mem/objects?max-keys=1').get_json()
+    assert page['common_prefixes'] == ['logs/']
+    page = client.get(f'/api/v1/buckets/mem/objects?max-keys=1&continuation-token={page["next_continuation_token"]}').get_json()
+    assert [o['name'] for o in page['objects']] == ['readme']
+    assert page['is_truncated'] is False
+
+    response = client.post('/api/v1/buckets/mem/delete', json={'prefix': 'logs/'})
+    assert json.loads(response.data.splitlines()[-1])['summary']['deleted'] == 5
+    assert [o.object_name for o in memory_storage.list_objects('mem', recursive=True)] == ['readme']
+
+def test_listing_served_from_key_index(client, memory_storage, tmp_path, monkeypatch):
+    """Test prefix counts and range scans once the sorted key index is enabled"""
+    from keyindex import KeyIndex
+    monkeypatch.setattr(s3_client, 'index', KeyIndex(str(tmp_path)))
+    assert client.post('/api/v1/buckets/', json={'bucket_name': 'idx'}).get_json()['success'] is True
+    for key in ['docs/a.md', 'docs/b.md', 'docs/img/c.png', 'notes.txt']:
+        client.put(f'/api/v1/buckets/idx/objects/{key}', data=b'data')
+
+    page = client.get('/api/v1/buckets/idx/objects?prefix=docs/').get_json()
+    assert [o['name'] for o in page['objects']] == ['docs/a.md', 'docs/b.md']
+    assert page['common_prefixes'] == ['docs/img/']
+    assert client.get('/api/v1/buckets/idx/objects?prefix=docs/&count=true').get_json()['key_count'] == 3
+
+    client.delete('/api/v1/buckets/idx/objects/docs/a.md')
+    scan = client.get('/api/v1/buckets/idx/objects?delimiter=&start-after=docs/a.md&end-before=notes.txt').get_json()
+    assert [o['name'] for o in scan['objects']] == ['docs/b.md', 'docs/img/c.png']
+
+def test_listing_falls_back_when_key_index_is_dropped(client, memory_storage, tmp_path, monkeypatch):
+    """Test listings and counts use the backend when the index disappears after being built"""
+    from keyindex import KeyIndex
+    monkeypatch.setattr(s3_client, 'index', KeyIndex(str(tmp_path)))
+    client.post('/api/v1/buckets/', json={'bucket_name': 'idx'})
+    for key in ['a/1', 'a/2', 'b', 'c']:
+        client.put(f'/api/v1/buckets/idx/objects/{key}', data=b'data')
+    ensure = s3_client._ensure_index
+
+    def ensure_then_drop(bucket_name):
+        # Another worker deleting the index right after this one built it
+        ensure(bucket_name)
+        s3_client.index.drop(bucket_name)
+    monkeypatch.setattr(s3_client, '_ensure_index', ensure_then_drop)
+
+    page = client.get('/api/v1/buckets/idx/objects').get_json()
+    assert [o['name'] for o in page['objects']] == ['b', 'c']
+    assert page['common_prefixes'] == ['a/']
+    counted = client.get('/api/v1/buckets/idx/objects?count=true').get_json()
+    assert (counted['key_count'], counted['indexed']) == (4, False)
+
+def test_operation_metrics_recorded(client, memory_storage):
+    """Test backend latency, byte counters and listing sizes are exported per operation"""
+    from app import metrics
+    sample = lambda name, **labels: metrics.registry.get_sample_value(name, labels) or 0
+    before = {
+        'up': sample('s3_bytes_uploaded_total', bucket='met'),
+        'down': sample('s3_bytes_downloaded_total', bucket='met'),
+        'puts': sample('s3_backend_operation_duration_seconds_count', operation='upload_stream', bucket='met', status='ok'),
+        'lists': sample('s3_listing_entries_count', delimited='true'),
+        'errors': sample('s3_backend_operation_duration_seconds_count', operation='head_object', bucket='met', status='error')
+    }
+
+    client.put('/api/v1/buckets/met/objects/a.bin', data=b'x' * 300)
+    assert client.get('/api/v1/buckets/met/objects/a.bin').data == b'x' * 300
+    client.get('/api/v1/buckets/met/objects')
+    client.get('/api/v1/buckets/met/objects/missing')
+
+    assert sample('s3_bytes_uploaded_total', bucket='met') - before['up'] == 300
+    assert sample('s3_bytes_downloaded_total', bucket='met') - before['down'] == 300
+    assert sample('s3_backend_operation_duration_seconds_count', operation='upload_stream', bucket='met', status='ok') - before['puts'] == 1
+    assert sample('s3_listing_entries_count', delimited='true') - before['lists'] == 1
+    assert sample('s3_backend_operation_duration_seconds_count', operation='head_object', bucket='met', status='error') - before['errors'] == 1
+    assert sample('s3_http_requests_in_flight') == 0
+
+def test_presigned_urls_and_post_policy(client, memory_storage, monkeypatch):
+    """Test presigned URLs point at the public MinIO endpoint and direct uploads are recorded"""
+    assert client.post('/api/v1/presign/', json={'bucket': 'pre', 'key': 'a.bin', 'method': 'PUT'}).status_code == 501
+
+    monkeypatch.setattr('app.MINIO_PUBLIC_ENDPOINT', 'https://files.example.com')
+    monkeypatch.setattr(s3_client, 'backend', 'minio')
+    monkeypatch.setattr(s3_client, '_signer', None)
+
+    put = client.post('/api/v1/presign/', json={'bucket': 'pre', 'key': 'dir/a b.bin', 'method': 'PUT', 'expires': 600})
+    assert put.status_code == 200
+    url = put.get_json()['url']
+    assert url.startswith('https://files.example.com/pre/dir/a%20b.bin?')
+    assert 'X-Amz-Expires=600' in url and 'X-Amz-Signature=' in url
+    assert memory_storage.bucket_exists('pre')
+
+    # The client uploads to MinIO itself, then reports the object
+    memory_storage.put_object('pre', 'dir/a b.bin', b'x' * 42, 42)
+    done = client.post('/api/v1/presign/complete', json={'bucket': 'pre', 'key': 'dir/a b.bin'})
+    assert done.get_json()['size'] == 42
+    assert s3_client.get_stats()['storage_used_bytes'] == 42
+    assert client.post('/api/v1/presign/complete', json={'bucket': 'pre', 'key': 'nope'}).status_code == 404
+
+    get = client.post('/api/v1/presign/', json={'bucket': 'pre', 'key': 'dir/a b.bin'}).get_json()
+    assert 'response-content-disposition=attachment' in get['url']
+    assert client.post('/api/v1/presign/', json={'bucket': 'pre', 'key': 'missing'}).status_code == 404
+    assert client.post('/api/v1/presign/', json={'bucket': 'pre', 'key': 'k', 'expires': 0}).status_code == 400
+
+    form = client.post('/api/v1/presign/post', json={'bucket': 'pre', 'prefix': 'uploads/', 'max_size': 1024}).get_json()
+    assert form['url'] == 'https://files.example.com/pre'
+    assert {'policy', 'x-amz-signature', 'x-amz-credential'} <= set(form['fields'])
+    assert client.post('/api/v1/presign/post', json={'bucket': 'pre', 'key': 'k', 'max_size': 0}).status_code == 400
+
+def test_client_connects_lazily():
+    """Test constructing the client does not touch storage; the first health probe connects"""
+    client = S3Client(backend='memory')
+    assert client.client is None and client.connected is False
+    assert client.health.probe() is True
+    assert client.connected is True
+
+def test_computed_gauges_are_sampled_in_multiprocess_mode():
+    """Test computed gauges hold the sampled value when scrapes only read written samples"""
+    values = iter([3, 5])
+    refresher = GaugeRefresher(multiprocess=True)
+    refresher.gauge('s3_test_sampled_value', 'Test gauge', lambda: next(values))
+    assert metrics.registry.get_sample_value('s3_test_sampled_value') == 0
+    refresher.refresh()
+    assert metrics.registry.get_sample_value('s3_test_sampled_value') == 3
+    refresher.refresh()
+    assert metrics.registry.get_sample_value('s3_test_sampled_value') == 5
@@ -0,0 +1,219 @@
+import asyncio
+import gzip
+import io
+import json
+import sys
+import os
+import threading
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asgi import application
+from compression import CompressionPolicies, CompressionPolicy
+import app as app_module
+from app import app, s3_client, MIN_PART_SIZE, ObjectCache, UsageStats
+
+app.config['TESTING'] = True
+
+def http_scope(method, path, query=b'', headers=()):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+            'headers': list(headers), 'http_version': '1.1', 'scheme': 'http',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 1234), 'root_path': ''}
+
+def call(method, path, body=b'', query=b'', headers=(), chunk_size=None):
+    """Drive the ASGI app with a single request and collect the response"""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size else [body]
+    messages = [{'type': 'http.request', 'body': c, 'more_body': i < len(chunks) - 1}
+                for i, c in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(http_scope(method, path, query, headers), receive, send))
+    status = sent[0]['status']
+    data = b''.join(m.get('body', b'') for m in sent[1:])
+    return status, dict(sent[0]['headers']), data
+
+def test_fallback_routes_run_through_flask():
+    """Test routes without a native handler are served by the Flask app"""
+    status, _, data = call('GET', '/health/live')
+    assert status == 200
+    assert json.loads(data)['status'] == 'alive'
+
+def test_native_put_uploads_parts_as_they_arrive(tmp_path, monkeypatch):
+    """Test a body larger than part_size is uploaded as multipart parts"""
+    monkeypatch.setattr(s3_client, 'client', MagicMock())
+    s3_client.client.create_multipart_upload.return_value = 'upload-1'
+    s3_client.client.upload_part.side_effect = lambda b, o, data, h, u, n: f'etag-{n}'
+    s3_client.client.list_parts.return_value = MagicMock(is_truncated=False, parts=[
+        MagicMock(part_number='1', etag='etag-1', size=MIN_PART_SIZE),
+        MagicMock(part_number='2', etag='etag-2', size=10),
+    ])
+    s3_client.client.complete_multipart_upload.return_value = MagicMock(etag='final')
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+
+    body = b'x' * (MIN_PART_SIZE + 10)
+    status, _, data = call('PUT', '/api/v1/buckets/b/objects/big.bin', body,
+                           query=f'part_size={MIN_PART_SIZE}'.encode(), chunk_size=1024 * 1024)
+    assert status == 200
+    result = json.loads(data)
+    assert result['size'] == MIN_PART_SIZE + 10
+    sizes = [len(c.args[2]) for c in s3_client.client.upload_part.call_args_list]
+    assert sizes == [MIN_PART_SIZE, 10]
+
+def test_native_get_streams_object():
+    """Test plain GETs are streamed by the native handler"""
+    s3_client.client = MagicMock()
+    s3_client.client.stat_object.return_value = MagicMock(
+        size=8, etag='e', last_modified=None, content_type='text/plain'
+    )
+    response = MagicMock()
+    response.stream.return_value = iter([b'abcd', b'efgh'])
+    s3_client.client.get_object.return_value = response
+    s3_client.connected = True
+    s3_client.cache = ObjectCache(max_body_bytes=0)
+
+    status, headers, data = call('GET', '/api/v1/buckets/b/objects/a.txt')
+    assert status == 200
+    assert data == b'abcdefgh'
+    assert headers[b'content-length'] == b'8'
+    response.release_conn.assert_called_once()
+
+def test_native_ndjson_listing_honours_max_keys():
+    """Test NDJSON listings stream in pages and end with a continuation token"""
+    def listed(name):
+        obj = MagicMock(size=1, is_dir=False, last_modified=None)
+        obj.object_name = name
+        return obj
+
+    s3_client.client = MagicMock()
+    s3_client.client.list_objects.return_value = iter([listed(f'k{i}') for i in range(5)])
+    s3_client.connected = True
+
+    status, _, data = call('GET', '/api/v1/buckets/b/objects', query=b'format=ndjson&max-keys=3')
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert status == 200
+    assert [line['name'] for line in lines[:3]] == ['k0', 'k1', 'k2']
+    assert 'next_continuation_token' in lines[3]
+
+def test_native_routes_echo_request_id(memory_storage):
+    """Test natively served requests get the same X-Request-ID handling as Flask ones"""
+    memory_storage.make_bucket('b')
+    status, headers, _ = call('PUT', '/api/v1/buckets/b/objects/k', b'data', headers=[(b'x-request-id', b'asgi-1')])
+    assert status == 200
+    assert headers[b'x-request-id'] == b'asgi-1'
+    status, headers, data = call('GET', '/api/v1/buckets/b/objects/k')
+    assert data == b'data'
+    assert len(headers[b'x-request-id']) == 32
+
+def test_native_get_negotiates_compressed_objects(memory_storage, tmp_path, monkeypatch):
+    """Test the native GET serves stored gzip only to clients that accept it"""
+    monkeypatch.setattr(s3_client, 'compression', CompressionPolicies(str(tmp_path / 'compression.json')))
+    s3_client.compression.set('logs', CompressionPolicy(min_size=0))
+    memory_storage.make_bucket('logs')
+    body = b'{"level": "info"}\n' * 5000
+
+    status, _, data = call('PUT', '/api/v1/buckets/logs/objects/app.ndjson', body,
+                           headers=[(b'content-type', b'application/x-ndjson')])
+    assert status == 200 and json.loads(data)['content_encoding'] == 'gzip'
+
+    status, headers, data = call('GET', '/api/v1/buckets/logs/objects/app.ndjson',
+                                 headers=[(b'accept-encoding', b'gzip, br')])
+    assert headers[b'content-encoding'] == b'gzip'
+    assert gzip.decompress(data) == body
+
+    stored_etag = headers[b'etag']
+    status, headers, data = call('GET', '/api/v1/buckets/logs/objects/app.ndjson')
+    assert b'content-encoding' not in headers
+    assert headers[b'content-length'] == str(len(body)).encode()
+    assert headers[b'etag'] == stored_etag[:-1] + b'-identity"'
+    assert data == body
+
+def test_native_routes_share_the_rate_limits(memory_storage, monkeypatch):
+    """Test natively served requests count against the same limits as Flask's"""
+    monkeypatch.setitem(app_module.RATE_LIMITS, 'transfer', '2/minute')
+    memory_storage.make_bucket('b')
+    memory_storage.put_object('b', 'k', io.BytesIO(b'x'), 1)
+
+    assert call('GET', '/api/v1/buckets/b/objects/k')[0] == 200
+    with app.test_client() as client:
+        assert client.get('/api/v1/buckets/b/objects/k').status_code == 200
+    status, headers, _ = call('GET', '/api/v1/buckets/b/objects/k')
+    assert status == 429
+    assert int(headers[b'retry-after']) > 0
+    assert call('HEAD', '/api/v1/buckets/b/objects/k')[0] == 200
+
+def test_native_part_upload_is_not_spooled(memory_storage, monkeypatch):
+    """Test multipart parts go straight to the backend instead of through Flask's spooled body"""
+    import asgi
+    memory_storage.make_bucket('b')
+    status, _, data = call('POST', '/api/v1/multipart/', json.dumps({'bucket': 'b', 'key': 'big.bin'}).encode(),
+                           headers=[(b'content-type', b'application/json')])
+    upload_id = json.loads(data)['upload_id']
+    spool = asgi.SpooledTemporaryFile
+    monkeypatch.setattr(asgi, 'SpooledTemporaryFile', MagicMock(side_effect=AssertionError('spooled')))
+
+    query = b'bucket=b&key=big.bin'
+    for n, body in [(1, b'a' * 3000), (2, b'b' * 10)]:
+        status, _, data = call('PUT', f'/api/v1/multipart/{upload_id}/parts/{n}', body, query=query, chunk_size=1024)
+        assert status == 200 and json.loads(data)['size'] == len(body)
+    assert call('PUT', f'/api/v1/multipart/{upload_id}/parts/1', b'x')[0] == 400
+    monkeypatch.setattr(asgi, 'MULTIPART_MAX_PART_BYTES', 100)
+    assert call('PUT', f'/api/v1/multipart/{upload_id}/parts/3', b'x' * 101, query=query, chunk_size=50)[0] == 413
+
+    monkeypatch.setattr(asgi, 'SpooledTemporaryFile', spool)
+    status, _, _ = call('POST', f'/api/v1/multipart/{upload_id}/complete', query=query,
+                        body=json.dumps({'parts': [1, 2]}).encode(), headers=[(b'content-type', b'application/json')])
+    assert status == 200
+    assert memory_storage.get_object('b', 'big.bin').read() == b'a' * 3000 + b'b' * 10
+
+def test_compression_policy_is_looked_up_off_the_event_loop(memory_storage, monkeypatch):
+    """Test the per-upload policy check (a file stat) runs on the offload pool"""
+    threads = []
+    policies = MagicMock()
+    policies.get.side_effect = lambda bucket_name: threads.append(threading.current_thread().name)
+    monkeypatch.setattr(s3_client, 'compression', policies)
+    memory_storage.make_bucket('b')
+
+    assert call('PUT', '/api/v1/buckets/b/objects/k', b'data')[0] == 200
+    assert threads and threads[0].startswith('asgi-offload')
+
+def test_slow_readers_do_not_hold_flask_threads(memory_storage, monkeypatch):
+    """Test Flask-served responses stalled on their clients leave the Flask pool free"""
+    import asgi
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(asgi, 'flask_executor', ThreadPoolExecutor(max_workers=1))
+    memory_storage.make_bucket('b')
+    memory_storage.put_object('b', 'k', io.BytesIO(b'x' * 100), 100)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def scenario():
+        reading = asyncio.Event()  # never set: clients that stopped reading
+
+        async def stalled_send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                await reading.wait()
+
+        # Ranged GETs are answered by the Flask app
+        ranged = http_scope('GET', '/api/v1/buckets/b/objects/k', headers=[(b'range', b'bytes=0-9')])
+        stalled = [asyncio.create_task(application(ranged, receive, stalled_send)) for _ in range(3)]
+        await asyncio.sleep(0.2)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await asyncio.wait_for(application(http_scope('GET', '/health/live'), receive, send), 5)
+        for task in stalled:
+            task.cancel()
+        await asyncio.gather(*stalled, return_exceptions=True)
+        return sent
+
+    assert asyncio.run(scenario())[0]['status'] == 200
@@ -0,0 +1,38 @@
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import benchmark
+from app import s3_client
+
+def test_benchmark_reports_and_compares_against_baseline(tmp_path, monkeypatch):
+    """Test an in-memory run reports percentiles and flags regressions against a baseline"""
+    for name in ('backend', 'client', 'connected'):
+        monkeypatch.setattr(s3_client, name, getattr(s3_client, name))
+    output = tmp_path / 'run.json'
+    argv = ['--requests', '20', '--concurrency', '2', '--warmup', '1', '--sizes', '1KiB',
+            '--scenarios', 'upload,download,list,stats', '--list-keys', '50', '--output', str(output)]
+    assert benchmark.main(argv) == 0
+
+    report = json.loads(output.read_text())
+    assert set(report['scenarios']) == {'upload_1KiB', 'download_1KiB', 'list_50_keys', 'stats'}
+    upload = report['scenarios']['upload_1KiB']
+    assert upload['requests'] == 20 and upload['errors'] == 0
+    assert upload['latency_ms']['p50'] <= upload['latency_ms']['p99']
+
+    # A baseline ten times faster than anything measured must read as a regression
+    for result in report['scenarios'].values():
+        result['requests_per_sec'] *= 10
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(report))
+    assert benchmark.main(argv + ['--baseline', str(baseline), '--fail-on-regression']) == 1
+
+def test_percentile_nearest_rank():
+    """Test percentiles use the nearest-rank definition"""
+    values = list(range(1, 101))
+    assert benchmark.percentile(values, 50) == 50
+    assert benchmark.percentile(values, 99) == 99
+    assert benchmark.percentile([], 95) is None
@@ -0,0 +1,93 @@
+import gzip
+import io
+import json
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, s3_client
+from compression import CompressingReader, CompressionPolicies, CompressionPolicy, decompressed
+
+app.config['TESTING'] = True
+
+def test_policy_matches_types_and_sizes(tmp_path):
+    """Test policies validate their fields and select uploads by type and size"""
+    policy = CompressionPolicy(min_size=100, content_types=['text/*', 'application/json'])
+    assert policy.applies('text/csv; charset=utf-8', 500)
+    assert policy.applies('application/json', None)
+    assert not policy.applies('application/json', 99)
+    assert not policy.applies('image/png', 500)
+    with pytest.raises(ValueError):
+        CompressionPolicy(encoding='brotli')
+    with pytest.raises(ValueError):
+        CompressionPolicy.from_dict({'level': 12})
+
+    policies = CompressionPolicies(str(tmp_path / 'compression.json'))
+    policies.set('logs', policy)
+    assert CompressionPolicies(policies.path).get('logs').to_dict() == policy.to_dict()
+
+def test_reader_round_trip():
+    """Test the compressing reader streams valid gzip in any read size"""
+    body = b''.join(b'line %d\n' % i for i in range(50_000))
+    reader = CompressingReader(io.BytesIO(body), 'gzip', 6)
+    chunks = iter(lambda: reader.read(1000), b'')
+    stored = b''.join(chunks)
+    assert reader.bytes_written == len(stored) < len(body)
+    assert gzip.decompress(stored) == body
+    assert b''.join(decompressed(iter([stored[:10], stored[10:]]), 'gzip')) == body
+
+def test_api_stores_compressed_and_negotiates(memory_storage, tmp_path, monkeypatch):
+    """Test uploads under a policy are stored compressed and decoded for clients that need it"""
+    monkeypatch.setattr(s3_client, 'compression', CompressionPolicies(str(tmp_path / 'compression.json')))
+    memory_storage.make_bucket('logs')
+    body = json.dumps([{'id': i, 'status': 'ok'} for i in range(2000)]).encode()
+    with app.test_client() as client:
+        assert client.get('/api/v1/buckets/logs/compression').status_code == 404
+        assert client.put('/api/v1/buckets/logs/compression', json={'level': 99}).status_code == 400
+        assert client.put('/api/v1/buckets/logs/compression', json={'min_size': 10}).status_code == 200
+
+        result = client.put('/api/v1/buckets/logs/objects/events.json', data=body,
+                            content_type='application/json').get_json()
+        assert result['content_encoding'] == 'gzip'
+        assert result['stored_size'] < len(body)
+
+        plain = client.get('/api/v1/buckets/logs/objects/events.json')
+        assert plain.data == body
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.headers['Content-Length'] == str(len(body))
+
+        encoded = client.get('/api/v1/buckets/logs/objects/events.json', headers={'Accept-Encoding': 'gzip'})
+        assert encoded.headers['Content-Encoding'] == 'gzip'
+        assert encoded.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(encoded.data) == body
+
+        ranged = client.get('/api/v1/buckets/logs/objects/events.json', headers={'Range': 'bytes=0-9'})
+        assert ranged.status_code == 200 and ranged.data == body
+
+        # Other types and buckets without a policy are stored as they are
+        client.put('/api/v1/buckets/logs/objects/pic.png', data=body, content_type='image/png')
+        assert memory_storage.stat_object('logs', 'pic.png').size == len(body)
+        assert client.delete('/api/v1/buckets/logs/compression').status_code == 200
+        assert client.get('/api/v1/buckets/logs/compression').status_code == 404
+
+def test_each_representation_has_its_own_etag(memory_storage, tmp_path, monkeypatch):
+    """Test the stored and the decoded bytes carry different ETags and revalidate only against their own"""
+    monkeypatch.setattr(s3_client, 'compression', CompressionPolicies(str(tmp_path / 'compression.json')))
+    s3_client.compression.set('logs', CompressionPolicy(min_size=0))
+    memory_storage.make_bucket('logs')
+    url = '/api/v1/buckets/logs/objects/events.json'
+    gzip_only = {'Accept-Encoding': 'gzip'}
+    with app.test_client() as client:
+        client.put(url, data=b'{"ok": true}\n' * 1000, content_type='application/json')
+        stored = client.get(url, headers=gzip_only).headers['ETag']
+        identity = client.get(url).headers['ETag']
+        assert stored != identity and identity == stored[:-1] + '-identity"'
+        assert client.head(url).headers['ETag'] == identity
+
+        assert client.get(url, headers={**gzip_only, 'If-None-Match': stored}).status_code == 304
+        assert client.get(url, headers={'If-None-Match': identity}).status_code == 304
+        assert client.get(url, headers={**gzip_only, 'If-None-Match': identity}).status_code == 200
+        revalidated = client.get(url, headers={'If-None-Match': stored})
+        assert revalidated.status_code == 200 and revalidated.headers['ETag'] == identity
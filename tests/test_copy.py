@@ -0,0 +1,83 @@
+import json
+import sys
+import os
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, s3_client, MAX_PART_SIZE
+from jobs import JobStore
+
+app.config['TESTING'] = True
+
+def ndjson(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+def test_copy_object(memory_storage):
+    """Test one object is copied with its content type, and bad requests are rejected"""
+    memory_storage.make_bucket('src')
+    memory_storage.put_object('src', 'report.csv', b'a,b\n1,2\n', 8, content_type='text/csv')
+    with app.test_client() as client:
+        response = client.post('/api/v1/copy/', json={'bucket': 'src', 'key': 'report.csv',
+                                                      'dest_bucket': 'archive', 'dest_key': '2024/report.csv'})
+        assert response.status_code == 200
+        assert response.get_json()['size'] == 8
+
+        copy = client.get('/api/v1/buckets/archive/objects/2024/report.csv')
+        assert (copy.data, copy.content_type) == (b'a,b\n1,2\n', 'text/csv')
+        assert s3_client.stats.snapshot()['per_bucket']['archive'] == {'objects': 1, 'bytes': 8}
+
+        missing = client.post('/api/v1/copy/', json={'bucket': 'src', 'key': 'nope', 'dest_key': 'x'})
+        assert missing.status_code == 404
+        same = client.post('/api/v1/copy/', json={'bucket': 'src', 'key': 'report.csv', 'dest_key': 'report.csv'})
+        assert same.status_code == 400
+
+def test_copy_and_rename_prefix(memory_storage, tmp_path, monkeypatch):
+    """Test prefix copies stream per-key results, renames remove sources, and async runs as a job"""
+    memory_storage.make_bucket('b')
+    for i in range(30):
+        memory_storage.put_object('b', f'in/{i:02}', b'%d' % i, len(b'%d' % i))
+    memory_storage.put_object('b', 'other', b'x', 1)
+
+    with app.test_client() as client:
+        overlap = client.post('/api/v1/copy/prefix', json={'bucket': 'b', 'prefix': 'in/', 'dest_prefix': 'in/x/'})
+        assert overlap.status_code == 400
+
+        lines = ndjson(client.post('/api/v1/copy/prefix', json={'bucket': 'b', 'prefix': 'in/',
+                                                                'dest_bucket': 'c', 'dest_prefix': 'out/'}))
+        assert lines[-1] == {'summary': {'copied': 30, 'errors': 0}}
+        assert {l['dest'] for l in lines[:-1]} == {f'out/{i:02}' for i in range(30)}
+        assert memory_storage.get_object('c', 'out/07').read() == b'7'
+
+        lines = ndjson(client.post('/api/v1/copy/rename-prefix', json={'bucket': 'b', 'prefix': 'in/',
+                                                                       'dest_prefix': 'moved/'}))
+        assert lines[-1] == {'summary': {'moved': 30, 'errors': 0}}
+        assert all(l['deleted'] for l in lines[:-1])
+        keys = [o.object_name for o in memory_storage.list_objects('b', recursive=True)]
+        assert keys == [f'moved/{i:02}' for i in range(30)] + ['other']
+
+        monkeypatch.setattr(s3_client.jobs, 'store', JobStore(str(tmp_path / 'jobs.sqlite3')))
+        response = client.post('/api/v1/copy/rename-prefix', json={'bucket': 'b', 'prefix': 'moved/',
+                                                                   'dest_prefix': 'final/', 'async': True})
+        assert response.status_code == 202
+        s3_client.jobs.run_next()
+        job = client.get(f"/api/v1/jobs/{response.get_json()['id']}").get_json()
+        assert job['state'] == 'succeeded'
+        assert job['result'] == {'objects': 30, 'bytes': 50}
+        assert len(list(memory_storage.list_objects('b', prefix='final/', recursive=True))) == 30
+        assert list(memory_storage.list_objects('b', prefix='moved/', recursive=True)) == []
+
+def test_large_copies_pass_metadata_for_compose(memory_storage, monkeypatch):
+    """Test sources over 5 GiB get their metadata passed explicitly, since compose does not copy it"""
+    client = MagicMock()
+    client.stat_object.return_value = MagicMock(size=MAX_PART_SIZE + 1, content_type='video/mp4',
+                                                metadata={'X-Amz-Meta-Camera': 'a', 'Server': 'MinIO'})
+    monkeypatch.setattr(s3_client, 'client', client)
+
+    assert s3_client.copy_object('b', 'big.mp4', 'b', 'copy.mp4')['success']
+    kwargs = client.copy_object.call_args.kwargs
+    assert kwargs['metadata'] == {'X-Amz-Meta-Camera': 'a', 'Content-Type': 'video/mp4'}
+
+    client.stat_object.return_value.size = 10
+    s3_client.copy_object('b', 'small.mp4', 'b', 'copy.mp4')
+    assert client.copy_object.call_args.kwargs['metadata'] is None
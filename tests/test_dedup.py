@@ -0,0 +1,126 @@
+import io
+import sqlite3
+import sys
+import os
+import pytest
+from minio.commonconfig import CopySource
+from minio.deleteobjects import DeleteObject
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, s3_client
+from dedup import DedupBackend
+from storage import MemoryBackend
+
+app.config['TESTING'] = True
+
+@pytest.fixture
+def dedup(tmp_path):
+    backend = DedupBackend(MemoryBackend(), str(tmp_path / 'dedup.sqlite3'), 'blobs')
+    backend.make_bucket('b')
+    return backend
+
+def blob_keys(backend):
+    return [o.object_name for o in backend.inner.list_objects('blobs', recursive=True)]
+
+def test_identical_bodies_stored_once(dedup):
+    """Test keys with the same content share one blob and read back as normal objects"""
+    body = b'artifact' * 1000
+    dedup.put_object('b', 'build/1.tar', io.BytesIO(body), len(body), content_type='application/x-tar')
+    result = dedup.put_object('b', 'build/2.tar', io.BytesIO(body), -1)
+    dedup.put_object('b', 'other', b'different', 9)
+
+    assert len(blob_keys(dedup)) == 2
+    stat = dedup.stat_object('b', 'build/1.tar')
+    assert (stat.size, stat.etag, stat.content_type) == (len(body), result.etag, 'application/x-tar')
+    assert dedup.get_object('b', 'build/2.tar', offset=8, length=8).read() == b'artifact'
+    assert [(o.object_name, o.size) for o in dedup.list_objects('b', recursive=True)] == [
+        ('build/1.tar', len(body)), ('build/2.tar', len(body)), ('other', 9)
+    ]
+    assert [b.name for b in dedup.list_buckets()] == ['b']
+    assert dedup.index.totals() == {'logical_bytes': 2 * len(body) + 9, 'physical_bytes': len(body) + 9,
+                                    'references': 3, 'blobs': 2}
+
+def test_blobs_collected_with_their_last_reference(dedup):
+    """Test deletes and overwrites release blobs, and the last release removes them"""
+    dedup.put_object('b', 'a', b'same', 4)
+    dedup.put_object('b', 'b', b'same', 4)
+    dedup.remove_object('b', 'a')
+    assert len(blob_keys(dedup)) == 1
+
+    assert list(dedup.remove_objects('b', [DeleteObject('b')])) == []
+    assert blob_keys(dedup) == []
+
+    dedup.put_object('b', 'k', b'v1', 2)
+    dedup.put_object('b', 'k', b'v2', 2)
+    assert len(blob_keys(dedup)) == 1
+    assert dedup.get_object('b', 'k').read() == b'v2'
+
+    # A plain object written over a reference (e.g. a presigned upload) wins
+    dedup.inner.put_object('b', 'k', b'plain', 5)
+    assert dedup.stat_object('b', 'k').size == 5
+    assert blob_keys(dedup) == []
+
+def test_stats_report_logical_and_physical_bytes(memory_storage, tmp_path, monkeypatch):
+    """Test the API dedups uploads and reports both byte totals"""
+    monkeypatch.setattr(s3_client, 'client', DedupBackend(memory_storage, str(tmp_path / 'd.sqlite3'), 'blobs'))
+    body = os.urandom(50_000)
+    with app.test_client() as client:
+        for key in ('one.bin', 'two.bin'):
+            assert client.put(f'/api/v1/buckets/art/objects/{key}', data=body).status_code == 200
+        assert client.get('/api/v1/buckets/art/objects/two.bin').data == body
+
+        stats = client.get('/api/v1/stats/').get_json()
+        assert stats['storage_used_bytes'] == 100_000
+        assert stats['dedup']['logical_bytes'] == 100_000
+        assert stats['dedup']['physical_bytes'] == 50_000
+        assert stats['dedup']['saved_bytes'] == 50_000
+
+def test_copies_take_a_reference(dedup):
+    """Test copying a deduplicated key adds a reference instead of storing the body again"""
+    dedup.put_object('b', 'a', b'shared body', 11, content_type='text/plain')
+    dedup.copy_object('b', 'copy', CopySource('b', 'a'))
+    dedup.remove_object('b', 'a')
+
+    assert len(blob_keys(dedup)) == 1
+    stat = dedup.stat_object('b', 'copy')
+    assert (stat.size, stat.content_type) == (11, 'text/plain')
+    assert dedup.get_object('b', 'copy').read() == b'shared body'
+    dedup.remove_object('b', 'copy')
+    assert blob_keys(dedup) == []
+
+def test_blobs_removed_after_the_index_commits(tmp_path):
+    """Test unreferenced blobs are removed outside the index write lock, and retried after a failure"""
+    path = str(tmp_path / 'dedup.sqlite3')
+    removals = []
+
+    class CheckedBackend(MemoryBackend):
+        fail = False
+
+        def remove_object(self, bucket_name, object_name):
+            if bucket_name == 'blobs':
+                # Another worker can take the write lock while the blob is removed
+                db = sqlite3.connect(path, timeout=0, isolation_level=None)
+                db.execute('BEGIN IMMEDIATE')
+                db.execute('ROLLBACK')
+                db.close()
+                removals.append(object_name)
+                if self.fail:
+                    raise ConnectionError('backend went away')
+            return super().remove_object(bucket_name, object_name)
+
+    inner = CheckedBackend()
+    dedup = DedupBackend(inner, path, 'blobs')
+    dedup.make_bucket('b')
+    dedup.put_object('b', 'k', io.BytesIO(b'body'), -1)
+    dedup.put_object('b', 'copy', b'body', 4)
+    assert len(removals) == 1 and len(blob_keys(dedup)) == 1  # the duplicate upload
+
+    inner.fail = True
+    dedup.remove_object('b', 'k')
+    dedup.remove_object('b', 'copy')
+    assert len(blob_keys(dedup)) == 1 and len(dedup.index.garbage()) == 1
+
+    inner.fail = False
+    DedupBackend(inner, path, 'blobs')
+    assert blob_keys(dedup) == [] and dedup.index.garbage() == []
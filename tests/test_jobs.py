@@ -0,0 +1,113 @@
+import sys
+import os
+import threading
+import time
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, s3_client
+from jobs import JobCancelled, JobContext, JobStore, RateLimiter
+
+app.config['TESTING'] = True
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    """A fresh job store; tests run jobs with run_next() instead of worker threads"""
+    monkeypatch.setattr(s3_client.jobs, 'store', JobStore(str(tmp_path / 'jobs.sqlite3')))
+    return s3_client.jobs
+
+def test_delete_prefix_job(memory_storage, jobs):
+    """Test a submitted job is queued, runs to completion and reports progress"""
+    memory_storage.make_bucket('logs')
+    for i in range(25):
+        memory_storage.put_object('logs', f'tmp/{i}', b'x', 1)
+    memory_storage.put_object('logs', 'keep', b'x', 1)
+
+    with app.test_client() as client:
+        assert client.post('/api/v1/jobs/', json={'kind': 'nope'}).status_code == 400
+        assert client.post('/api/v1/jobs/', json={'kind': 'delete_prefix'}).status_code == 400
+
+        response = client.post('/api/v1/jobs/', json={'kind': 'delete_prefix',
+                                                      'params': {'bucket': 'logs', 'prefix': 'tmp/'}})
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['state'] == 'queued'
+        assert response.headers['Location'].endswith(f"/api/v1/jobs/{job['id']}")
+
+        assert jobs.run_next() is True
+        assert jobs.run_next() is False
+        job = client.get(f"/api/v1/jobs/{job['id']}").get_json()
+        assert job['state'] == 'succeeded'
+        assert job['progress'] == {'deleted': 25}
+        assert job['result'] == {'objects_deleted': 25, 'bucket_removed': False}
+        assert [o.object_name for o in memory_storage.list_objects('logs', recursive=True)] == ['keep']
+
+        response = client.delete('/api/v1/buckets/logs?force=true&async=true')
+        assert response.status_code == 202
+        jobs.run_next()
+        assert not memory_storage.bucket_exists('logs')
+        listing = client.get('/api/v1/jobs/?state=succeeded').get_json()
+        assert len(listing['jobs']) == 2
+        assert client.get('/api/v1/jobs/missing').status_code == 404
+
+def test_cancel_queued_and_running_jobs(jobs, monkeypatch):
+    """Test queued jobs cancel at once and running ones stop at their next step"""
+    queued = jobs.store.submit('rescan_stats', {})
+    with app.test_client() as client:
+        assert client.post(f"/api/v1/jobs/{queued['id']}/cancel").get_json()['state'] == 'cancelled'
+    assert jobs.run_next() is False
+
+    started = threading.Event()
+
+    def forever(ctx):
+        started.set()
+        while True:
+            ctx.advance(steps=1)
+            time.sleep(0.01)
+
+    monkeypatch.setitem(jobs._handlers, 'forever', (forever, ()))
+    job = jobs.submit('forever', {})
+    worker = threading.Thread(target=jobs.run_next)
+    worker.start()
+    started.wait(5)
+    assert jobs.store.cancel(job['id'])['cancel_requested'] is True
+    jobs.beat()
+    worker.join(5)
+
+    job = jobs.store.get(job['id'])
+    assert job['state'] == 'cancelled'
+    assert job['progress']['steps'] > 0
+
+def test_jobs_of_a_lost_worker_are_rerun(tmp_path):
+    """Test a running job whose heartbeat stopped is claimed again, up to max_attempts"""
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job = store.submit('rescan_stats', {})
+    assert store.claim('dead-worker', stale_after=30, max_attempts=2)['id'] == job['id']
+    assert store.claim('other', stale_after=30, max_attempts=2) is None
+
+    time.sleep(0.01)
+    again = store.claim('other', stale_after=0, max_attempts=2)
+    assert (again['id'], again['attempts']) == (job['id'], 2)
+    # The lost worker's late result is ignored
+    store.finish(job['id'], 'dead-worker', 'succeeded', {})
+    assert store.get(job['id'])['state'] == 'running'
+
+    time.sleep(0.01)
+    assert store.claim('third', stale_after=0, max_attempts=2) is None
+    assert store.get(job['id'])['state'] == 'failed'
+
+def test_rate_limiter_spaces_operations():
+    """Test the token bucket lets a burst through, then holds operations to the rate"""
+    limiter = RateLimiter(200)
+    started = time.monotonic()
+    for _ in range(60):
+        limiter.acquire(5)
+    assert time.monotonic() - started >= 0.4
+
+    unlimited = RateLimiter(0)
+    unlimited.acquire(10 ** 9)
+    ctx = JobContext({'id': 'x', 'params': {}}, unlimited)
+    ctx.cancelled.set()
+    with pytest.raises(JobCancelled):
+        ctx.throttle()
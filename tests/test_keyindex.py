@@ -0,0 +1,68 @@
+import sys
+import os
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyindex import KeyIndex
+
+def _listed(name, size=1):
+    obj = MagicMock(size=size, last_modified=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    obj.object_name = name
+    return obj
+
+def test_index_builds_once_and_answers_directory_listings(tmp_path):
+    """Test the first listing builds the index and later ones skip whole prefixes"""
+    lister = MagicMock(return_value=[_listed(k) for k in ['a/x/1', 'a/x/2', 'a/y', 'b', 'c/1']])
+    index = KeyIndex(str(tmp_path))
+    index.ensure('bkt', lister)
+    index.ensure('bkt', lister)
+    assert lister.call_count == 1
+
+    assert list(index.entries('bkt')) == [{'prefix': 'a/'}, {'name': 'b', 'size': 1,
+                                          'last_modified': '2024-01-01T00:00:00+00:00'}, {'prefix': 'c/'}]
+    assert [e.get('prefix') or e['name'] for e in index.entries('bkt', prefix='a/')] == ['a/x/', 'a/y']
+    assert index.count('bkt', 'a/') == 3
+    assert index.count('bkt', '', start_after='a/x/1', end_before='c') == 3
+    assert [e['name'] for e in index.entries('bkt', delimiter='', start_after='a/x/2', end_before='c/1')] == ['a/y', 'b']
+
+def test_workers_share_index_through_journal(tmp_path):
+    """Test events recorded by one worker are replayed by another, across compactions"""
+    first, second = KeyIndex(str(tmp_path), compact_every=3), KeyIndex(str(tmp_path), compact_every=3)
+    first.create('bkt')
+    for i in range(5):
+        first.record_put('bkt', f'k{i}', i, 1700000000.0)
+    second.record_deletes('bkt', ['k1'])
+
+    assert [e['name'] for e in first.entries('bkt', delimiter='')] == ['k0', 'k2', 'k3', 'k4']
+    assert [e['size'] for e in second.entries('bkt', delimiter='')] == [0, 2, 3, 4]
+    assert len([f for f in os.listdir(tmp_path / 'bkt') if f.startswith('snapshot-')]) == 1
+
+    second.drop('bkt')
+    first.record_put('bkt', 'ignored', 1, None)
+    assert first._sync('bkt') is None
+
+def test_rebuilt_index_keeps_one_generation(tmp_path):
+    """Test publishing a generation removes every older one, not just its predecessor"""
+    index = KeyIndex(str(tmp_path), compact_every=2)
+    index.create('bkt')
+    index.create('bkt')
+    for i in range(3):
+        index.record_put('bkt', f'k{i}', i, None)
+
+    files = sorted(f for f in os.listdir(tmp_path / 'bkt') if f.startswith(('snapshot-', 'journal-')))
+    assert len(files) == 2
+    assert files[0].split('-')[1].split('.')[0] == files[1].split('-')[1].split('.')[0]
+
+def test_append_after_a_torn_write(tmp_path):
+    """Test a line left half-written by a dead worker is cut off before the next append"""
+    first, second = KeyIndex(str(tmp_path)), KeyIndex(str(tmp_path))
+    first.create('bkt')
+    first.record_put('bkt', 'a', 1, None)
+    with open(tmp_path / 'bkt' / f'journal-{first._current("bkt")}.log', 'ab') as f:
+        f.write(b'{"op":"put","key":"tor')
+
+    second.record_put('bkt', 'b', 2, None)
+
+    assert [e['name'] for e in first.entries('bkt', delimiter='')] == ['a', 'b']
@@ -0,0 +1,97 @@
+import sys
+import io
+import os
+import threading
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from werkzeug.serving import make_server
+
+import app as app_module
+from app import app, s3_client, ObjectCache
+from ratelimit import ConcurrencyLimit
+from storage import FilesystemBackend
+
+app.config['TESTING'] = True
+
+def test_limits_are_per_client_and_endpoint_class(memory_storage, monkeypatch):
+    """Test a client over its listing limit gets 429 while other classes and clients carry on"""
+    monkeypatch.setitem(app_module.RATE_LIMITS, 'listing', '3/minute')
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_API_KEYS', frozenset({'ci-runner'}))
+    memory_storage.make_bucket('ci')
+
+    with app.test_client() as client:
+        for _ in range(3):
+            assert client.get('/api/v1/buckets/ci/objects').status_code == 200
+        response = client.get('/api/v1/stats/')
+        assert response.status_code == 429
+        assert 'Rate limit exceeded' in response.get_json()['error']
+        assert int(response.headers['Retry-After']) > 0
+        assert response.headers['X-RateLimit-Limit'] == '3'
+
+        assert client.get('/api/v1/buckets/').status_code == 200
+        assert client.get('/api/v1/swagger.json').status_code == 200
+        assert client.get('/api/v1/stats/', headers={'X-API-Key': 'ci-runner'}).status_code == 200
+        # A key that is not configured does not make a new client
+        assert client.get('/api/v1/stats/', headers={'X-API-Key': 'made-up'}).status_code == 429
+
+def test_excess_requests_fail_fast_when_backend_slots_are_taken(memory_storage, monkeypatch):
+    """Test requests finding every backend slot in use are refused with Retry-After"""
+    slots = ConcurrencyLimit(1)
+    monkeypatch.setattr(app_module, 'backend_slots', slots)
+
+    with app.test_client() as client:
+        assert slots.try_acquire()
+        response = client.get('/api/v1/buckets/')
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == str(app_module.BACKEND_BUSY_RETRY_AFTER)
+        assert client.get('/api/v1/health/').status_code == 200
+
+        slots.release()
+        assert client.get('/api/v1/buckets/').status_code == 200
+        assert slots.in_use == 0
+
+def test_downloads_give_their_backend_slot_back(tmp_path, monkeypatch):
+    """Test a real server returns the slot of every sendfile, streamed and ranged download"""
+    monkeypatch.setitem(app_module.RATE_LIMITS, 'transfer', '1000/second')
+    monkeypatch.setattr(s3_client, 'backend', 'filesystem')
+    monkeypatch.setattr(s3_client, 'client', FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'cache', ObjectCache(max_body_bytes=1024))
+    s3_client.client.make_bucket('dl')
+    s3_client.client.put_object('dl', 'big', io.BytesIO(b'x' * 4096), 4096)
+    s3_client.client.put_object('dl', 'small', io.BytesIO(b'y' * 100), 100)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}/api/v1/buckets/dl/objects'
+    try:
+        for i in range(app_module.BACKEND_MAX_IN_FLIGHT + 5):
+            headers = {'Range': 'bytes=0-9'} if i % 3 == 2 else {}
+            request = urllib.request.Request(f"{base}/{'big' if i % 3 == 0 else 'small'}", headers=headers)
+            with urllib.request.urlopen(request) as response:
+                assert response.status in (200, 206)
+                response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert app_module.backend_slots.in_use == 0
+
+def test_sqlite_storage_is_shared_between_workers(tmp_path):
+    """Test two limiters on one SQLite file count against the same window"""
+    uri = f"sqlite://{tmp_path / 'ratelimit.sqlite3'}"
+    first = FixedWindowRateLimiter(storage_from_string(uri))
+    second = FixedWindowRateLimiter(storage_from_string(uri))
+    limit = parse('3/minute')
+
+    assert first.hit(limit, 'client') and second.hit(limit, 'client') and first.hit(limit, 'client')
+    assert not second.hit(limit, 'client')
+    assert second.hit(limit, 'other')
+    assert second.get_window_stats(limit, 'client').remaining == 0
+
+    first.clear(limit, 'client')
+    assert second.hit(limit, 'client')
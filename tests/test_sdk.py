@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+
+import pytest
+import requests
+from flask import request
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sdk', 'python'))
+
+import app as app_module
+from app import app, limiter
+from ratelimit import ConcurrencyLimit
+from s3_simulator_client import ChecksumMismatchError, MultipartUploadError, S3SimulatorClient
+from s3_simulator_client.transfer import AsyncTransferManager
+
+
+class BusySlots(ConcurrencyLimit):
+    """Backend slots that answer 429 to the first ``failures`` requests matching ``match``"""
+
+    def __init__(self, match, failures):
+        super().__init__(0)
+        self.match = match
+        self.failures = failures
+        self.seen = 0
+
+    def try_acquire(self):
+        if self.match(request):
+            self.seen += 1
+            if self.failures > 0:
+                self.failures -= 1
+                return False
+        return super().try_acquire()
+
+
+@pytest.fixture
+def server(memory_storage, monkeypatch):
+    """The app on a real HTTP server, as the SDK talks to it"""
+    monkeypatch.setattr(limiter, 'enabled', False)
+    monkeypatch.setattr(app_module, 'BACKEND_BUSY_RETRY_AFTER', 0)
+    memory_storage.make_bucket('sdk-bucket')
+    httpd = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}/api/v1'
+    httpd.shutdown()
+    thread.join()
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def remote_keys(client):
+    return sorted(obj['name'] for obj in client.iter_objects('sdk-bucket'))
+
+
+def test_upload_directory_skips_unchanged_files_and_sync_deletes(server, tmp_path):
+    client = S3SimulatorClient(server)
+    src = tmp_path / 'src'
+    write(str(src / 'a.txt'), b'alpha')
+    write(str(src / 'sub' / 'b.bin'), os.urandom(3000))
+    manager = client.transfer_manager(workers=2)
+
+    summary = manager.upload_directory(str(src), 'sdk-bucket')
+    assert (summary['transferred'], summary['failed']) == (2, {})
+    summary = manager.upload_directory(str(src), 'sdk-bucket')
+    assert (summary['transferred'], summary['skipped']) == (0, 2)
+
+    os.unlink(src / 'a.txt')
+    write(str(src / 'c.txt'), b'gamma')
+    summary = manager.sync(str(src), 'sdk-bucket', delete=True)
+    assert (summary['transferred'], summary['skipped'], summary['deleted']) == (1, 1, 1)
+    assert remote_keys(client) == ['c.txt', 'sub/b.bin']
+
+    dest = tmp_path / 'dest'
+    write(str(dest / 'stale.txt'), b'old')
+    summary = manager.sync(str(dest), 'sdk-bucket', direction='download', delete=True)
+    assert (summary['transferred'], summary['deleted']) == (2, 1)
+    assert not (dest / 'stale.txt').exists()
+    assert (dest / 'sub' / 'b.bin').read_bytes() == (src / 'sub' / 'b.bin').read_bytes()
+
+
+def test_transfer_retries_are_not_multiplied_by_the_client(server, tmp_path, monkeypatch):
+    slots = BusySlots(lambda r: r.method == 'PUT', failures=2)
+    monkeypatch.setattr(app_module, 'backend_slots', slots)
+    client = S3SimulatorClient(server, max_retries=3)
+    write(str(tmp_path / 'src' / 'a.txt'), b'alpha')
+
+    summary = client.transfer_manager(retries=2, backoff=0).upload_directory(str(tmp_path / 'src'), 'sdk-bucket')
+
+    assert (summary['transferred'], summary['failed']) == (1, {})
+    # Two 429s and the upload that succeeded: nothing retried underneath
+    assert slots.seen == 3
+
+
+def test_transfer_gives_up_on_busy_answers_after_its_retries(server, tmp_path, monkeypatch):
+    slots = BusySlots(lambda r: r.method == 'PUT', failures=10)
+    monkeypatch.setattr(app_module, 'backend_slots', slots)
+    write(str(tmp_path / 'src' / 'a.txt'), b'alpha')
+    events = []
+
+    manager = S3SimulatorClient(server).transfer_manager(retries=2, backoff=0, progress=events.append)
+    summary = manager.upload_directory(str(tmp_path / 'src'), 'sdk-bucket')
+
+    assert summary['transferred'] == 0 and list(summary['failed']) == ['a.txt']
+    assert events[-1]['action'] == 'error'
+    assert slots.seen == 3
+
+
+def test_multipart_upload_resumes_without_resending_parts(server, tmp_path, monkeypatch):
+    data = os.urandom(5000)
+    write(str(tmp_path / 'big.bin'), data)
+    slots = BusySlots(lambda r: r.method == 'PUT' and r.path.endswith('/parts/3'), failures=1)
+    monkeypatch.setattr(app_module, 'backend_slots', slots)
+    client = S3SimulatorClient(server, max_retries=0)
+
+    with pytest.raises(MultipartUploadError) as excinfo:
+        client.upload_file_parallel('sdk-bucket', str(tmp_path / 'big.bin'), 'big.bin', part_size=1024)
+    assert excinfo.value.__cause__.response.status_code == 429
+
+    parts = BusySlots(lambda r: r.method == 'PUT' and '/parts/' in r.path, failures=0)
+    monkeypatch.setattr(app_module, 'backend_slots', parts)
+    client.upload_file_parallel('sdk-bucket', str(tmp_path / 'big.bin'), 'big.bin', part_size=1024,
+                                upload_id=excinfo.value.upload_id)
+
+    assert parts.seen == 1
+    response = requests.get(f'{server}/buckets/sdk-bucket/objects/big.bin')
+    assert response.content == data
+
+
+def test_transfer_manager_splits_the_pool_between_files_and_parts(server, tmp_path, monkeypatch):
+    client = S3SimulatorClient(server, pool_maxsize=8)
+    calls = []
+    monkeypatch.setattr(S3SimulatorClient, 'upload_file_parallel',
+                        lambda self, *args, max_workers, **kwargs: calls.append(max_workers))
+    for i in range(3):
+        write(str(tmp_path / 'src' / f'{i}.bin'), b'x' * 100)
+
+    manager = client.transfer_manager(workers=3, multipart_threshold=10)
+    manager.upload_directory(str(tmp_path / 'src'), 'sdk-bucket')
+
+    assert (manager.workers, manager.part_workers) == (3, 2)
+    assert calls == [2, 2, 2]
+    assert client.transfer_manager(workers=20).part_workers == 1
+    assert client.transfer_manager(workers=1).part_workers == 4
+
+
+def test_parallel_download_reassembles_ranges(server, tmp_path):
+    data = os.urandom(10000)
+    requests.put(f'{server}/buckets/sdk-bucket/objects/data.bin', data=data).raise_for_status()
+    client = S3SimulatorClient(server)
+
+    path = client.download_file_parallel('sdk-bucket', 'data.bin', str(tmp_path / 'data.bin'), part_size=1024)
+
+    with open(path, 'rb') as f:
+        assert hashlib.md5(f.read()).hexdigest() == hashlib.md5(data).hexdigest()
+    assert not os.path.exists(path + '.s3part')
+
+
+def test_parallel_download_fails_when_the_object_changes(server, tmp_path):
+    requests.put(f'{server}/buckets/sdk-bucket/objects/data.bin', data=os.urandom(10000)).raise_for_status()
+    client = S3SimulatorClient(server)
+    head = client.session.head
+
+    def stale_head(url, **kwargs):
+        response = head(url, **kwargs)
+        response.headers['ETag'] = '"0123456789abcdef0123456789abcdef"'
+        return response
+    client.session.head = stale_head
+
+    with pytest.raises(ChecksumMismatchError):
+        client.download_file_parallel('sdk-bucket', 'data.bin', str(tmp_path / 'data.bin'), part_size=1024)
+    assert not (tmp_path / 'data.bin').exists()
+    assert not (tmp_path / 'data.bin.s3part').exists()
+
+
+def test_async_transfer_manager(server, tmp_path):
+    write(str(tmp_path / 'src' / 'a.txt'), b'alpha')
+    write(str(tmp_path / 'src' / 'b.txt'), b'beta')
+    events = []
+
+    async def progress(event):
+        events.append(event['action'])
+
+    async def run():
+        async with AsyncTransferManager(S3SimulatorClient(server), workers=2, progress=progress) as manager:
+            uploaded = await manager.upload_directory(str(tmp_path / 'src'), 'sdk-bucket')
+            downloaded = await manager.download_prefix('sdk-bucket', '', str(tmp_path / 'dest'))
+        return uploaded, downloaded
+
+    uploaded, downloaded = asyncio.run(run())
+
+    assert uploaded['transferred'] == downloaded['transferred'] == 2
+    assert sorted(events) == ['download', 'download', 'upload', 'upload']
+    assert (tmp_path / 'dest' / 'b.txt').read_bytes() == b'beta'
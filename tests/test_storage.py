@@ -0,0 +1,211 @@
+import hashlib
+import io
+import sys
+import os
+import threading
+import pytest
+from minio.commonconfig import CopySource
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, s3_client, ObjectCache, UsageStats, CircuitBreaker
+from storage import FilesystemBackend, MemoryBackend
+
+app.config['TESTING'] = True
+
+@pytest.fixture
+def fs(tmp_path):
+    backend = FilesystemBackend(str(tmp_path))
+    backend.make_bucket('b')
+    return backend
+
+def test_filesystem_put_get_stat(fs):
+    """Test objects round-trip through data files and sidecar metadata"""
+    result = fs.put_object('b', 'dir/a.txt', io.BytesIO(b'hello world'), 11, content_type='text/plain')
+    stat = fs.stat_object('b', 'dir/a.txt')
+    assert stat.size == 11
+    assert stat.etag == result.etag == '5eb63bbbe01eeed093cb22bb8f5acdc3'
+    assert stat.content_type == 'text/plain'
+
+    response = fs.get_object('b', 'dir/a.txt', offset=6, length=3)
+    assert b''.join(response.stream(2)) == b'wor'
+    response.close()
+
+    fs.remove_object('b', 'dir/a.txt')
+    with pytest.raises(S3Error) as exc:
+        fs.stat_object('b', 'dir/a.txt')
+    assert exc.value.code == 'NoSuchKey'
+
+def test_filesystem_listing_groups_prefixes(fs):
+    """Test listings are sorted, honour start_after and group on '/'"""
+    long_key = 'deep/' + 'x' * 300
+    for key in ['a', 'b/1', 'b/2', 'c', '..', long_key]:
+        fs.put_object('b', key, b'1', 1)
+
+    listed = [(o.object_name, o.is_dir) for o in fs.list_objects('b')]
+    assert listed == [('..', False), ('a', False), ('b/', True), ('c', False), ('deep/', True)]
+    assert [o.object_name for o in fs.list_objects('b', prefix='b/', start_after='b/1')] == ['b/2']
+    assert [o.object_name for o in fs.list_objects('b', prefix='deep/', recursive=True)] == [long_key]
+
+    errors = list(fs.remove_objects('b', [DeleteObject('a'), DeleteObject(long_key)]))
+    assert errors == []
+    with pytest.raises(S3Error) as exc:
+        fs.remove_bucket('b')
+    assert exc.value.code == 'BucketNotEmpty'
+
+def test_filesystem_listing_reuses_keys_until_the_bucket_changes(fs, tmp_path, monkeypatch):
+    """Test a quiet bucket is listed without rereading its directory, and writes from another process show up"""
+    for key in ['a', 'b']:
+        fs.put_object('b', key, b'1', 1)
+    meta_dir = str(tmp_path / 'b' / 'meta')
+    quiet = os.stat(meta_dir).st_mtime_ns - 10 * 10**9
+    os.utime(meta_dir, ns=(quiet, quiet))
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+    assert [o.object_name for o in fs.list_objects('b')] == ['a', 'b']
+    assert [o.object_name for o in fs.list_objects('b')] == ['a', 'b']
+    assert len(scans) == 1
+
+    FilesystemBackend(str(tmp_path)).put_object('b', 'c', b'1', 1)
+    assert [o.object_name for o in fs.list_objects('b')] == ['a', 'b', 'c']
+
+def test_filesystem_copy_is_modified_when_copied(fs, tmp_path):
+    """Test a copy gets its own body file and last_modified instead of sharing the source's"""
+    fs.put_object('b', 'src', b'body', 4)
+    [body] = os.listdir(tmp_path / 'b' / 'data')
+    os.utime(tmp_path / 'b' / 'data' / body, (1577836800, 1577836800))
+
+    fs.copy_object('b', 'dst', CopySource('b', 'src'))
+
+    assert os.stat(tmp_path / 'b' / 'data' / body).st_nlink == 1
+    listed = {o.object_name: o.last_modified.timestamp() for o in fs.list_objects('b')}
+    assert listed['dst'] == fs.stat_object('b', 'dst').last_modified.timestamp() > listed['src']
+    assert fs.get_object('b', 'dst').read() == b'body'
+
+def test_filesystem_serves_each_body_with_its_own_etag(fs, tmp_path):
+    """Test concurrent PUTs to one key never pair one writer's body with another's ETag or size"""
+    bodies = [bytes([i]) * (1000 + i) for i in range(8)]
+    done = threading.Event()
+    mismatches = []
+
+    def write(body):
+        for _ in range(30):
+            fs.put_object('b', 'k', body, len(body))
+
+    def read():
+        while not done.is_set():
+            try:
+                response = fs.get_object('b', 'k')
+            except S3Error:
+                continue
+            body = bytes(response.read())
+            response.close()
+            stat = fs.stat_object('b', 'k')
+            if response.headers['ETag'].strip('"') != hashlib.md5(body).hexdigest():
+                mismatches.append(body[:1])
+            if stat.etag == hashlib.md5(body).hexdigest() and stat.size != len(body):
+                mismatches.append(body[:1])
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    writers = [threading.Thread(target=write, args=(body,)) for body in bodies]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert mismatches == []
+    stat = fs.stat_object('b', 'k')
+    assert fs.get_object('b', 'k').read() == bodies[stat.size - 1000]
+    # Every replaced body was removed
+    assert len(os.listdir(tmp_path / 'b' / 'data')) == 1
+
+def test_filesystem_multipart(fs):
+    """Test parts are assembled in order with an S3-style multipart ETag"""
+    upload_id = fs.create_multipart_upload('b', 'big', {'Content-Type': 'application/zip'})
+    etag2 = fs.upload_part('b', 'big', b'world', None, upload_id, 2)
+    etag1 = fs.upload_part('b', 'big', b'hello ', None, upload_id, 1)
+    assert [p.part_number for p in fs.list_parts('b', 'big', upload_id).parts] == [1, 2]
+
+    result = fs.complete_multipart_upload('b', 'big', upload_id, [Part(1, etag1), Part(2, etag2)])
+    assert result.etag.endswith('-2')
+    assert fs.get_object('b', 'big').read() == b'hello world'
+    assert fs.stat_object('b', 'big').content_type == 'application/zip'
+    with pytest.raises(S3Error) as exc:
+        fs.abort_multipart_upload('b', 'big', upload_id)
+    assert exc.value.code == 'NoSuchUpload'
+
+def test_api_runs_on_filesystem_backend(tmp_path, monkeypatch):
+    """Test the Flask API serves uploads and downloads without MinIO"""
+    monkeypatch.setattr(s3_client, 'backend', 'filesystem')
+    monkeypatch.setattr(s3_client, 'client', FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'stats', UsageStats(str(tmp_path / 'usage.sqlite3')))
+    monkeypatch.setattr(s3_client, 'breaker', CircuitBreaker())
+    monkeypatch.setattr(s3_client, 'cache', ObjectCache(max_body_bytes=0))
+
+    body = os.urandom(100_000)
+    with app.test_client() as client:
+        assert client.put('/api/v1/buckets/local/objects/x.bin', data=body).status_code == 200
+        response = client.get('/api/v1/buckets/local/objects/x.bin')
+        assert response.status_code == 200
+        assert response.data == body
+        partial = client.get('/api/v1/buckets/local/objects/x.bin', headers={'Range': 'bytes=10-19'})
+        assert partial.status_code == 206
+        assert partial.data == body[10:20]
+        listing = client.get('/api/v1/buckets/local/objects').get_json()
+        assert [o['name'] for o in listing['objects']] == ['x.bin']
+
+def test_memory_listing_uses_sorted_index():
+    """Test prefix listings skip whole common prefixes and resume after start_after"""
+    mem = MemoryBackend()
+    mem.make_bucket('b')
+    for key in ['a/1', 'a/2', 'a0', 'b', 'c/d/e']:
+        mem.put_object('b', key, key.encode(), -1)
+
+    assert [(o.object_name, o.is_dir) for o in mem.list_objects('b')] == [
+        ('a/', True), ('a0', False), ('b', False), ('c/', True)
+    ]
+    assert [o.object_name for o in mem.list_objects('b', prefix='a', recursive=True, start_after='a/1')] == ['a/2', 'a0']
+    mem.remove_object('b', 'a/1')
+    assert [o.object_name for o in mem.list_objects('b', prefix='a/')] == ['a/2']
+    assert mem.get_object('b', 'c/d/e', offset=2).read() == b'd/e'
+
+def test_memory_backend_keeps_buffers_and_injects_faults(memory_storage):
+    """Test immutable bodies are stored without copying and injected errors surface as 503s"""
+    memory_storage.make_bucket('b')
+    body = b'payload' * 100
+    memory_storage.put_object('b', 'k', body, len(body))
+    assert memory_storage._buckets['b'].objects['k'].data is body
+
+    memory_storage.fail_operations.add('stat_object')
+    with pytest.raises(ConnectionError):
+        memory_storage.stat_object('b', 'k')
+    with app.test_client() as client:
+        assert client.get('/api/v1/buckets/b/objects/k').status_code == 503
+
+@pytest.mark.parametrize('engine', ['filesystem', 'memory'])
+def test_copy_object_shares_body_and_keeps_metadata(engine, tmp_path):
+    """Test server-side copies keep the body, ETag and metadata, and survive source overwrites"""
+    backend = FilesystemBackend(str(tmp_path)) if engine == 'filesystem' else MemoryBackend()
+    backend.make_bucket('src')
+    backend.make_bucket('dst')
+    backend.put_object('src', 'a.json', b'{"a": 1}', 8, content_type='application/json',
+                       metadata={'X-Amz-Meta-Owner': 'ci'})
+
+    backend.copy_object('dst', 'copies/a.json', CopySource('src', 'a.json'))
+    backend.put_object('src', 'a.json', b'changed', 7)
+
+    stat = backend.stat_object('dst', 'copies/a.json')
+    assert (stat.size, stat.content_type, stat.metadata) == (8, 'application/json', {'X-Amz-Meta-Owner': 'ci'})
+    assert backend.get_object('dst', 'copies/a.json').read() == b'{"a": 1}'
+    with pytest.raises(S3Error) as e:
+        backend.copy_object('dst', 'x', CopySource('src', 'missing'))
+    assert e.value.code == 'NoSuchKey'
@@ -0,0 +1,123 @@
+import io
+import sys
+import os
+import logging
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app, s3_client, ObjectCache
+from storage import FilesystemBackend
+from tracing import SlowRequestProfiler, current_request_id, span, start_trace, end_trace
+
+app.config['TESTING'] = True
+
+def test_request_id_propagated_and_spans_reported(memory_storage):
+    """Test X-Request-ID is echoed, and Server-Timing breaks the request into spans"""
+    memory_storage.make_bucket('b')
+    with app.test_client() as client:
+        response = client.put('/api/v1/buckets/b/objects/k', data=b'abc', headers={'X-Request-ID': 'req-42'})
+        assert response.status_code == 200
+        assert response.headers['X-Request-ID'] == 'req-42'
+        timing = response.headers['Server-Timing']
+        assert 'validate;dur=' in timing
+        assert 'backend-upload_stream;dur=' in timing
+        assert 'serialize;dur=' in timing
+
+        # Unsafe IDs are replaced rather than written into the logs
+        response = client.get('/api/v1/buckets/b/objects', headers={'X-Request-ID': 'bad id; x=1'})
+        assert response.headers['X-Request-ID'] != 'bad id; x=1'
+        assert len(response.headers['X-Request-ID']) == 32
+
+def test_log_records_carry_request_id(memory_storage, monkeypatch, caplog):
+    """Test slow requests log their span breakdown tagged with the request ID"""
+    monkeypatch.setattr(app_module, 'TRACE_LOG_SLOW_MS', 0.001)
+    caplog.set_level(logging.WARNING, logger='app')
+    caplog.handler.addFilter(app_module.RequestIdFilter())
+    with app.test_client() as client:
+        client.get('/api/v1/buckets/', headers={'X-Request-ID': 'slow-1'}).close()
+
+    slow = [r for r in caplog.records if r.getMessage().startswith('Slow request GET /api/v1/buckets/')]
+    assert slow and slow[0].request_id == 'slow-1'
+    assert 'backend.list_buckets=' in slow[0].getMessage()
+    assert current_request_id() == '-'
+
+def test_span_is_noop_outside_a_request():
+    """Test spans cost nothing and record nothing without an active trace"""
+    with span('parse'):
+        pass
+    trace = start_trace('t')
+    try:
+        with span('parse'):
+            pass
+        assert list(trace.breakdown()) == ['parse']
+    finally:
+        end_trace()
+
+def test_sampling_profiler_keeps_only_slow_requests():
+    """Test only requests past the threshold are sampled and kept"""
+    profiler = SlowRequestProfiler(threshold_ms=20, interval=0.002)
+    fast, slow = start_trace('fast'), start_trace('slow')
+    end_trace()
+
+    def handle(trace, seconds):
+        profiler.begin(trace)
+        time.sleep(seconds)
+        profiler.finish(trace)
+
+    threads = [threading.Thread(target=handle, args=(fast, 0)), threading.Thread(target=handle, args=(slow, 0.1))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [p['request_id'] for p in profiler.profiles()] == ['slow']
+    profile = profiler.get('slow')
+    assert profile['samples'] > 0
+    assert any('handle' in s['stack'] for s in profile['stacks'])
+    assert profiler.get('fast') is None
+
+def test_admin_profiles_endpoint(memory_storage, monkeypatch):
+    """Test profiles are kept for slow requests and need the admin token"""
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(app_module, 'profiler', SlowRequestProfiler(threshold_ms=0, mode='cprofile'))
+    with app.test_client() as client:
+        client.get('/api/v1/stats/', headers={'X-Request-ID': 'prof-1'}).close()
+
+        assert client.get('/api/v1/admin/profiles').status_code == 403
+        assert client.get('/api/v1/admin/profiles', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+        listing = client.get('/api/v1/admin/profiles', headers={'X-Admin-Token': 'secret'}).get_json()
+        assert listing['enabled'] is True
+        assert 'prof-1' in [p['request_id'] for p in listing['profiles']]
+
+        profile = client.get('/api/v1/admin/profiles/prof-1', headers={'X-Admin-Token': 'secret'}).get_json()
+        assert profile['mode'] == 'cprofile'
+        assert 'function calls' in profile['stats']
+        missing = client.get('/api/v1/admin/profiles/nope', headers={'X-Admin-Token': 'secret'})
+        assert missing.status_code == 404
+
+def test_downloads_finish_their_profile(tmp_path, monkeypatch):
+    """Test whole, ranged and sendfile downloads close their trace once the body is sent"""
+    monkeypatch.setattr(s3_client, 'backend', 'filesystem')
+    monkeypatch.setattr(s3_client, 'client', FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(s3_client, 'connected', True)
+    monkeypatch.setattr(s3_client, 'cache', ObjectCache(max_body_bytes=1024))
+    s3_client.client.make_bucket('b')
+    s3_client.client.put_object('b', 'big', io.BytesIO(b'x' * 4096), 4096)
+    s3_client.client.put_object('b', 'small', io.BytesIO(b'y' * 100), 100)
+
+    client = app.test_client()
+    for mode in ('cprofile', 'sample'):
+        profiler = SlowRequestProfiler(threshold_ms=0, mode=mode, interval=0.001)
+        monkeypatch.setattr(app_module, 'profiler', profiler)
+        for name, headers in [('big', {}), ('small', {}), ('small', {'Range': 'bytes=0-9'})]:
+            request_id = f'{mode}-{name}-{len(headers)}'
+            response = client.get(f'/api/v1/buckets/b/objects/{name}', headers={'X-Request-ID': request_id, **headers})
+            assert response.status_code in (200, 206)
+            # Finished as soon as the body has been sent, not by the next request
+            assert not profiler._active
+            assert not profiler._profiling.locked()
+            if mode == 'cprofile':
+                assert profiler.get(request_id) is not None
@@ -0,0 +1,234 @@
+import cProfile
+import io
+import logging
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('trace', default=None)
+
+
+class Trace:
+    """Timing spans collected while handling one request."""
+
+    __slots__ = ('request_id', 'method', 'path', 'started', 'spans', 'profile')
+
+    def __init__(self, request_id, method='', path=''):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans = []
+        self.profile = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, name, duration):
+        self.spans.append((name, duration))
+
+    def breakdown(self):
+        """Total milliseconds per span name, in the order the spans first ran."""
+        totals = {}
+        for name, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def server_timing(self):
+        """The breakdown so far as a Server-Timing header value."""
+        parts = [f'{name.replace(".", "-")};dur={ms}' for name, ms in self.breakdown().items()]
+        parts.append(f'app;dur={round(self.elapsed() * 1000, 3)}')
+        return ', '.join(parts)
+
+
+def request_id_from(header):
+    """The client's X-Request-ID if it is safe to log, otherwise a fresh one."""
+    if header and REQUEST_ID_PATTERN.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def start_trace(request_id, method='', path=''):
+    trace = Trace(request_id, method, path)
+    _current.set(trace)
+    return trace
+
+
+def end_trace():
+    _current.set(None)
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace is not None else '-'
+
+
+def record_span(name, duration):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, duration)
+
+
+@contextmanager
+def span(name):
+    """Time the block as ``name`` in the current request's trace; free outside a request."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` to every record so the log format can include it."""
+
+    def filter(self, record):
+        record.request_id = current_request_id()
+        return True
+
+
+def _fold(frame):
+    """A frame's stack as 'outer;...;inner' for flame graph tools."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Keeps a profile of the most recent requests slower than ``threshold_ms``.
+
+    In ``sample`` mode a background thread samples the stack of each request
+    that has been running longer than the threshold every ``interval``
+    seconds, so fast requests pay only for registering themselves. In
+    ``cprofile`` mode every request runs under cProfile and the stats are
+    kept only for slow ones; this is exact but slows every request down, and
+    since cProfile can only be active in one thread at a time, requests that
+    overlap a profiled one are not profiled.
+    """
+
+    def __init__(self, threshold_ms, mode='sample', interval=0.005, keep=50):
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f'Unknown profiler mode: {mode}')
+        self.threshold = threshold_ms / 1000
+        self.mode = mode
+        self.interval = interval
+        self._profiles = deque(maxlen=keep)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        self._sampler = None
+
+    def begin(self, trace):
+        if self.mode == 'cprofile':
+            if self._profiling.acquire(blocking=False):
+                trace.profile = cProfile.Profile()
+                trace.profile.enable()
+            return
+        self._ensure_sampler()
+        with self._lock:
+            self._active[trace] = (threading.get_ident(), Counter())
+
+    def finish(self, trace):
+        elapsed = trace.elapsed()
+        if self.mode == 'cprofile':
+            profile, trace.profile = trace.profile, None
+            if profile is None:
+                return
+            profile.disable()
+            self._profiling.release()
+            if elapsed >= self.threshold:
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(40)
+                self._keep(trace, elapsed, {'stats': out.getvalue()})
+            return
+        with self._lock:
+            entry = self._active.pop(trace, None)
+        if entry is not None and elapsed >= self.threshold:
+            samples = entry[1]
+            self._keep(trace, elapsed, {
+                'interval_ms': self.interval * 1000,
+                'samples': sum(samples.values()),
+                'stacks': [{'stack': stack, 'count': count} for stack, count in samples.most_common()]
+            })
+
+    def _keep(self, trace, elapsed, data):
+        profile = {
+            'request_id': trace.request_id,
+            'method': trace.method,
+            'path': trace.path,
+            'duration_ms': round(elapsed * 1000, 3),
+            'captured_at': datetime.now(timezone.utc).isoformat(),
+            'mode': self.mode,
+            'spans': trace.breakdown(),
+            **data
+        }
+        with self._lock:
+            self._profiles.append(profile)
+
+    def profiles(self):
+        """Summaries of the kept profiles, newest first."""
+        with self._lock:
+            kept = list(self._profiles)
+        return [{k: p[k] for k in ('request_id', 'method', 'path', 'duration_ms', 'captured_at', 'mode')}
+                for p in reversed(kept)]
+
+    def get(self, request_id):
+        with self._lock:
+            for profile in reversed(self._profiles):
+                if profile['request_id'] == request_id:
+                    return profile
+        return None
+
+    # Sampling
+
+    def _ensure_sampler(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self._sampler is None or not self._sampler.is_alive():
+            with self._lock:
+                if self._sampler is None or not self._sampler.is_alive():
+                    self._sampler = threading.Thread(target=self._sample_loop, name='slow-request-sampler',
+                                                     daemon=True)
+                    self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Profiler sampling failed: {e}")
+
+    def sample(self):
+        """Record one stack sample of every request already past the threshold."""
+        with self._lock:
+            slow = [(ident, samples) for trace, (ident, samples) in self._active.items()
+                    if trace.elapsed() >= self.threshold]
+        if not slow:
+            return
+        frames = sys._current_frames()
+        for ident, samples in slow:
+            frame = frames.get(ident)
+            if frame is not None:
+                samples[_fold(frame)] += 1
@@ -0,0 +1,234 @@
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    objects INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+-- Writes made while a rescan is listing the backend, added to its result
+CREATE TABLE IF NOT EXISTS scan_deltas (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'changed',
+    objects INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+# Only while meta has scan_started
+SCANNING = "EXISTS (SELECT 1 FROM meta WHERE key = 'scan_started')"
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class UsageStats:
+    """Per-bucket object count and byte totals in one SQLite file under STATE_DIR.
+
+    Every worker adjusts the same totals on the writes it handles, so reading
+    them costs O(buckets) and all workers answer alike. A background rescan
+    reconciles them with a full listing; it runs in one process at a time
+    (an flock on ``<path>.lock``) and only once the last one is
+    ``rescan_interval`` old. Writes made during a rescan are added to its
+    result. Overwrites of existing keys are only corrected by the next rescan,
+    and a write the listing already saw counts twice until then.
+    """
+
+    def __init__(self, path, rescan_interval=300):
+        self.path = path
+        self.rescan_interval = rescan_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._requested_at = None
+        self._thread = None
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        # A connection must not be shared with a forked child
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (time.time(),))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _meta(self, db, key):
+        row = db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def record_bucket_created(self, bucket_name):
+        with self._transaction() as db:
+            db.execute('INSERT OR IGNORE INTO buckets (name) VALUES (?)', (bucket_name,))
+            db.execute(f"INSERT INTO scan_deltas (name, state) SELECT ?, 'created' WHERE {SCANNING} "
+                       "ON CONFLICT (name) DO UPDATE SET state = 'created', objects = 0, bytes = 0 "
+                       "WHERE state = 'deleted'", (bucket_name,))
+
+    def record_bucket_deleted(self, bucket_name):
+        with self._transaction() as db:
+            db.execute('DELETE FROM buckets WHERE name = ?', (bucket_name,))
+            db.execute(f"INSERT INTO scan_deltas (name, state) SELECT ?, 'deleted' WHERE {SCANNING} "
+                       "ON CONFLICT (name) DO UPDATE SET state = 'deleted', objects = 0, bytes = 0",
+                       (bucket_name,))
+
+    def record_upload(self, bucket_name, size):
+        with self._transaction() as db:
+            db.execute('INSERT INTO buckets (name, objects, bytes) VALUES (?, 1, ?) ON CONFLICT (name) DO UPDATE '
+                       'SET objects = objects + 1, bytes = bytes + excluded.bytes', (bucket_name, size or 0))
+            self._record_delta(db, bucket_name, 1, size or 0)
+
+    def record_delete(self, bucket_name, size):
+        with self._transaction() as db:
+            updated = db.execute('UPDATE buckets SET objects = MAX(objects - 1, 0), bytes = MAX(bytes - ?, 0) '
+                                 'WHERE name = ?', (size or 0, bucket_name)).rowcount
+            if updated:
+                self._record_delta(db, bucket_name, -1, -(size or 0))
+
+    def _record_delta(self, db, bucket_name, objects, size):
+        db.execute(f'INSERT INTO scan_deltas (name, objects, bytes) SELECT ?, ?, ? WHERE {SCANNING} '
+                   'ON CONFLICT (name) DO UPDATE SET objects = objects + excluded.objects, '
+                   'bytes = bytes + excluded.bytes', (bucket_name, objects, size))
+
+    def begin_scan(self):
+        """Start recording the writes that the coming listing may miss."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM scan_deltas')
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_started', ?)", (time.time(),))
+
+    def replace(self, buckets):
+        """Install totals from a full rescan: {bucket: {'objects': n, 'bytes': n}}.
+
+        Writes recorded since begin_scan() are applied on top.
+        """
+        with self._transaction() as db:
+            totals = {name: dict(t) for name, t in buckets.items()}
+            for name, state, objects, size in db.execute('SELECT name, state, objects, bytes FROM scan_deltas'):
+                if state == 'deleted':
+                    totals.pop(name, None)
+                    continue
+                base = totals.get(name) if state != 'created' else None
+                base = base or {'objects': 0, 'bytes': 0}
+                totals[name] = {'objects': max(base['objects'] + objects, 0), 'bytes': max(base['bytes'] + size, 0)}
+            db.execute('DELETE FROM buckets')
+            db.executemany('INSERT INTO buckets (name, objects, bytes) VALUES (?, ?, ?)',
+                           [(name, t['objects'], t['bytes']) for name, t in totals.items()])
+            db.execute('DELETE FROM scan_deltas')
+            db.execute("DELETE FROM meta WHERE key = 'scan_started'")
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('snapshot_at', ?)", (time.time(),))
+
+    @contextmanager
+    def _scan_lock(self, wait):
+        with open(self.path + '.lock', 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def rescan(self, scan, wait=False, newer_than=None):
+        """Replace the totals with ``scan()`` if no other process is rescanning.
+
+        Returns the scanned totals, or None when the rescan was skipped: another
+        process holds the lock (and ``wait`` is false), or the totals were
+        already rescanned after ``newer_than``.
+        """
+        with self._scan_lock(wait) as locked:
+            if not locked:
+                return None
+            snapshot_at = self._meta(self._db(), 'snapshot_at')
+            if newer_than is not None and snapshot_at is not None and snapshot_at >= newer_than:
+                return None
+            self.begin_scan()
+            try:
+                buckets = scan()
+            except BaseException:
+                with self._transaction() as db:
+                    db.execute('DELETE FROM scan_deltas')
+                    db.execute("DELETE FROM meta WHERE key = 'scan_started'")
+                raise
+            self.replace(buckets)
+            return buckets
+
+    def request_rescan(self):
+        self._requested_at = time.time()
+        self._wakeup.set()
+
+    def start(self, scan):
+        """Start the background reconciler (once per process) calling ``scan()``."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(scan,), name='usage-stats', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, scan):
+        # The backend connects after this thread starts, and connecting asks for the first rescan
+        timeout = self.rescan_interval
+        while True:
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            requested_at, self._requested_at = self._requested_at, None
+            # Unless a rescan was asked for, skip it when another worker did one recently
+            newer_than = requested_at or time.time() - self.rescan_interval
+            try:
+                self.rescan(scan, newer_than=newer_than)
+            except Exception as e:
+                logger.error(f"Error rescanning usage stats: {e}")
+            snapshot_at = self._meta(self._db(), 'snapshot_at') or time.time()
+            timeout = max(snapshot_at + self.rescan_interval - time.time(), 1)
+
+    def snapshot(self):
+        db = self._db()
+        buckets = {name: {'objects': objects, 'bytes': size}
+                   for name, objects, size in db.execute('SELECT name, objects, bytes FROM buckets ORDER BY name')}
+        snapshot_at = self._meta(db, 'snapshot_at')
+        updated_at = self._meta(db, 'updated_at')
+
+        now = time.time()
+        return {
+            'buckets': len(buckets),
+            'objects': sum(t['objects'] for t in buckets.values()),
+            'storage_used_bytes': sum(t['bytes'] for t in buckets.values()),
+            'per_bucket': buckets,
+            'snapshot_at': _isoformat(snapshot_at),
+            'snapshot_age_seconds': round(now - snapshot_at, 3) if snapshot_at else None,
+            'updated_at': _isoformat(updated_at),
+        }